@@ -0,0 +1,237 @@
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import random
+import time
+from collections.abc import Iterator
+from pathlib import Path
+
+import main
+
+RESERVOIR_SIZE = 10000
+PROGRESS_INTERVAL = 10.0
+CHECKPOINT_EVERY = 100
+RECORD_FIELDS = ("name", "goal", "reading_mode")
+
+
+def read_records(path: Path) -> Iterator[dict]:
+    with path.open(encoding="utf-8", newline="") as handle:
+        if path.suffix.lower() == ".csv":
+            yield from csv.DictReader(handle)
+            return
+        for line in handle:
+            if line.strip():
+                yield json.loads(line)
+
+
+def build_prompt(record: dict) -> main.Prompt:
+    data = _birth_data(record.get("text") or "", record)
+    partner_text = record.get("partner_text")
+    if partner_text:
+        return main._build_compatibility_prompt(data, _birth_data(partner_text, {}))
+    return main._build_prompt(data)
+
+
+def _birth_data(text: str, record: dict) -> dict:
+    data = main._extract_birth_data(text)
+    if not data["date"]:
+        raise ValueError(f"no birth date in {text!r}")
+    for field in RECORD_FIELDS:
+        if record.get(field):
+            data[field] = record[field]
+    return data
+
+
+class LatencySample:
+    def __init__(self, size: int = RESERVOIR_SIZE) -> None:
+        self.size = size
+        self.count = 0
+        self.values: list[float] = []
+        self._random = random.Random(0)
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        if len(self.values) < self.size:
+            self.values.append(value)
+            return
+        slot = self._random.randrange(self.count)
+        if slot < self.size:
+            self.values[slot] = value
+
+    def percentile(self, fraction: float) -> float:
+        if not self.values:
+            return 0.0
+        ordered = sorted(self.values)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Checkpoint:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.next_index = 0
+        self.done: set[int] = set()
+
+    def load(self, output_path: Path) -> None:
+        if self.path.exists():
+            self.next_index = json.loads(self.path.read_text(encoding="utf-8"))["next_index"]
+        if output_path.exists():
+            with output_path.open(encoding="utf-8") as handle:
+                for line in handle:
+                    if line.strip():
+                        result = json.loads(line)
+                        # Failed records stay in the output for the record but are queued again.
+                        if result["status"] == "ok":
+                            self.mark(result["index"])
+
+    def should_skip(self, index: int) -> bool:
+        return index < self.next_index or index in self.done
+
+    def mark(self, index: int) -> None:
+        if index < self.next_index:
+            return
+        self.done.add(index)
+        while self.next_index in self.done:
+            self.done.remove(self.next_index)
+            self.next_index += 1
+
+    def save(self) -> None:
+        temporary = self.path.with_name(self.path.name + ".tmp")
+        temporary.write_text(json.dumps({"next_index": self.next_index}), encoding="utf-8")
+        os.replace(temporary, self.path)
+
+
+class BatchRunner:
+    def __init__(self, input_path: Path, output_path: Path, checkpoint_path: Path, concurrency: int) -> None:
+        self.input_path = input_path
+        self.output_path = output_path
+        self.checkpoint = Checkpoint(checkpoint_path)
+        self.concurrency = concurrency
+        self.latency = LatencySample()
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+        self.started = 0.0
+
+    async def run(self) -> dict:
+        self.checkpoint.load(self.output_path)
+        self.started = time.monotonic()
+        pending: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        results: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        writer = asyncio.create_task(self._write(results))
+        workers = [asyncio.create_task(self._work(pending, results)) for _ in range(self.concurrency)]
+        try:
+            for index, record in enumerate(read_records(self.input_path)):
+                if self.checkpoint.should_skip(index):
+                    self.skipped += 1
+                    continue
+                await pending.put((index, record))
+            for _ in workers:
+                await pending.put(None)
+            await asyncio.gather(*workers)
+            await results.put(None)
+            await writer
+        finally:
+            for task in (*workers, writer):
+                task.cancel()
+            self.checkpoint.save()
+        return self.stats()
+
+    async def _work(self, pending: asyncio.Queue, results: asyncio.Queue) -> None:
+        while True:
+            item = await pending.get()
+            if item is None:
+                return
+            index, record = item
+            started = time.perf_counter()
+            result = {"index": index, "id": record.get("id")}
+            try:
+                result["reading"] = await main._call_openai(build_prompt(record))
+                result["status"] = "ok"
+            except Exception as exc:
+                result["status"] = "error"
+                result["error"] = f"{type(exc).__name__}: {exc}"
+            result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            await results.put(result)
+
+    async def _write(self, results: asyncio.Queue) -> None:
+        last_report = time.monotonic()
+        with self.output_path.open("a", encoding="utf-8") as handle:
+            while True:
+                result = await results.get()
+                if result is None:
+                    return
+                handle.write(json.dumps(result, ensure_ascii=False) + "\n")
+                handle.flush()
+                if result["status"] == "ok":
+                    self.checkpoint.mark(result["index"])
+                    self.succeeded += 1
+                    self.latency.add(result["latency_ms"])
+                else:
+                    self.failed += 1
+                    logging.warning("Record %s failed: %s", result["index"], result["error"])
+                if (self.succeeded + self.failed) % CHECKPOINT_EVERY == 0:
+                    self.checkpoint.save()
+                if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                    last_report = time.monotonic()
+                    logging.info("Batch progress: %s", self.stats())
+
+    def stats(self) -> dict:
+        elapsed = time.monotonic() - self.started
+        processed = self.succeeded + self.failed
+        return {
+            "processed": processed,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "elapsed_s": round(elapsed, 1),
+            "per_second": round(processed / elapsed, 2) if elapsed else 0.0,
+            "latency_p50_ms": self.latency.percentile(0.5),
+            "latency_p90_ms": self.latency.percentile(0.9),
+            "latency_p99_ms": self.latency.percentile(0.99),
+        }
+
+
+async def run_batch(args: argparse.Namespace) -> dict:
+    output_path = Path(args.output)
+    checkpoint_path = Path(args.checkpoint or f"{args.output}.checkpoint")
+    if args.restart:
+        output_path.unlink(missing_ok=True)
+        checkpoint_path.unlink(missing_ok=True)
+    main._openai_client = main._create_openai_client()
+    main._llm_slots = asyncio.Semaphore(args.concurrency)
+    runner = BatchRunner(Path(args.input), output_path, checkpoint_path, args.concurrency)
+    try:
+        return await runner.run()
+    finally:
+        await main._close_openai_clients()
+        logging.info("LLM cache stats: %s", main._reading_cache.stats())
+        logging.info("Prompt token stats: %s", main._prompt_stats.stats())
+        logging.info("Model routing stats: %s", main._router.stats())
+        main._reading_cache.close()
+
+
+def cli() -> None:
+    parser = argparse.ArgumentParser(description="Generate readings for a file of birth records")
+    parser.add_argument("input", help="CSV or JSONL with a `text` column, optional id/name/goal/reading_mode/partner_text")
+    parser.add_argument("output", help="JSONL file to append results to")
+    parser.add_argument("--concurrency", type=int, default=main.LLM_MAX_CONCURRENCY)
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument("--restart", action="store_true", help="ignore previous progress and start over")
+    args = parser.parse_args()
+    if not os.environ.get("OPENAI_API_KEY"):
+        raise SystemExit("OPENAI_API_KEY is not set")
+    try:
+        stats = asyncio.run(run_batch(args))
+    except KeyboardInterrupt:
+        logging.warning("Interrupted; rerun the same command to resume from the checkpoint")
+        raise SystemExit(130)
+    print(json.dumps(stats, ensure_ascii=False))
+    if stats["failed"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,84 @@
+import argparse
+import datetime
+import time
+
+import numpy as np
+
+from ephemeris import BODIES, compute_charts, day_number, longitudes, natal_chart
+from synastry import score_pairs
+from transits import TransitTable, find_windows, natal_points
+
+# Geocentric ecliptic longitudes of date for 2000-01-01 12:00 UT (mean node), rounded to 0.01°.
+REFERENCE = {
+    "sun": 280.37,
+    "moon": 223.32,
+    "mercury": 271.89,
+    "venus": 241.57,
+    "mars": 327.96,
+    "jupiter": 25.25,
+    "saturn": 40.40,
+    "uranus": 314.81,
+    "neptune": 303.19,
+    "pluto": 251.45,
+    "node": 125.04,
+}
+TOLERANCE = 0.1
+
+
+def check() -> int:
+    moment = datetime.datetime(2000, 1, 1, 12, tzinfo=datetime.timezone.utc)
+    values = longitudes(day_number(moment))
+    failures = 0
+    for body, expected in REFERENCE.items():
+        error = abs((values[BODIES.index(body)] - expected + 180.0) % 360.0 - 180.0)
+        if error > TOLERANCE:
+            failures += 1
+            print(f"{body}: {values[BODIES.index(body)]:.2f} != {expected:.2f}")
+    print(f"reference check: {len(REFERENCE) - failures}/{len(REFERENCE)} bodies within {TOLERANCE}°")
+    return failures
+
+
+def run(size: int, seed: int) -> int:
+    failures = check()
+    rng = np.random.default_rng(seed)
+    days = rng.uniform(-25000.0, 9000.0, size)
+    lats = rng.uniform(-60.0, 70.0, size)
+    lons = rng.uniform(-180.0, 180.0, size)
+    started = time.perf_counter()
+    compute_charts(days, lats, lons)
+    batch = size / (time.perf_counter() - started)
+    single_size = min(size, 500)
+    started = time.perf_counter()
+    for index in range(single_size):
+        natal_chart(datetime.date(1991, 7, 12), "14:25", "Europe/Moscow", float(lats[index]), float(lons[index]))
+    single = single_size / (time.perf_counter() - started)
+    primary = longitudes(days)
+    partner = longitudes(rng.permutation(days))
+    started = time.perf_counter()
+    score_pairs(primary, partner)
+    pairs = size / (time.perf_counter() - started)
+    started = time.perf_counter()
+    table = TransitTable(datetime.date(2026, 1, 1))
+    table_ms = (time.perf_counter() - started) * 1000
+    charts = [
+        natal_chart(datetime.date(1991, 7, 12), "14:25", "Europe/Moscow", float(lats[index]), float(lons[index]))
+        for index in range(single_size)
+    ]
+    started = time.perf_counter()
+    for chart in charts:
+        find_windows(table, natal_points(chart))
+    searches = single_size / (time.perf_counter() - started)
+    print(f"one chart per call  {single:>12,.0f} charts/s")
+    print(f"vectorized batch    {batch:>12,.0f} charts/s")
+    print(f"synastry scoring    {pairs:>12,.0f} pairs/s")
+    print(f"transit table       {table_ms:>12,.1f} ms/day")
+    print(f"transit search      {searches:>12,.0f} charts/s")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ephemeris accuracy check, chart, synastry and transit throughput")
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    raise SystemExit(1 if run(args.size, args.seed) else 0)
@@ -0,0 +1,58 @@
+import argparse
+import time
+
+from gazetteer import Gazetteer
+
+QUERIES = (
+    ("Москва", "Москва"),
+    ("москва,", "Москва"),
+    ("г. Москва", "Москва"),
+    ("Moscow, Russia", "Москва"),
+    ("Масква", "Москва"),
+    ("спб", "Санкт-Петербург"),
+    ("Санкт Петербург", "Санкт-Петербург"),
+    ("Sankt-Peterburg", "Санкт-Петербург"),
+    ("Екатеринбур", "Екатеринбург"),
+    ("Нью Йорк", "Нью-Йорк"),
+    ("Алма-Ата", "Алматы"),
+    ("Kyiv, Ukraine", "Киев"),
+    ("Иркуцк", "Иркутск"),
+    ("Кроснодар", "Краснодар"),
+    ("Урюпинск", None),
+    ("Россия", None),
+)
+# Misspellings are only suggested back to the user; a different city with a similar name must not be taken.
+FUZZY_ONLY = ("Масква", "Кроснодар", "Нижний Тагил", "Paris, Texas", "Москва Россия", "Екатеринбур", "Лос", "Ростов")
+
+
+def run(iterations: int) -> int:
+    started = time.perf_counter()
+    gazetteer = Gazetteer()
+    count = len(gazetteer)
+    print(f"loaded {count} places in {(time.perf_counter() - started) * 1000:.1f} ms")
+    failures = 0
+    for query, expected in QUERIES:
+        place = gazetteer.lookup(query) or gazetteer.suggest(query)
+        name = place.name if place else None
+        if name != expected:
+            failures += 1
+            print(f"mismatch for {query!r}: {name!r} != {expected!r}")
+    for query in FUZZY_ONLY:
+        place = gazetteer.lookup(query)
+        if place is not None:
+            failures += 1
+            print(f"{query!r} was resolved to {place.label!r} without confirmation")
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for query, _ in QUERIES:
+            gazetteer.lookup(query) or gazetteer.suggest(query)
+    elapsed = time.perf_counter() - started
+    lookups = iterations * len(QUERIES)
+    print(f"{lookups:,} lookups, {elapsed / lookups * 1e6:.1f} µs per lookup")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gazetteer lookup latency and accuracy")
+    parser.add_argument("--iterations", type=int, default=2000)
+    raise SystemExit(1 if run(parser.parse_args().iterations) else 0)
@@ -0,0 +1,188 @@
+import argparse
+import random
+import re
+import time
+from datetime import datetime
+
+from birth_parser import parse_birth_data
+
+LEGACY_DATE_RE = re.compile(r"(\d{1,2})[./-](\d{1,2})[./-](\d{4})")
+LEGACY_TIME_RE = re.compile(r"\b(\d{1,2}):(\d{2})\b")
+LEGACY_TIME_HINT_RE = re.compile(r"\b(утро|день|вечер|ночь|примерно|±)\b", re.IGNORECASE)
+NEW_FORMAT_RE = re.compile(
+    r"\d{4}-\d{1,2}-\d{1,2}|[ap]\.?m|января|февраля|марта|апреля|мая|июня|июля|августа"
+    r"|сентября|октября|ноября|декабря|утр|день|днём|днем|вечер|ноч|около|±",
+    re.IGNORECASE,
+)
+PLACES = (
+    "Москва", "Санкт-Петербург", "Казань", "Нижний Новгород", "Ростов-на-Дону",
+    "Москва, Россия", "г. Тверь", "Алматы", "Минск", "New York", "", "Екатеринбург",
+)
+MONTH_NAMES = ("января", "февраля", "марта", "апреля", "мая", "июня", "июля", "августа",
+               "сентября", "октября", "ноября", "декабря")
+
+
+def legacy_extract(text: str) -> dict:
+    date_match = LEGACY_DATE_RE.search(text)
+    time_match = LEGACY_TIME_RE.search(text)
+    date_value = None
+    time_value = None
+    time_mode = "unknown"
+    if date_match:
+        day, month, year = map(int, date_match.groups())
+        try:
+            date_value = datetime(year, month, day).date()
+        except ValueError:
+            date_value = None
+    if time_match:
+        hour, minute = map(int, time_match.groups())
+        if 0 <= hour < 24 and 0 <= minute < 60:
+            time_value = f"{hour:02d}:{minute:02d}"
+            time_mode = "exact"
+    elif LEGACY_TIME_HINT_RE.search(text):
+        time_mode = "approx"
+    elif "не знаю" in text.lower():
+        time_mode = "no_time"
+    cleaned = LEGACY_DATE_RE.sub("", text)
+    cleaned = LEGACY_TIME_RE.sub("", cleaned)
+    cleaned = cleaned.replace("не знаю", "").replace("примерно", "")
+    cleaned = cleaned.strip(" ,.-")
+    return {"date": date_value, "time": time_value, "place": cleaned or None, "time_mode": time_mode}
+
+
+def legacy_corpus(rng: random.Random, size: int) -> list[str]:
+    corpus = []
+    for _ in range(size):
+        parts = [
+            f"{rng.randint(1, 31):02d}{rng.choice('./-')}{rng.randint(1, 12):02d}"
+            f"{rng.choice('./-')}{rng.randint(1930, 2020)}"
+        ]
+        roll = rng.random()
+        if roll < 0.6:
+            parts.append(f"{rng.randint(0, 25)}:{rng.randint(0, 61):02d}")
+        elif roll < 0.8:
+            parts.append("не знаю")
+        elif roll < 0.9:
+            parts.append("примерно")
+        parts.append(rng.choice(PLACES))
+        rng.shuffle(parts)
+        corpus.append(rng.choice((" ", ", ", "  ")).join(parts))
+    return corpus
+
+
+def extended_corpus(rng: random.Random, size: int) -> list[tuple[str, dict]]:
+    corpus = []
+    for _ in range(size):
+        day = rng.randint(1, 28)
+        month = rng.randint(1, 12)
+        year = rng.randint(1930, 2020)
+        hour = rng.randint(1, 12)
+        minute = rng.randint(0, 59)
+        meridiem = rng.choice(("am", "pm", "AM", "p.m."))
+        date_text = rng.choice((
+            f"{year}-{month:02d}-{day:02d}",
+            f"{day} {MONTH_NAMES[month - 1]} {year}",
+            f"{day} {MONTH_NAMES[month - 1]} {year} г.",
+        ))
+        hour_24 = hour % 12 + (12 if meridiem.lower().startswith("p") else 0)
+        place = rng.choice(PLACES[:6])
+        text = f"{date_text} {hour}:{minute:02d} {meridiem} {place}"
+        expected = {
+            "date": datetime(year, month, day).date(),
+            "time": f"{hour_24:02d}:{minute:02d}",
+            "place": place,
+            "time_mode": "exact",
+        }
+        corpus.append((text, expected))
+    return corpus
+
+
+def fuzz_inputs(rng: random.Random, size: int) -> list[str]:
+    symbols = list("0123456789.:-,")
+    words = [" Москва ", " не знаю ", " примерно ", " 12.07.1991 ", " 14:25 ", " "]
+    return [
+        "".join(rng.choice(symbols if rng.random() < 0.8 else words) for _ in range(rng.randint(0, 24)))
+        for _ in range(size)
+    ]
+
+
+def comparable(text: str) -> bool:
+    # The legacy parser knows neither the new formats nor what to do with a time inside a date.
+    return not NEW_FORMAT_RE.search(text) and not _overlapping(text)
+
+
+def _overlapping(text: str) -> bool:
+    spans = [match.span() for match in LEGACY_DATE_RE.finditer(text)]
+    spans += [match.span() for match in LEGACY_TIME_RE.finditer(text)]
+    spans.sort()
+    if LEGACY_TIME_RE.findall(LEGACY_DATE_RE.sub("", text)) != LEGACY_TIME_RE.findall(text):
+        return True
+    return any(start < previous_end for (_, previous_end), (start, _) in zip(spans, spans[1:]))
+
+
+def _normalize_place(place: str | None) -> str | None:
+    if place is None:
+        return None
+    return re.sub(r"\s+", " ", place).strip(" ,.-") or None
+
+
+def compare(text: str) -> list[str]:
+    legacy = legacy_extract(text)
+    current = parse_birth_data(text).as_dict()
+    problems = []
+    for field in ("date", "time", "time_mode"):
+        if legacy[field] != current[field]:
+            problems.append(f"{field}: {legacy[field]!r} != {current[field]!r}")
+    if _normalize_place(legacy["place"]) != current["place"]:
+        problems.append(f"place: {legacy['place']!r} != {current['place']!r}")
+    return problems
+
+
+def check(rng: random.Random, size: int) -> int:
+    failures = 0
+    checked = 0
+    for text in legacy_corpus(rng, size) + fuzz_inputs(rng, size):
+        if not comparable(text):
+            continue
+        checked += 1
+        problems = compare(text)
+        if problems:
+            failures += 1
+            if failures <= 10:
+                print(f"mismatch for {text!r}: {'; '.join(problems)}")
+    for text, expected in extended_corpus(rng, size):
+        checked += 1
+        current = parse_birth_data(text).as_dict()
+        if current != expected:
+            failures += 1
+            if failures <= 10:
+                print(f"extended format {text!r}: {current!r} != {expected!r}")
+    print(f"fuzz: {checked} inputs checked, {failures} mismatches")
+    return failures
+
+
+def _rate(parse, corpus: list[str]) -> float:
+    started = time.perf_counter()
+    for text in corpus:
+        parse(text)
+    return len(corpus) / (time.perf_counter() - started)
+
+
+def run(size: int, seed: int) -> int:
+    rng = random.Random(seed)
+    failures = check(rng, size)
+    corpus = legacy_corpus(rng, size)
+    legacy_rate = _rate(legacy_extract, corpus)
+    current_rate = _rate(parse_birth_data, corpus)
+    print(f"legacy parser   {legacy_rate:>12,.0f} messages/s")
+    print(f"single pass     {current_rate:>12,.0f} messages/s")
+    print(f"speedup: x{current_rate / legacy_rate:.2f}")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Birth data parser benchmark and fuzz check")
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    raise SystemExit(1 if run(args.size, args.seed) else 0)
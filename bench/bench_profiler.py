@@ -0,0 +1,109 @@
+import argparse
+import asyncio
+import contextlib
+import glob
+import io
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import defaultdict
+
+import main
+from bench import loadtest
+from history_log import HistoryWriter
+from llm_cache import ReadingCache
+from profiler import UpdateProfiler
+
+PHASES = ("parse", "prompt", "llm", "telegram")
+
+
+def _loadtest_args(users: int) -> argparse.Namespace:
+    return argparse.Namespace(
+        users=users, concurrency=users, think=0.0, step_timeout=60.0, same_data=False, rate_limits=False,
+        no_streaming=False, tg_latency=0.01, tg_jitter=0.01, llm_latency=0.2, llm_jitter=0.1,
+        llm_error_rate=0.0, llm_slow_rate=0.0, llm_slow_latency=0.0, token_latency=0.002, words=120,
+    )
+
+
+async def _flows(users: int) -> float:
+    # Every run replays the same users, so start from an empty reading cache.
+    main._reading_cache = ReadingCache(max_entries=main.LLM_CACHE_SIZE)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        timeouts = await loadtest.run(_loadtest_args(users))
+    if timeouts:
+        raise RuntimeError(f"{timeouts} load test steps timed out")
+    return time.perf_counter() - started
+
+
+def _read(directory: str, pattern: str) -> list[str]:
+    lines = []
+    for path in glob.glob(os.path.join(directory, pattern)):
+        with open(path, encoding="utf-8") as source:
+            lines.extend(line.rstrip("\n") for line in source)
+    return lines
+
+
+def check(directory: str, sampled: int) -> list[str]:
+    failures = []
+    updates = [json.loads(line) for line in _read(directory, "updates-*.jsonl")]
+    wall = _read(directory, "wall-*.folded")
+    cpu = _read(directory, "cpu-*.folded")
+    if len(updates) != sampled:
+        failures.append(f"{sampled} updates sampled, {len(updates)} summaries written")
+    for line in wall + cpu:
+        stack, _, count = line.rpartition(" ")
+        if not stack or not count.isdigit():
+            failures.append(f"malformed collapsed stack line {line[:80]!r}")
+            break
+    totals: dict[str, dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for update in updates:
+        phase_wall = sum(entry["wall_s"] for entry in update["phases"].values())
+        if abs(phase_wall - update["wall_s"]) > 1e-3:
+            failures.append(f"update {update['update_id']}: phases add up to {phase_wall:.4f} s of {update['wall_s']:.4f} s")
+        for name, entry in update["phases"].items():
+            for key, value in entry.items():
+                totals[name][key] += value
+    for phase in PHASES:
+        if phase not in totals:
+            failures.append(f"phase {phase} never recorded")
+    if not any("natal" in line.split(";", 1)[0] for line in wall):
+        failures.append("reading mode missing from the stack roots")
+    if not any("(main.py)" in line for line in cpu):
+        failures.append("no CPU sample reached bot code")
+    print(f"{len(updates)} updates profiled, {len(wall)} wall and {len(cpu)} cpu stack lines")
+    print(f"{'phase':<10} {'wall s':>9} {'cpu s':>8}")
+    for name, entry in sorted(totals.items(), key=lambda item: -item[1]["wall_s"]):
+        print(f"{name:<10} {entry['wall_s']:9.3f} {entry['cpu_s']:8.3f}")
+    return failures
+
+
+async def run(users: int, interval: float, keep: str | None) -> int:
+    with tempfile.TemporaryDirectory() as directory:
+        directory = keep or directory
+        main._profiler = UpdateProfiler(0.0, directory, interval)
+        await _flows(users)
+        baseline = await _flows(users)
+        main._profiler = UpdateProfiler(1.0, directory, interval)
+        profiled = await _flows(users)
+        failures = check(directory, main._profiler.sampled)
+    print(f"{users} flows: {baseline:.2f} s unprofiled, {profiled:.2f} s with every update profiled")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return len(failures)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Update profiler: phase split and collapsed-stack output self-check")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.005)
+    parser.add_argument("--keep", help="write the profiles to this directory instead of a temporary one")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as history:
+        main._history_writer.close()
+        main._history_writer = HistoryWriter(os.path.join(history, "history.log"))
+        failures = asyncio.run(run(args.users, args.interval, args.keep))
+    raise SystemExit(1 if failures else 0)
@@ -0,0 +1,123 @@
+import argparse
+import asyncio
+import logging
+import random
+import time
+from datetime import date
+
+import main
+from bench.fake_openai import FakeOpenAI
+from llm_cache import ReadingCache
+from prompts import MESSAGE_OVERHEAD, TokenCounter
+
+CITIES = ("Москва", "Казань", "Новосибирск", "Минск", "Алматы", "Санкт-Петербург", "Тбилиси", "Берлин")
+GOALS = ("отношения", "карьера", "сильные периоды", "деньги", None)
+# How far the word-based fallback may undercount tiktoken before budgets stop meaning anything.
+HEURISTIC_TOLERANCE = 0.15
+
+
+def _records(count: int, seed: int) -> list[dict]:
+    rng = random.Random(seed)
+    records = []
+    for _ in range(count):
+        day = date(rng.randint(1950, 2005), rng.randint(1, 12), rng.randint(1, 28))
+        clock = f" {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}" if rng.random() < 0.7 else ""
+        data = main._extract_birth_data(f"{day:%d.%m.%Y}{clock} {rng.choice(CITIES)}")
+        data["goal"] = rng.choice(GOALS)
+        data["name"] = rng.choice(("Алина", "Игорь", None))
+        records.append(data)
+    return records
+
+
+def _prompts(records: list[dict]) -> dict[str, tuple[list, float]]:
+    builders = {
+        "passport": lambda index: main._build_passport_prompt(records[index]),
+        "natal_v2": lambda index: main._build_natal_v2_prompt(records[index]),
+        "compatibility": lambda index: main._build_compatibility_prompt(
+            records[index], records[(index + 1) % len(records)],
+        ),
+    }
+    result = {}
+    for mode, build in builders.items():
+        started = time.perf_counter()
+        prompts = [build(index) for index in range(len(records))]
+        result[mode] = (prompts, (time.perf_counter() - started) / len(records) * 1e6)
+    return result
+
+
+def _heuristic_check(records: list[dict]) -> list[str]:
+    counter = main._token_counter
+    main._token_counter = TokenCounter(main.OPENAI_MODEL, use_tiktoken=False)
+    try:
+        built = _prompts(records)
+    finally:
+        main._token_counter = counter
+    failures = []
+    for mode, (prompts, _) in built.items():
+        budget = main.LLM_INPUT_BUDGETS[mode]
+        over = sum(prompt.input_tokens > budget for prompt in prompts)
+        if over:
+            failures.append(f"{mode}: {over} prompts over the {budget} token budget with the heuristic counter")
+        if counter.backend != "tiktoken":
+            continue
+        estimated = sum(prompt.input_tokens for prompt in prompts)
+        exact = sum(
+            counter.count(prompt.system) + counter.count(prompt.user) + 2 * MESSAGE_OVERHEAD for prompt in prompts
+        )
+        print(f"{mode:<14} heuristic/tiktoken {estimated / exact:.2f}")
+        if estimated < exact * (1 - HEURISTIC_TOLERANCE):
+            failures.append(f"{mode}: heuristic counts {estimated} tokens where tiktoken counts {exact}")
+    return failures
+
+
+async def _latency(prompts: list) -> list[float]:
+    samples = []
+    for prompt in prompts:
+        started = time.perf_counter()
+        await main._call_openai(prompt)
+        samples.append((time.perf_counter() - started) * 1000)
+    return sorted(samples)
+
+
+async def run(count: int, calls: int, token_latency: float, seed: int) -> list[str]:
+    records = _records(count, seed)
+    built = _prompts(records)
+    failures = _heuristic_check(records)
+    fake = FakeOpenAI(latency=0.02, words=600, token_latency=token_latency)
+    await fake.start()
+    main._openai_client = main.AsyncOpenAI(api_key="bench", base_url=fake.base_url)
+    main._reading_cache = ReadingCache(max_entries=0)
+    backend = main._token_counter.backend
+    print(f"token counter: {backend}" + ("" if backend == "tiktoken" else " (degraded: tiktoken unavailable)"))
+    print(f"{'mode':<14} {'system':>7} {'user':>7} {'user p95':>9} {'max out':>8} {'trimmed':>8}"
+          f" {'build µs':>9} {'out tok':>8} {'p50 ms':>8} {'p90 ms':>8}")
+    try:
+        for mode, (prompts, build_us) in built.items():
+            system = main._token_counter.count(prompts[0].system)
+            user = sorted(prompt.input_tokens - system for prompt in prompts)
+            trimmed = sum(bool(prompt.trimmed) for prompt in prompts)
+            latency = await _latency(prompts[:calls])
+            stats = main._prompt_stats.stats()[mode]
+            print(
+                f"{mode:<14} {system:>7} {sum(user) / len(user):>7.0f} {user[int(len(user) * 0.95)]:>9}"
+                f" {prompts[0].max_tokens:>8} {trimmed:>8} {build_us:>9.0f} {stats['completion_tokens_avg']:>8.0f}"
+                f" {latency[len(latency) // 2]:>8.1f} {latency[int(len(latency) * 0.9)]:>8.1f}"
+            )
+    finally:
+        await main._openai_client.close()
+        await fake.stop()
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prompt tokens, budgets and fake-API latency per reading mode")
+    parser.add_argument("--records", type=int, default=500)
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--token-latency", type=float, default=0.0002)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    failures = asyncio.run(run(args.records, args.calls, args.token_latency, args.seed))
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    raise SystemExit(1 if failures else 0)
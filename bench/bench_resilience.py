@@ -0,0 +1,135 @@
+import argparse
+import asyncio
+import logging
+import time
+
+import main
+from bench.fake_openai import FakeOpenAI
+from resilience import CircuitBreaker, CircuitOpenError, ResilientCaller
+
+MESSAGES = [{"role": "user", "content": "12.07.1991 14:25 Москва"}]
+
+
+def _caller(**overrides) -> ResilientCaller:
+    options = {
+        "breaker": CircuitBreaker(threshold=0.5, min_calls=5, window=10, cooldown=0.5),
+        "deadline": 5.0,
+        "retries": 1,
+        "backoff": 0.05,
+        "hedge": False,
+        "hedge_min_delay": 0.2,
+        "retry_on": main._llm.retry_on,
+    }
+    options.update(overrides)
+    return ResilientCaller(**options)
+
+
+def _request(client):
+    return lambda: client.chat.completions.create(model="fake", messages=MESSAGES)
+
+
+async def _timed(caller: ResilientCaller, client, calls: int, concurrency: int) -> list[float]:
+    slots = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def one() -> None:
+        async with slots:
+            started = time.perf_counter()
+            try:
+                await caller.call(_request(client))
+            except Exception:
+                pass
+            samples.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one() for _ in range(calls)))
+    return sorted(samples)
+
+
+def _percentiles(samples: list[float]) -> str:
+    pick = lambda fraction: samples[min(len(samples) - 1, int(fraction * len(samples)))] * 1000
+    return f"p50 {pick(0.5):7.0f} ms  p95 {pick(0.95):7.0f} ms  p99 {pick(0.99):7.0f} ms"
+
+
+async def tail_latency(client, fake: FakeOpenAI, calls: int) -> list[str]:
+    fake.latency, fake.jitter, fake.slow_rate, fake.slow_latency = 0.05, 0.02, 0.1, 1.5
+    failures = []
+    for hedge in (False, True):
+        caller = _caller(hedge=hedge)
+        samples = await _timed(caller, client, calls, 10)
+        print(f"slow tail, hedge {'on ' if hedge else 'off'}: {_percentiles(samples)}  hedges {caller.hedges}"
+              f" (won {caller.hedge_wins})")
+        if hedge and caller.hedge_wins == 0:
+            failures.append("hedging never won against the slow tail")
+    fake.slow_rate = 0.0
+    return failures
+
+
+async def deadline(client, fake: FakeOpenAI) -> list[str]:
+    fake.latency, fake.jitter = 1.0, 0.0
+    caller = _caller(deadline=0.2, retries=1)
+    started = time.perf_counter()
+    try:
+        await caller.call(_request(client))
+        raised = False
+    except TimeoutError:
+        raised = True
+    elapsed = time.perf_counter() - started
+    print(f"deadline 0.2 s x2 attempts against a 1 s server: gave up after {elapsed * 1000:.0f} ms,"
+          f" timeouts {caller.timeouts}")
+    fake.latency = 0.05
+    if not raised or caller.timeouts != 2 or elapsed > 1.0:
+        return ["deadline did not cut the slow call short"]
+    return []
+
+
+async def breaker(client, fake: FakeOpenAI) -> list[str]:
+    caller = _caller(retries=0)
+    fake.error_rate = 1.0
+    calls_before = fake.calls
+    rejected = 0
+    started = time.perf_counter()
+    for _ in range(20):
+        try:
+            await caller.call(_request(client))
+        except CircuitOpenError:
+            rejected += 1
+        except Exception:
+            pass
+    elapsed = time.perf_counter() - started
+    reached = fake.calls - calls_before
+    print(f"outage: 20 calls, {reached} reached the server, {rejected} rejected instantly,"
+          f" state {caller.breaker.state}, {elapsed * 1000:.0f} ms total")
+    failures = []
+    if caller.breaker.state != CircuitBreaker.OPEN or reached > 6:
+        failures.append("breaker did not open during the outage")
+    fake.error_rate = 0.0
+    await asyncio.sleep(caller.breaker.cooldown)
+    await caller.call(_request(client))
+    print(f"recovery: probe succeeded, state {caller.breaker.state}")
+    if caller.breaker.state != CircuitBreaker.CLOSED:
+        failures.append("breaker did not close after a successful probe")
+    return failures
+
+
+async def run(calls: int) -> int:
+    fake = FakeOpenAI(words=20)
+    await fake.start()
+    client = main.AsyncOpenAI(api_key="bench", base_url=fake.base_url, max_retries=0)
+    try:
+        failures = await tail_latency(client, fake, calls)
+        failures += await deadline(client, fake)
+        failures += await breaker(client, fake)
+    finally:
+        await client.close()
+        await fake.stop()
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return len(failures)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LLM deadlines, hedging and circuit breaker against a fake API")
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    raise SystemExit(1 if asyncio.run(run(args.calls)) else 0)
@@ -0,0 +1,84 @@
+import argparse
+import random
+import time
+from datetime import date
+
+import main
+
+SAMPLE = {
+    "date": date(1991, 7, 12),
+    "time": "14:25",
+    "place": "Москва",
+    "time_mode": "exact",
+    "name": "Алина",
+    "goal": "отношения",
+}
+
+
+def legacy_passport(data: dict, seed_text: str) -> str:
+    rng = random.Random(seed_text)
+    element = rng.choice(main.ELEMENTS)
+    archetype = rng.choice(main.ARCHETYPES)
+    aspect = rng.choice(main.ASPECTS)
+    house = rng.choice(main.HOUSES)
+    strength = rng.choice(main.STRENGTHS)
+    blind_spot = rng.choice(main.BLIND_SPOTS)
+    resource = rng.choice(main.RESOURCES)
+    challenge = rng.choice(main.CHALLENGES)
+    period = rng.choice(main.PERIOD_THEMES)
+    guidance = rng.choice(main.GUIDANCE)
+    caution = rng.choice(main.CAUTIONS)
+    time_mode = main._format_time_mode(data["time_mode"])
+    name_value = main._safe_markdown(data.get("name"))
+    goal_value = main._safe_markdown(data.get("goal"))
+    name_line = f"*Имя:* {name_value}.\n" if name_value else ""
+    goal_line = f"*Запрос:* {goal_value}.\n" if goal_value else ""
+    return (
+        "🪐 *Паспорт карты Элайджа*\n"
+        f"{name_line}"
+        f"{goal_line}"
+        f"_{element}_, архетип *{archetype}*; {aspect} в {house}.\n"
+        f"*Режим точности:* {time_mode}.\n"
+        "*Твой профиль (5–7 тезисов):*\n"
+        f"• Сильная сторона: {strength}.\n"
+        f"• Слепая зона: {blind_spot}.\n"
+        f"• Ресурс: {resource}.\n"
+        f"• Вызов роста: {challenge}.\n"
+        f"• Тема периода: {period}.\n"
+        f"• Рекомендация: {guidance}.\n"
+        f"• Осторожность: {caution}.\n\n"
+        f"{main.DEEPER_OPTIONS}"
+        f"_{main.DISCLAIMER}_"
+    )
+
+
+def _rate(render, iterations: int) -> float:
+    seeds = [f"12.07.1991 14:25 Москва #{index}" for index in range(iterations)]
+    started = time.perf_counter()
+    for seed in seeds:
+        render(SAMPLE, seed)
+    return iterations / (time.perf_counter() - started)
+
+
+def run(iterations: int) -> None:
+    assert main._build_reading(SAMPLE, "seed") == main._build_reading(SAMPLE, "seed")
+    natal_v2 = {**SAMPLE, "reading_mode": "natal_v2"}
+    results = {
+        "passport (random.Random)": _rate(legacy_passport, iterations),
+        "passport (compiled)": _rate(main._build_reading, iterations),
+        "natal_v2 (compiled)": _rate(lambda data, seed: main._build_reading(natal_v2, seed), iterations),
+        "compatibility (compiled)": _rate(
+            lambda data, seed: main._build_compatibility_reading(data, data, seed),
+            iterations,
+        ),
+    }
+    for label, rate in results.items():
+        print(f"{label:<28} {rate:>12,.0f} renders/s")
+    speedup = results["passport (compiled)"] / results["passport (random.Random)"]
+    print(f"passport speedup: x{speedup:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline reading render throughput")
+    parser.add_argument("--iterations", type=int, default=50000)
+    run(parser.parse_args().iterations)
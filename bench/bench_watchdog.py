@@ -0,0 +1,77 @@
+import argparse
+import asyncio
+import logging
+import time
+
+from loop_watchdog import LoopWatchdog
+
+
+def _blocking_file_write(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+async def _handler(watchdog: LoopWatchdog, seconds: float) -> None:
+    watchdog.enter("message", 4242)
+    try:
+        _blocking_file_write(seconds)
+    finally:
+        watchdog.leave()
+
+
+async def _switches(count: int) -> float:
+    started = time.perf_counter()
+    for _ in range(count):
+        await asyncio.sleep(0)
+    return (time.perf_counter() - started) / count * 1e9
+
+
+async def detection(threshold: float, block: float) -> list[str]:
+    watchdog = LoopWatchdog(threshold)
+    watchdog.start()
+    await asyncio.sleep(0.2)
+    await asyncio.create_task(_handler(watchdog, block))
+    await asyncio.sleep(0.2)
+    await watchdog.stop()
+    if not watchdog.recent:
+        return [f"a {block:.2f} s block was not reported"]
+    stall = watchdog.recent[-1]
+    print(f"blocked {block:.2f} s: reported {stall.seconds:.2f} s in {stall.handler} (update {stall.update_id}),"
+          f" {stall.samples} stack samples, max lag {watchdog.max_lag:.2f} s")
+    failures = []
+    if stall.handler != "message" or stall.update_id != 4242:
+        failures.append("stall was not attributed to the running handler")
+    if "_blocking_file_write" not in stall.stack:
+        failures.append("stack sample missed the blocking function")
+    if abs(stall.seconds - block) > 0.1:
+        failures.append(f"stall duration {stall.seconds:.2f} s is off")
+    return failures
+
+
+async def overhead(idle: float, switches: int) -> None:
+    for enabled in (False, True):
+        watchdog = LoopWatchdog(0.25)
+        if enabled:
+            watchdog.start()
+        cpu = time.process_time()
+        await asyncio.sleep(idle)
+        cpu = (time.process_time() - cpu) / idle * 100
+        per_switch = await _switches(switches)
+        await watchdog.stop()
+        print(f"watchdog {'on ' if enabled else 'off'}: idle CPU {cpu:5.2f}%, task switch {per_switch:6.0f} ns")
+
+
+async def run(idle: float, switches: int) -> int:
+    failures = await detection(0.1, 0.3)
+    await overhead(idle, switches)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return len(failures)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Event-loop watchdog: stall detection self-check and overhead")
+    parser.add_argument("--idle", type=float, default=3.0, help="seconds of idle loop to measure CPU use")
+    parser.add_argument("--switches", type=int, default=200000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+    raise SystemExit(1 if asyncio.run(run(args.idle, args.switches)) else 0)
@@ -0,0 +1,161 @@
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import logging
+import random
+import time
+
+from webserver import HttpServer, Request, Response
+
+WORDS = (
+    "звёзды", "узор", "ресурс", "путь", "Сатурн", "Венера", "Луна", "ритм", "выбор", "опора",
+    "ясность", "движение", "пауза", "доверие", "граница", "сила", "тень", "свет",
+)
+
+
+class FakeOpenAI:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        words: int = 120,
+        token_latency: float = 0.0,
+        slow_rate: float = 0.0,
+        slow_latency: float = 0.0,
+    ) -> None:
+        self.server = HttpServer(host, port)
+        self.server.route("POST", "/v1/chat/completions", self._completions)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.words = words
+        self.token_latency = token_latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.calls = 0
+        self.errors = 0
+        self.prompts: list[str] = []
+        self._ids = itertools.count(1)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.server.host}:{self.server.port}/v1"
+
+    async def start(self) -> None:
+        await self.server.start()
+
+    async def stop(self) -> None:
+        await self.server.stop()
+
+    def reply_for(self, prompt: str) -> str:
+        seed = hashlib.blake2b(prompt.encode("utf-8"), digest_size=8).digest()
+        rng = random.Random(seed)
+        lines = []
+        for index in range(0, self.words, 12):
+            lines.append("• " + " ".join(rng.choice(WORDS) for _ in range(min(12, self.words - index))))
+        return "\n".join(lines)
+
+    async def _completions(self, request: Request) -> Response:
+        self.calls += 1
+        payload = request.json()
+        prompt = payload["messages"][-1]["content"]
+        content = self.reply_for(prompt)
+        if payload.get("max_tokens"):
+            content = content[: payload["max_tokens"] * 4]
+        prompt_tokens = sum(len(message["content"]) for message in payload["messages"]) // 4
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": prompt_tokens + len(content) // 4,
+        }
+        delay = self.latency + random.uniform(0, self.jitter) if self.latency or self.jitter else 0
+        delay += self.token_latency * usage["total_tokens"]
+        if self.slow_rate and random.random() < self.slow_rate:
+            delay += self.slow_latency
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error_rate and random.random() < self.error_rate:
+            self.errors += 1
+            return Response.json({"error": {"message": "fake overload", "type": "server_error"}}, status=500)
+        self.prompts.append(prompt)
+        completion_id = f"chatcmpl-fake-{next(self._ids)}"
+        created = int(time.time())
+        if payload.get("stream"):
+            include_usage = (payload.get("stream_options") or {}).get("include_usage")
+            return Response(
+                body=self._stream_body(
+                    completion_id, created, payload["model"], content, usage if include_usage else None,
+                ),
+                content_type="text/event-stream",
+            )
+        return Response.json({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": payload["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        })
+
+    @staticmethod
+    def _stream_body(completion_id: str, created: int, model: str, content: str, usage: dict | None) -> bytes:
+        events = []
+        pieces = content.split(" ")
+        for index, piece in enumerate(pieces):
+            text = piece if index == len(pieces) - 1 else piece + " "
+            events.append({"index": 0, "delta": {"content": text}, "finish_reason": None})
+        events.append({"index": 0, "delta": {}, "finish_reason": "stop"})
+        chunks = [
+            json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [choice],
+            }, ensure_ascii=False)
+            for choice in events
+        ]
+        if usage is not None:
+            chunks.append(json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [],
+                "usage": usage,
+            }))
+        return "".join(f"data: {chunk}\n\n" for chunk in chunks + ["[DONE]"]).encode("utf-8")
+
+
+async def _serve(args: argparse.Namespace) -> None:
+    fake = FakeOpenAI(
+        args.host, args.port, args.latency, args.jitter, args.error_rate, args.words, args.token_latency,
+        args.slow_rate, args.slow_latency,
+    )
+    await fake.start()
+    logging.info("Fake OpenAI API at %s", fake.base_url)
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--words", type=int, default=120)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of requests hitting the slow tail")
+    parser.add_argument("--slow-latency", type=float, default=0.0, help="extra seconds for slow-tail requests")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="extra seconds per prompt+completion token")
+    asyncio.run(_serve(parser.parse_args()))
@@ -0,0 +1,194 @@
+import argparse
+import asyncio
+import fnmatch
+import logging
+import time
+from collections.abc import Callable
+
+from persistence import PURGE_SCRIPT
+from ratelimit import TAKE_SCRIPT
+
+# EVAL cannot run Lua here, so scripts are mapped to Python stand-ins: (fake, keys, args) -> reply.
+Script = Callable[["FakeRedis", list[str], list[str]], object]
+
+
+class Status(str):
+    pass
+
+
+def _purge(fake: "FakeRedis", keys: list[str], args: list[str]) -> int:
+    cutoff, fields = float(args[0]), args[1:]
+    removed = 0
+    for key in keys:
+        stored = fake.hash(key)
+        for field in fields:
+            packed = stored.get(field)
+            if packed is not None and float(packed.partition("|")[0]) < cutoff:
+                fake.execute("HDEL", key, field)
+                removed += 1
+    return removed
+
+
+def _take(fake: "FakeRedis", keys: list[str], args: list[str]) -> str:
+    rate, burst, cost, floor = map(float, args)
+    now = time.time()
+    state = fake.hash(keys[0])
+    tokens = float(state.get("tokens", burst))
+    updated = float(state.get("updated", now))
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    wait = 0.0
+    if tokens - cost < floor:
+        wait = (floor + cost - tokens) / rate
+    else:
+        tokens = min(burst, tokens - cost)
+    fake.execute("HSET", keys[0], "tokens", repr(tokens), "updated", repr(now))
+    return repr(wait)
+
+
+class FakeRedis:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, password: str | None = None) -> None:
+        self.host = host
+        self.port = port
+        self.password = password
+        self.hashes: dict[str, dict[str, str]] = {}
+        self.expires: dict[str, float] = {}
+        self.scripts: dict[str, Script] = {PURGE_SCRIPT: _purge, TAKE_SCRIPT: _take}
+        self.commands: list[tuple[str, ...]] = []
+        self._server: asyncio.AbstractServer | None = None
+
+    @property
+    def url(self) -> str:
+        auth = f":{self.password}@" if self.password else ""
+        return f"redis://{auth}{self.host}:{self.port}/0"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def hash(self, key: str) -> dict[str, str]:
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.hashes.pop(key, None)
+            self.expires.pop(key, None)
+        return self.hashes.get(key, {})
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        authenticated = self.password is None
+        try:
+            while True:
+                command = await self._read_command(reader)
+                if command is None:
+                    return
+                self.commands.append(command)
+                name = command[0].upper()
+                if name == "AUTH":
+                    authenticated = command[-1] == self.password
+                    reply = Status("OK") if authenticated else RuntimeError("WRONGPASS invalid password")
+                elif not authenticated:
+                    reply = RuntimeError("NOAUTH Authentication required.")
+                else:
+                    try:
+                        reply = self.execute(name, *command[1:])
+                    except (KeyError, ValueError, IndexError) as exc:
+                        reply = RuntimeError(f"ERR {exc}")
+                writer.write(self._encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            return
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader) -> tuple[str, ...] | None:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            raise ConnectionError(f"Unexpected request line {line!r}")
+        parts = []
+        for _ in range(int(line[1:-2])):
+            length = int((await reader.readline())[1:-2])
+            parts.append((await reader.readexactly(length + 2))[:-2].decode("utf-8"))
+        return tuple(parts)
+
+    def execute(self, name: str, *args: str) -> object:
+        name = name.upper()
+        args = list(args)
+        if name in {"PING", "SELECT"}:
+            return Status("PONG" if name == "PING" else "OK")
+        if name == "HSET":
+            self.hash(args[0])
+            fields = self.hashes.setdefault(args[0], {})
+            added = sum(field not in fields for field in args[1::2])
+            fields.update(zip(args[1::2], args[2::2]))
+            return added
+        if name == "HGET":
+            return self.hash(args[0]).get(args[1])
+        if name == "HGETALL":
+            return [item for pair in self.hash(args[0]).items() for item in pair]
+        if name == "HDEL":
+            fields = self.hash(args[0])
+            removed = sum(fields.pop(field, None) is not None for field in args[1:])
+            if not fields:
+                self.hashes.pop(args[0], None)
+            return removed
+        if name == "DEL":
+            return sum(self.hashes.pop(key, None) is not None for key in args)
+        if name in {"EXPIRE", "PEXPIRE"}:
+            if not self.hash(args[0]):
+                return 0
+            scale = 1 if name == "EXPIRE" else 1000
+            self.expires[args[0]] = time.monotonic() + int(args[1]) / scale
+            return 1
+        if name == "SCAN":
+            return self._scan(args)
+        if name == "EVAL":
+            count = int(args[1])
+            return self.scripts[args[0]](self, args[2:2 + count], args[2 + count:])
+        raise KeyError(f"unknown command '{name}'")
+
+    def _scan(self, args: list[str]) -> list:
+        options = dict(zip(args[1::2], args[2::2]))
+        pattern = options.get("MATCH", "*")
+        count = int(options.get("COUNT", "10"))
+        keys = sorted(key for key in list(self.hashes) if self.hash(key) and fnmatch.fnmatchcase(key, pattern))
+        start = int(args[0])
+        page = keys[start:start + count]
+        cursor = start + count if start + count < len(keys) else 0
+        return [str(cursor), page]
+
+    def _encode(self, reply: object) -> bytes:
+        if isinstance(reply, RuntimeError):
+            return b"-%s\r\n" % str(reply).encode("utf-8")
+        if isinstance(reply, Status):
+            return b"+%s\r\n" % reply.encode("utf-8")
+        if isinstance(reply, int):
+            return b":%d\r\n" % int(reply)
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, list):
+            return b"*%d\r\n" % len(reply) + b"".join(self._encode(item) for item in reply)
+        encoded = str(reply).encode("utf-8")
+        return b"$%d\r\n%s\r\n" % (len(encoded), encoded)
+
+
+async def _serve(host: str, port: int) -> None:
+    fake = FakeRedis(host, port)
+    await fake.start()
+    logging.info("Fake Redis at %s", fake.url)
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Local stand-in for the Redis commands the bot uses")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6380)
+    args = parser.parse_args()
+    asyncio.run(_serve(args.host, args.port))
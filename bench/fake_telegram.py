@@ -0,0 +1,129 @@
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+from urllib.parse import parse_qs
+
+from webserver import HttpServer, Request, Response
+
+BOT_USER = {
+    "id": 1000000001,
+    "is_bot": True,
+    "first_name": "Elaidji",
+    "username": "elaidji_fake_bot",
+    "can_join_groups": False,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": False,
+}
+
+
+class FakeTelegram:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+    ) -> None:
+        self.server = HttpServer(host, port)
+        self.server.fallback = self._handle
+        self.latency = latency
+        self.jitter = jitter
+        self.webhook_url: str | None = None
+        self.webhook_secret: str | None = None
+        self.calls: list[tuple[float, str, dict]] = []
+        self._message_ids = itertools.count(1)
+        self._listeners: list[asyncio.Queue] = []
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.server.host}:{self.server.port}"
+
+    async def start(self) -> None:
+        await self.server.start()
+
+    async def stop(self) -> None:
+        await self.server.stop()
+
+    def subscribe(self) -> asyncio.Queue:
+        listener: asyncio.Queue = asyncio.Queue()
+        self._listeners.append(listener)
+        return listener
+
+    async def _handle(self, request: Request) -> Response:
+        parts = request.path.strip("/").split("/")
+        if len(parts) != 2 or not parts[0].startswith("bot"):
+            return Response(status=404, body=b"not found")
+        method = parts[1]
+        params = self._parse_params(request)
+        delay = self.latency + random.uniform(0, self.jitter) if self.latency or self.jitter else 0
+        if delay:
+            await asyncio.sleep(delay)
+        self.calls.append((time.monotonic(), method, params))
+        result = self._result(method, params)
+        for listener in self._listeners:
+            listener.put_nowait((method, params))
+        return Response.json({"ok": True, "result": result})
+
+    @staticmethod
+    def _parse_params(request: Request) -> dict:
+        if not request.body:
+            return {}
+        if request.headers.get("content-type", "").startswith("application/json"):
+            return request.json()
+        params = {}
+        for key, values in parse_qs(request.body.decode("utf-8")).items():
+            value = values[-1]
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                params[key] = value
+        return params
+
+    def _result(self, method: str, params: dict) -> object:
+        if method == "getMe":
+            return BOT_USER
+        if method == "setWebhook":
+            self.webhook_url = params.get("url")
+            self.webhook_secret = params.get("secret_token")
+            return True
+        if method == "deleteWebhook":
+            self.webhook_url = None
+            return True
+        if method == "getWebhookInfo":
+            return {"url": self.webhook_url or "", "has_custom_certificate": False,
+                    "pending_update_count": 0}
+        if method == "getUpdates":
+            return []
+        if method in {"sendMessage", "editMessageText"}:
+            chat_id = int(params.get("chat_id", 0))
+            message_id = params.get("message_id") or next(self._message_ids)
+            return {
+                "message_id": int(message_id),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER,
+                "text": str(params.get("text", "")),
+            }
+        return True
+
+
+async def _serve(host: str, port: int, latency: float, jitter: float) -> None:
+    fake = FakeTelegram(host, port, latency, jitter)
+    await fake.start()
+    logging.info("Fake Telegram Bot API at %s", fake.base_url)
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Local stand-in for the Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    args = parser.parse_args()
+    asyncio.run(_serve(args.host, args.port, args.latency, args.jitter))
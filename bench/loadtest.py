@@ -0,0 +1,212 @@
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date
+
+from telegram import Update
+from telegram.ext import TypeHandler
+
+import main
+from bench.fake_openai import FakeOpenAI
+from bench.fake_telegram import FakeTelegram
+from history_log import HistoryWriter
+from ratelimit import RateLimiter
+
+CITIES = ("Москва", "Казань", "Новосибирск", "Минск", "Алматы", "Санкт-Петербург", "Тбилиси", "Берлин")
+NAMES = ("Алина", "Игорь", "Мария", "Олег")
+GOALS = ("отношения", "карьера", "деньги", "сильные периоды", "самореализация")
+STEPS = ("start", "consent", "action", "birth_data", "time_mode", "confirm", "profile")
+LAG_INTERVAL = 0.05
+
+
+def _script(rng: random.Random, same_data: bool) -> list[tuple[str, str]]:
+    if same_data:
+        day, city = date(1991, 7, 12), "Москва"
+    else:
+        day, city = date(rng.randint(1950, 2005), rng.randint(1, 12), rng.randint(1, 28)), rng.choice(CITIES)
+    return list(zip(STEPS, (
+        "/start",
+        "Согласен",
+        "Натальная карта",
+        f"{day:%d.%m.%Y} {city}",
+        "примерно",
+        "Да",
+        f"{rng.choice(NAMES)}, {rng.choice(GOALS)}",
+    )))
+
+
+def _update(bot, user_id: int, update_id: int, text: str) -> Update:
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "Load"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+    return Update.de_json({"update_id": update_id, "message": message}, bot)
+
+
+class LoadTest:
+    def __init__(self, app, telegram: FakeTelegram, think: float, step_timeout: float, same_data: bool) -> None:
+        self.app = app
+        self.telegram = telegram
+        self.think = think
+        self.step_timeout = step_timeout
+        self.same_data = same_data
+        self.done: dict[int, asyncio.Future] = {}
+        self.first_reply: dict[int, tuple[str, float]] = {}
+        self.latency: dict[str, list[float]] = defaultdict(list)
+        self.first_latency: dict[str, list[float]] = defaultdict(list)
+        self.timeouts: dict[str, int] = defaultdict(int)
+        self.lag: list[float] = []
+        self.flows = 0
+        self.updates = 0
+        self._update_ids = iter(range(1, 1 << 62))
+
+    async def on_processed(self, update: Update, context) -> None:
+        future = self.done.pop(update.update_id, None)
+        if future is not None and not future.done():
+            future.set_result(time.perf_counter())
+
+    async def route_replies(self, replies: asyncio.Queue) -> None:
+        while True:
+            method, params = await replies.get()
+            if method not in {"sendMessage", "editMessageText"}:
+                continue
+            pending = self.first_reply.pop(int(params.get("chat_id", 0)), None)
+            if pending is not None:
+                step, sent = pending
+                self.first_latency[step].append(time.perf_counter() - sent)
+
+    async def measure_lag(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + LAG_INTERVAL
+            await asyncio.sleep(LAG_INTERVAL)
+            self.lag.append(max(0.0, loop.time() - expected))
+
+    async def user(self, user_id: int) -> None:
+        rng = random.Random(user_id)
+        for step, text in _script(rng, self.same_data):
+            update_id = next(self._update_ids)
+            future = self.done[update_id] = asyncio.get_running_loop().create_future()
+            sent = time.perf_counter()
+            self.first_reply[user_id] = (step, sent)
+            await self.app.update_queue.put(_update(self.app.bot, user_id, update_id, text))
+            self.updates += 1
+            try:
+                finished = await asyncio.wait_for(future, self.step_timeout)
+            except TimeoutError:
+                self.done.pop(update_id, None)
+                self.timeouts[step] += 1
+                return
+            self.latency[step].append(finished - sent)
+            if self.think:
+                await asyncio.sleep(rng.uniform(0, self.think))
+        self.flows += 1
+
+
+def _percentiles(samples: list[float]) -> str:
+    if not samples:
+        return f"{'-':>8} {'-':>8} {'-':>8}"
+    ordered = sorted(samples)
+    pick = lambda fraction: ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+    return f"{pick(0.5):8.0f} {pick(0.95):8.0f} {pick(0.99):8.0f}"
+
+
+def _report(test: LoadTest, elapsed: float, users: int, fake_llm: FakeOpenAI) -> None:
+    print(f"users {users}, flows completed {test.flows}, updates {test.updates} in {elapsed:.1f} s")
+    print(f"throughput: {test.flows / elapsed:.2f} flows/s, {test.updates / elapsed:.1f} updates/s")
+    print(f"{'step':<18} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'timeouts':>9}")
+    for step in STEPS:
+        print(f"{step:<18} {len(test.latency[step]):>6} {_percentiles(test.latency[step])} {test.timeouts[step]:>9}")
+    for step in ("confirm", "profile"):
+        label = f"{step} (1st reply)"
+        print(f"{label:<18} {len(test.first_latency[step]):>6} {_percentiles(test.first_latency[step])}")
+    print(f"event loop lag (ms): p50/p95/p99 {_percentiles(test.lag)}, max {max(test.lag, default=0) * 1000:.0f}")
+    outcomes = defaultdict(int)
+    for (mode, outcome), child in main._reading_seconds._children.items():
+        outcomes[outcome] += child.count
+    print(f"readings by source: {dict(outcomes)}; LLM API calls {fake_llm.calls}, errors {fake_llm.errors}")
+    print(f"speculative: {main._speculations.stats()}")
+
+
+async def run(args: argparse.Namespace) -> int:
+    telegram = FakeTelegram(latency=args.tg_latency, jitter=args.tg_jitter)
+    llm = FakeOpenAI(
+        latency=args.llm_latency, jitter=args.llm_jitter, error_rate=args.llm_error_rate, words=args.words,
+        token_latency=args.token_latency, slow_rate=args.llm_slow_rate, slow_latency=args.llm_slow_latency,
+    )
+    await telegram.start()
+    await llm.start()
+    os.environ["OPENAI_API_KEY"] = "bench"
+    os.environ["OPENAI_BASE_URL"] = llm.base_url
+    main.TELEGRAM_API_URL = telegram.base_url
+    main.READING_STREAMING = not args.no_streaming
+    if not args.rate_limits:
+        main._rate_limiter = RateLimiter(None, None, 0)
+    app = main._build_application("1:loadtest")
+    test = LoadTest(app, telegram, args.think, args.step_timeout, args.same_data)
+    app.add_handler(TypeHandler(Update, test.on_processed), group=1)
+
+    background = [
+        asyncio.create_task(test.route_replies(telegram.subscribe())),
+        asyncio.create_task(test.measure_lag()),
+    ]
+    await app.initialize()
+    await app.post_init(app)
+    await app.start()
+    try:
+        started = time.perf_counter()
+        slots = asyncio.Semaphore(args.concurrency)
+
+        async def one(user_id: int) -> None:
+            async with slots:
+                await test.user(user_id)
+
+        await asyncio.gather(*(one(100000 + index) for index in range(args.users)))
+        elapsed = time.perf_counter() - started
+    finally:
+        for task in background:
+            task.cancel()
+        await app.stop()
+        await app.shutdown()
+        await app.post_shutdown(app)
+        await llm.stop()
+        await telegram.stop()
+    _report(test, elapsed, args.users, llm)
+    return sum(test.timeouts.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive the full bot flow against fake Telegram and OpenAI APIs")
+    parser.add_argument("--users", type=int, default=200, help="virtual users, each runs one full flow")
+    parser.add_argument("--concurrency", type=int, default=50, help="users active at the same time")
+    parser.add_argument("--think", type=float, default=0.0, help="max random pause between a user's messages")
+    parser.add_argument("--step-timeout", type=float, default=120.0)
+    parser.add_argument("--same-data", action="store_true", help="every user sends the same birth data")
+    parser.add_argument("--rate-limits", action="store_true", help="keep the configured rate limits")
+    parser.add_argument("--no-streaming", action="store_true")
+    parser.add_argument("--tg-latency", type=float, default=0.02)
+    parser.add_argument("--tg-jitter", type=float, default=0.02)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--llm-jitter", type=float, default=1.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-slow-rate", type=float, default=0.0)
+    parser.add_argument("--llm-slow-latency", type=float, default=0.0)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--words", type=int, default=120)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        main._history_writer.close()
+        main._history_writer = HistoryWriter(os.path.join(directory, "history.log"))
+        timeouts = asyncio.run(run(args))
+    raise SystemExit(1 if timeouts else 0)
@@ -0,0 +1,146 @@
+import re
+from dataclasses import dataclass
+import datetime
+
+MONTHS = {
+    "января": 1, "янв": 1, "january": 1, "jan": 1,
+    "февраля": 2, "фев": 2, "february": 2, "feb": 2,
+    "марта": 3, "мар": 3, "march": 3, "mar": 3,
+    "апреля": 4, "апр": 4, "april": 4, "apr": 4,
+    "мая": 5, "май": 5, "may": 5,
+    "июня": 6, "июн": 6, "june": 6, "jun": 6,
+    "июля": 7, "июл": 7, "july": 7, "jul": 7,
+    "августа": 8, "авг": 8, "august": 8, "aug": 8,
+    "сентября": 9, "сент": 9, "сен": 9, "september": 9, "sep": 9, "sept": 9,
+    "октября": 10, "окт": 10, "october": 10, "oct": 10,
+    "ноября": 11, "ноя": 11, "нояб": 11, "november": 11, "nov": 11,
+    "декабря": 12, "дек": 12, "december": 12, "dec": 12,
+}
+HINT_WORDS = (
+    "утро", "утром", "день", "днём", "днем", "вечер", "вечером", "ночь", "ночью",
+    "примерно",
+)
+
+_MONTH_PATTERN = "|".join(sorted(map(re.escape, MONTHS), key=len, reverse=True))
+_HINT_PATTERN = "|".join(sorted(HINT_WORDS, key=len, reverse=True))
+_FIRST_LETTERS = "".join(sorted({word[0] for word in HINT_WORDS} | {"н", "о"}))
+_TIME_AHEAD = r"\s+(?:\d{1,2}:\d{2}|\d{1,2}\s*[ap]\.?m)(?!\w)"
+# A preposition left in front of a removed time ("в 14:25") would otherwise end up in the place.
+DANGLING_RE = re.compile(r"(?:^|(?<=\s))(?:в|во)\s*$", re.IGNORECASE)
+TOKEN_RE = re.compile(
+    rf"(?=[\d±{_FIRST_LETTERS}{_FIRST_LETTERS.upper()}])"
+    r"(?:(?P<iso>\b(?P<iy>\d{4})-(?P<im>\d{1,2})-(?P<id>\d{1,2})(?!\d))"
+    r"|(?P<dmy>(?P<dd>\d{1,2})[./-](?P<dm>\d{1,2})[./-](?P<dy>\d{4}))"
+    r"|(?P<time>\b(?P<th>\d{1,2}):(?P<tm>\d{2})(?:\s*(?P<tap>[ap])\.?m\.?)?(?!\w))"
+    rf"|(?P<verbal>\b(?P<vd>\d{{1,2}})\s+(?P<vm>{_MONTH_PATTERN})\.?\s+(?P<vy>\d{{4}})"
+    r"(?:\s*(?:года|г\.?)(?!\w))?)"
+    r"|(?P<time12>\b(?P<h12>\d{1,2})\s*(?P<ap12>[ap])\.?m\.?(?!\w))"
+    r"|(?P<no_time>не\s+знаю)"
+    rf"|(?P<about>\bоколо(?={_TIME_AHEAD}))"
+    rf"|(?P<hint>\b(?:{_HINT_PATTERN})\b|±))",
+    re.IGNORECASE,
+)
+
+
+@dataclass(slots=True)
+class BirthData:
+    date: datetime.date | None = None
+    time: str | None = None
+    place: str | None = None
+    time_mode: str = "unknown"
+
+    def as_dict(self) -> dict:
+        return {
+            "date": self.date,
+            "time": self.time,
+            "place": self.place,
+            "time_mode": self.time_mode,
+        }
+
+
+def _to_date(year: str, month: int | str, day: str) -> datetime.date | None:
+    try:
+        return datetime.date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+def _to_24h(hour: int, meridiem: str | None) -> int:
+    if not meridiem:
+        return hour
+    if not 1 <= hour <= 12:
+        return 24
+    if meridiem.lower() == "a":
+        return 0 if hour == 12 else hour
+    return 12 if hour == 12 else hour + 12
+
+
+def _time_value(match: re.Match) -> tuple[int, int]:
+    if match.lastgroup == "time":
+        hour = _to_24h(int(match["th"]), match["tap"])
+        return hour, int(match["tm"])
+    return _to_24h(int(match["h12"]), match["ap12"]), 0
+
+
+def find_time(text: str) -> tuple[int, int] | None:
+    for match in TOKEN_RE.finditer(text):
+        if match.lastgroup in {"time", "time12"}:
+            return _time_value(match)
+    return None
+
+
+def parse_birth_data(text: str) -> BirthData:
+    date_value = None
+    time_value = None
+    date_seen = False
+    time_seen = False
+    has_hint = False
+    has_no_time = False
+    place_parts = []
+    position = 0
+    for match in TOKEN_RE.finditer(text):
+        kind = match.lastgroup
+        if kind == "dmy":
+            if not date_seen:
+                date_seen = True
+                date_value = _to_date(match["dy"], match["dm"], match["dd"])
+        elif kind == "time" or kind == "time12":
+            if not time_seen:
+                time_seen = True
+                hour, minute = _time_value(match)
+                if 0 <= hour < 24 and 0 <= minute < 60:
+                    time_value = f"{hour:02d}:{minute:02d}"
+        elif kind == "iso":
+            if not date_seen:
+                date_seen = True
+                date_value = _to_date(match["iy"], match["im"], match["id"])
+        elif kind == "verbal":
+            if not date_seen:
+                date_seen = True
+                date_value = _to_date(match["vy"], MONTHS[match["vm"].lower()], match["vd"])
+        elif kind == "no_time":
+            has_no_time = True
+        else:
+            has_hint = True
+        start, end = match.span()
+        if start > position:
+            segment = text[position:start]
+            if kind in {"time", "time12", "about"}:
+                segment = DANGLING_RE.sub("", segment)
+            place_parts.append(segment)
+        position = end
+    place_parts.append(text[position:])
+
+    if time_value is not None:
+        time_mode = "exact"
+    elif time_seen:
+        time_mode = "unknown"
+    elif has_hint:
+        time_mode = "approx"
+    elif has_no_time:
+        time_mode = "no_time"
+    else:
+        time_mode = "unknown"
+
+    place = " ".join("".join(place_parts).split()).strip(" ,.-")
+    return BirthData(date_value, time_value, place or None, time_mode)
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from typing import Any
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+BUSY_TEXT = "Сейчас слишком много запросов. Попробуй ещё раз через минуту."
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrency: int, max_backlog: int) -> None:
+        super().__init__(max_concurrency + max_backlog + 1)
+        self.max_concurrency = max_concurrency
+        self.max_backlog = max_backlog
+        self.in_flight = 0
+        self.queued = 0
+        self.rejected = 0
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._chat_locks: dict[int, asyncio.Lock] = {}
+        self._chat_waiters: dict[int, int] = {}
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": self.queued,
+            "rejected": self.rejected,
+            "active_chats": len(self._chat_locks),
+        }
+
+    async def initialize(self) -> None:
+        return None
+
+    async def shutdown(self) -> None:
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        if self.queued >= self.max_backlog:
+            self.rejected += 1
+            if hasattr(coroutine, "close"):
+                coroutine.close()
+            logging.warning("Update backlog is full, rejecting update")
+            await self._reply_busy(update)
+            return
+
+        key = self._chat_key(update)
+        self.queued += 1
+        try:
+            if key is None:
+                await self._slots.acquire()
+            else:
+                lock = self._chat_locks.get(key)
+                if lock is None:
+                    lock = self._chat_locks[key] = asyncio.Lock()
+                self._chat_waiters[key] = self._chat_waiters.get(key, 0) + 1
+                try:
+                    await lock.acquire()
+                    try:
+                        await self._slots.acquire()
+                    except BaseException:
+                        lock.release()
+                        raise
+                finally:
+                    self._release_waiter(key)
+        finally:
+            self.queued -= 1
+
+        self.in_flight += 1
+        try:
+            await coroutine
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+            if key is not None:
+                self._chat_locks[key].release()
+                if not self._chat_waiters.get(key) and not self._chat_locks[key].locked():
+                    self._chat_locks.pop(key, None)
+
+    def _release_waiter(self, key: int) -> None:
+        remaining = self._chat_waiters[key] - 1
+        if remaining:
+            self._chat_waiters[key] = remaining
+        else:
+            del self._chat_waiters[key]
+
+    @staticmethod
+    def _chat_key(update: object) -> int | None:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+        return None
+
+    @staticmethod
+    async def _reply_busy(update: object) -> None:
+        if not isinstance(update, Update) or update.effective_message is None:
+            return
+        try:
+            await update.effective_message.reply_text(BUSY_TEXT)
+        except Exception:
+            logging.warning("Failed to notify user about backlog", exc_info=True)
+
+
+class SingleFlight:
+    def __init__(self) -> None:
+        self.leaders = 0
+        self.coalesced = 0
+        self.abandoned = 0
+        self._calls: dict[str, asyncio.Future] = {}
+        self._waiters: Counter[asyncio.Future] = Counter()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+        }
+
+    def pending(self, key: str) -> asyncio.Future | None:
+        return self._calls.get(key)
+
+    async def wait(self, future: asyncio.Future) -> Any:
+        self.coalesced += 1
+        return await self._join(future)
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._calls.get(key)
+        if future is not None:
+            return await self.wait(future)
+        # The shared call runs as its own task so a cancelled leader does not fail the followers.
+        task = asyncio.ensure_future(factory())
+        self._track(key, task)
+        return await self._join(task)
+
+    async def _join(self, future: asyncio.Future) -> Any:
+        self._waiters[future] += 1
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # The last caller left: stop the shared request instead of paying for a reply nobody reads.
+            if self._waiters[future] == 1 and isinstance(future, asyncio.Task) and not future.done():
+                self.abandoned += 1
+                future.cancel()
+            raise
+        finally:
+            self._waiters[future] -= 1
+            if not self._waiters[future]:
+                del self._waiters[future]
+
+    @contextmanager
+    def lead(self, key: str) -> Iterator[asyncio.Future]:
+        future = asyncio.get_running_loop().create_future()
+        self._track(key, future)
+        try:
+            yield future
+        finally:
+            if not future.done():
+                future.set_exception(RuntimeError("shared call finished without a result"))
+
+    def _track(self, key: str, future: asyncio.Future) -> None:
+        self.leaders += 1
+        self._calls[key] = future
+        future.add_done_callback(lambda done: self._forget(key, done))
+
+    def _forget(self, key: str, future: asyncio.Future) -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled():
+            future.exception()
+
+
+class RecentKeys:
+    def __init__(self, window: float) -> None:
+        self.window = window
+        self.repeats = 0
+        self._seen: OrderedDict[int, float] = OrderedDict()
+
+    def mark(self, key: int) -> None:
+        now = time.monotonic()
+        self._seen[key] = now
+        self._seen.move_to_end(key)
+        while self._seen and next(iter(self._seen.values())) < now - self.window:
+            self._seen.popitem(last=False)
+
+    def is_recent(self, key: int) -> bool:
+        seen = self._seen.get(key)
+        return seen is not None and seen >= time.monotonic() - self.window
+
+    def refresh(self, key: int) -> None:
+        if self.is_recent(key):
+            self.mark(key)
+
+    def is_repeat(self, key: int) -> bool:
+        if not self.is_recent(key):
+            return False
+        self.repeats += 1
+        return True
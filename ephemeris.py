@@ -0,0 +1,373 @@
+import datetime
+from dataclasses import dataclass
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import numpy as np
+
+PLANETS = ("sun", "moon", "mercury", "venus", "mars", "jupiter", "saturn", "uranus", "neptune", "pluto")
+BODIES = PLANETS + ("node",)
+BODY_NAMES = {
+    "sun": "Солнце",
+    "moon": "Луна",
+    "mercury": "Меркурий",
+    "venus": "Венера",
+    "mars": "Марс",
+    "jupiter": "Юпитер",
+    "saturn": "Сатурн",
+    "uranus": "Уран",
+    "neptune": "Нептун",
+    "pluto": "Плутон",
+    "node": "Сев. узел",
+}
+SIGNS = (
+    "Овен", "Телец", "Близнецы", "Рак", "Лев", "Дева",
+    "Весы", "Скорпион", "Стрелец", "Козерог", "Водолей", "Рыбы",
+)
+ASPECTS = (
+    ("соединение", 0.0, 8.0),
+    ("секстиль", 60.0, 4.0),
+    ("квадрат", 90.0, 6.0),
+    ("трин", 120.0, 6.0),
+    ("оппозиция", 180.0, 8.0),
+)
+ASPECT_BODIES = PLANETS
+ASPECT_ORBS = np.array([aspect[2] for aspect in ASPECTS])
+ASPECT_ANGLES = np.array([aspect[1] for aspect in ASPECTS])
+
+# Keplerian elements referred to the equinox of date: value at day 0 and rate per day,
+# ordered as N (ascending node), i, w (perihelion argument), a, e, M (mean anomaly).
+# Rows: Moon (geocentric, a in Earth radii), then Mercury to Neptune (heliocentric, a in AU).
+ELEMENTS = np.array([
+    ((125.1228, -0.0529538083), (5.1454, 0.0), (318.0634, 0.1643573223),
+     (60.2666, 0.0), (0.054900, 0.0), (115.3654, 13.0649929509)),
+    ((48.3313, 3.24587e-5), (7.0047, 5.00e-8), (29.1241, 1.01444e-5),
+     (0.387098, 0.0), (0.205635, 5.59e-10), (168.6562, 4.0923344368)),
+    ((76.6799, 2.46590e-5), (3.3946, 2.75e-8), (54.8910, 1.38374e-5),
+     (0.723330, 0.0), (0.006773, -1.302e-9), (48.0052, 1.6021302244)),
+    ((49.5574, 2.11081e-5), (1.8497, -1.78e-8), (286.5016, 2.92961e-5),
+     (1.523688, 0.0), (0.093405, 2.516e-9), (18.6021, 0.5240207766)),
+    ((100.4542, 2.76854e-5), (1.3030, -1.557e-7), (273.8777, 1.64505e-5),
+     (5.20256, 0.0), (0.048498, 4.469e-9), (19.8950, 0.0830853001)),
+    ((113.6634, 2.38980e-5), (2.4886, -1.081e-7), (339.3939, 2.97661e-5),
+     (9.55475, 0.0), (0.055546, -9.499e-9), (316.9670, 0.0334442282)),
+    ((74.0005, 1.3978e-5), (0.7733, 1.9e-8), (96.6612, 3.0565e-5),
+     (19.18171, -1.55e-8), (0.047318, 7.45e-9), (142.5905, 0.011725806)),
+    ((131.7806, 3.0173e-5), (1.7700, -2.55e-7), (272.8461, -6.027e-6),
+     (30.05826, 3.313e-8), (0.008606, 2.15e-9), (260.2471, 0.005995147)),
+])
+ANGULAR = np.array([True, True, True, False, False, True])
+MOON_AMPLITUDES = np.array([
+    -1.274, 0.658, -0.186, -0.059, -0.057, 0.053, 0.046, 0.041, -0.035, -0.031, -0.015, 0.011,
+])
+# Multipliers of the Moon's mean anomaly, the Sun's mean anomaly, elongation and latitude argument.
+MOON_FACTORS = np.array([
+    (1, 0, -2, 0), (0, 0, 2, 0), (0, 1, 0, 0), (2, 0, -2, 0), (1, 1, -2, 0), (1, 0, 2, 0),
+    (0, -1, 2, 0), (1, -1, 0, 0), (0, 0, 1, 0), (1, 1, 0, 0), (0, 0, -2, 2), (1, 0, -4, 0),
+], dtype=float)
+PLUTO_LON = ((-19.799, 19.848), (0.897, -4.956), (0.610, 1.211), (-0.341, -0.190), (0.128, -0.034), (-0.038, 0.031))
+PLUTO_LAT = ((-5.453, -14.975), (3.527, 1.673), (-1.051, 0.328), (0.179, -0.292), (0.019, 0.100), (-0.031, -0.026))
+PLUTO_DIST = ((6.68, 6.90), (-1.18, -0.03), (0.15, -0.14))
+PRECESSION_PER_DAY = 3.82394e-5
+POLAR_LIMIT = 66.0
+PLACIDUS_HOUSES = [10, 11, 1, 2]
+PLACIDUS_FRACTIONS = np.array([1 / 3, 2 / 3, 2 / 3, 1 / 3])
+PLACIDUS_BELOW = np.array([False, False, True, True])
+MAX_ASPECTS = 8
+
+
+def day_number(moment: datetime.datetime) -> float:
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    delta = moment - datetime.datetime(1999, 12, 31)
+    return delta.days + delta.seconds / 86400.0
+
+
+def _kepler(mean_anomaly: np.ndarray, eccentricity: np.ndarray) -> np.ndarray:
+    anomaly = mean_anomaly + eccentricity * np.sin(mean_anomaly) * (1.0 + eccentricity * np.cos(mean_anomaly))
+    for _ in range(4):
+        anomaly = anomaly - (anomaly - eccentricity * np.sin(anomaly) - mean_anomaly) / (
+            1.0 - eccentricity * np.cos(anomaly)
+        )
+    return anomaly
+
+
+def _orbits(d: np.ndarray) -> tuple[np.ndarray, ...]:
+    values = ELEMENTS[:, :, 0, None] + ELEMENTS[:, :, 1, None] * d
+    values[:, ANGULAR] = np.radians(np.mod(values[:, ANGULAR], 360.0))
+    node, incl, peri, axis, ecc, mean = values.transpose(1, 0, 2)
+    anomaly = _kepler(mean, ecc)
+    xv = axis * (np.cos(anomaly) - ecc)
+    yv = axis * np.sqrt(1.0 - ecc * ecc) * np.sin(anomaly)
+    distance = np.hypot(xv, yv)
+    argument = np.arctan2(yv, xv) + peri
+    cos_node, sin_node = np.cos(node), np.sin(node)
+    cos_arg, sin_arg = np.cos(argument), np.sin(argument)
+    x = distance * (cos_node * cos_arg - sin_node * sin_arg * np.cos(incl))
+    y = distance * (sin_node * cos_arg + cos_node * sin_arg * np.cos(incl))
+    return x, y, node, peri, mean
+
+
+def _sun(d: np.ndarray) -> tuple[np.ndarray, ...]:
+    peri = np.radians(282.9404 + 4.70935e-5 * d)
+    ecc = 0.016709 - 1.151e-9 * d
+    mean = np.radians(np.mod(356.0470 + 0.9856002585 * d, 360.0))
+    anomaly = _kepler(mean, ecc)
+    xv = np.cos(anomaly) - ecc
+    yv = np.sqrt(1.0 - ecc * ecc) * np.sin(anomaly)
+    longitude = np.arctan2(yv, xv) + peri
+    distance = np.hypot(xv, yv)
+    return distance * np.cos(longitude), distance * np.sin(longitude), mean, mean + peri
+
+
+def _moon_correction(node, peri, mean, sun_mean, sun_lon) -> np.ndarray:
+    mean_lon = node + peri + mean
+    arguments = np.stack([mean, sun_mean, mean_lon - sun_lon, mean_lon - node])
+    return MOON_AMPLITUDES @ np.sin(np.tensordot(MOON_FACTORS, arguments, axes=1))
+
+
+def _pluto(d: np.ndarray) -> tuple[np.ndarray, ...]:
+    p = np.radians(238.95 + 0.003968789 * d)
+    s = np.radians(50.03 + 0.033459652 * d)
+    lon = 238.9508 + 0.00400703 * d + 0.020 * np.sin(s - p) - 0.010 * np.cos(s - p)
+    lat = -3.9082 + 0.011 * np.cos(s - p)
+    dist = 40.72 + np.zeros_like(d)
+    for order, (sin_term, cos_term) in enumerate(PLUTO_LON, start=1):
+        lon = lon + sin_term * np.sin(order * p) + cos_term * np.cos(order * p)
+    for order, (sin_term, cos_term) in enumerate(PLUTO_LAT, start=1):
+        lat = lat + sin_term * np.sin(order * p) + cos_term * np.cos(order * p)
+    for order, (sin_term, cos_term) in enumerate(PLUTO_DIST, start=1):
+        dist = dist + sin_term * np.sin(order * p) + cos_term * np.cos(order * p)
+    lon = np.radians(lon + PRECESSION_PER_DAY * d)
+    lat = np.radians(lat)
+    return dist * np.cos(lat) * np.cos(lon), dist * np.cos(lat) * np.sin(lon)
+
+
+def _perturbations(mj: np.ndarray, ms: np.ndarray, mu: np.ndarray) -> np.ndarray:
+    deg = np.radians
+    return np.stack([
+        -0.332 * np.sin(2 * mj - 5 * ms - deg(67.6)) - 0.056 * np.sin(2 * mj - 2 * ms + deg(21))
+        + 0.042 * np.sin(3 * mj - 5 * ms + deg(21)) - 0.036 * np.sin(mj - 2 * ms)
+        + 0.022 * np.cos(mj - ms) + 0.023 * np.sin(2 * mj - 3 * ms + deg(52))
+        - 0.016 * np.sin(mj - 5 * ms - deg(69)),
+        0.812 * np.sin(2 * mj - 5 * ms - deg(67.6)) - 0.229 * np.cos(2 * mj - 4 * ms - deg(2))
+        + 0.119 * np.sin(mj - 2 * ms - deg(3)) + 0.046 * np.sin(2 * mj - 6 * ms - deg(69))
+        + 0.014 * np.sin(mj - 3 * ms + deg(32)),
+        0.040 * np.sin(ms - 2 * mu + deg(6)) + 0.035 * np.sin(ms - 3 * mu + deg(33))
+        - 0.015 * np.sin(mj - mu + deg(20)),
+    ])
+
+
+def longitudes(d: np.ndarray | float) -> np.ndarray:
+    d = np.asarray(d, dtype=float)
+    shape = d.shape
+    d = d.reshape(-1)
+    sun_x, sun_y, sun_mean, sun_lon = _sun(d)
+    x, y, node, peri, mean = _orbits(d)
+    result = np.empty((len(BODIES), d.size))
+    result[0] = np.arctan2(sun_y, sun_x)
+    result[1] = np.arctan2(y[0], x[0])
+    result[2:9] = np.arctan2(y[1:] + sun_y, x[1:] + sun_x)
+    pluto_x, pluto_y = _pluto(d)
+    result[9] = np.arctan2(pluto_y + sun_y, pluto_x + sun_x)
+    result[10] = node[0]
+    result = np.degrees(result)
+    result[1] += _moon_correction(node[0], peri[0], mean[0], sun_mean, sun_lon)
+    result[5:8] += _perturbations(mean[4], mean[5], mean[6])
+    return np.mod(result, 360.0).reshape((len(BODIES),) + shape)
+
+
+def positions_and_motion(d: np.ndarray | float) -> tuple[np.ndarray, np.ndarray]:
+    d = np.asarray(d, dtype=float)
+    values = longitudes(np.stack([d, d - 0.5, d + 0.5]))
+    motion = np.mod(values[:, 2] - values[:, 1] + 180.0, 360.0) - 180.0
+    retro = motion < 0.0
+    retro[BODIES.index("node")] = False
+    return values[:, 0], retro
+
+
+def obliquity(d: np.ndarray) -> np.ndarray:
+    return np.radians(23.4393 - 3.563e-7 * d)
+
+
+def _ramc(d: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    return np.radians(np.mod(280.46061837 + 360.98564736629 * (d - 1.5) + lon, 360.0))
+
+
+def _ecliptic(right_ascension: np.ndarray, eps: np.ndarray) -> np.ndarray:
+    return np.arctan2(np.sin(right_ascension), np.cos(right_ascension) * np.cos(eps))
+
+
+def angles(d: np.ndarray | float, lat: np.ndarray | float, lon: np.ndarray | float) -> tuple[np.ndarray, np.ndarray]:
+    d = np.asarray(d, dtype=float)
+    ramc = _ramc(d, np.asarray(lon, dtype=float))
+    eps = obliquity(d)
+    phi = np.radians(np.asarray(lat, dtype=float))
+    asc = np.arctan2(np.cos(ramc), -(np.sin(ramc) * np.cos(eps) + np.tan(phi) * np.sin(eps)))
+    return np.mod(np.degrees(asc), 360.0), np.mod(np.degrees(_ecliptic(ramc, eps)), 360.0)
+
+
+def house_cusps(d: np.ndarray | float, lat: np.ndarray | float, lon: np.ndarray | float) -> tuple[np.ndarray, np.ndarray]:
+    d = np.asarray(d, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    asc, mc = angles(d, lat, lon)
+    ramc = _ramc(d, np.asarray(lon, dtype=float))
+    eps = obliquity(d)
+    tan_phi = np.tan(np.radians(lat))
+    cusps = np.empty((12,) + asc.shape)
+    cusps[0], cusps[9] = asc, mc
+    # Placidus: cusps 11, 12, 2 and 3 trisect the diurnal and nocturnal semi-arcs.
+    fraction = PLACIDUS_FRACTIONS.reshape((4,) + (1,) * asc.ndim)
+    below = PLACIDUS_BELOW.reshape((4,) + (1,) * asc.ndim)
+    semi_arc = np.full((4,) + asc.shape, np.pi / 2)
+    for _ in range(8):
+        right_ascension = np.where(below, ramc + np.pi - fraction * (np.pi - semi_arc), ramc + fraction * semi_arc)
+        declination = np.arcsin(np.sin(eps) * np.sin(_ecliptic(right_ascension, eps)))
+        semi_arc = np.arccos(np.clip(-tan_phi * np.tan(declination), -1.0, 1.0))
+    cusps[PLACIDUS_HOUSES] = np.mod(np.degrees(_ecliptic(right_ascension, eps)), 360.0)
+    for house in (3, 4, 5, 6, 7, 8):
+        cusps[house] = np.mod(cusps[house - 6] + 180.0, 360.0)
+    polar = np.abs(lat) >= POLAR_LIMIT
+    if np.any(polar):
+        equal = np.mod(asc + 30.0 * np.arange(12).reshape((12,) + (1,) * asc.ndim), 360.0)
+        cusps = np.where(polar, equal, cusps)
+    return cusps, polar
+
+
+def houses_of(positions: np.ndarray, cusps: np.ndarray) -> np.ndarray:
+    offsets = np.mod(positions[:, None, ...] - cusps[None, ...], 360.0)
+    spans = np.mod(np.roll(cusps, -1, axis=0) - cusps, 360.0)
+    return np.argmax(offsets < spans[None, ...], axis=1) + 1
+
+
+def aspects(positions: np.ndarray, other: np.ndarray | None = None) -> list[tuple[int, int, int, float]]:
+    count = len(ASPECT_BODIES)
+    first_set = positions[:count]
+    second_set = first_set if other is None else other[:count]
+    separation = np.abs(np.mod(first_set[:, None] - second_set[None, :] + 180.0, 360.0) - 180.0)
+    deviation = np.abs(separation[..., None] - ASPECT_ANGLES)
+    mask = deviation <= ASPECT_ORBS
+    if other is None:
+        mask &= np.triu(np.ones((count, count), dtype=bool), 1)[..., None]
+    found = [
+        (int(first), int(second), int(kind), float(deviation[first, second, kind]))
+        for first, second, kind in np.argwhere(mask)
+    ]
+    found.sort(key=lambda item: item[3])
+    return found
+
+
+def format_degree(longitude: float) -> str:
+    minutes = int(round(longitude * 60)) % (360 * 60)
+    sign, rest = divmod(minutes, 30 * 60)
+    return f"{SIGNS[sign]} {rest // 60}°{rest % 60:02d}'"
+
+
+# Headers for charts without houses, by how the birth moment was fixed: "noon" without a birth time,
+# "local" when the time is known but the place has no time zone, "utc" when only coordinates are missing.
+NO_HOUSES_HEADERS = {
+    "noon": "время неизвестно — расчёт на полдень, Луна ±7°, дома и Асцендент не определены",
+    "local": "время указано, но часовой пояс места неизвестен — расчёт без перевода в UTC, "
+             "Луна ±8°, дома и Асцендент не определены",
+    "utc": "время учтено, координат места нет — дома и Асцендент не определены",
+}
+
+
+@dataclass(slots=True)
+class Chart:
+    positions: np.ndarray
+    retrograde: np.ndarray
+    cusps: np.ndarray | None = None
+    houses: np.ndarray | None = None
+    equal_houses: bool = False
+    timing: str = "noon"
+
+    def position(self, body: str) -> float:
+        return float(self.positions[BODIES.index(body)])
+
+    def sign(self, body: str) -> str:
+        return SIGNS[int(self.position(body) // 30) % 12]
+
+    def summary(self) -> str:
+        if self.cusps is None:
+            header = f"Натальная карта (тропический зодиак; {NO_HOUSES_HEADERS[self.timing]}):"
+        else:
+            system = "равные дома" if self.equal_houses else "дома Плацидус"
+            header = f"Натальная карта (тропический зодиак, {system}):"
+        lines = [header]
+        for index, body in enumerate(BODIES):
+            line = f"{BODY_NAMES[body]} {format_degree(self.positions[index])}"
+            if self.retrograde[index]:
+                line += " R"
+            if self.houses is not None:
+                line += f", {self.houses[index]} дом"
+            lines.append(line)
+        if self.cusps is not None:
+            lines.append(f"ASC {format_degree(self.cusps[0])}; MC {format_degree(self.cusps[9])}")
+        found = aspects(self.positions)[:MAX_ASPECTS]
+        if found:
+            lines.append("Аспекты: " + "; ".join(
+                f"{BODY_NAMES[ASPECT_BODIES[first]]} {ASPECTS[kind][0]} "
+                f"{BODY_NAMES[ASPECT_BODIES[second]]} ({orb:.1f}°)"
+                for first, second, kind, orb in found
+            ))
+        return "\n".join(lines)
+
+
+def birth_day_number(
+    day: datetime.date, time_value: str | None, tz: str | None
+) -> tuple[float, bool]:
+    # The flag is True only when the moment is pinned to UTC; a clock time without a zone is off by up to
+    # a day's worth of Moon motion, no better than noon.
+    hour, minute = map(int, (time_value or "12:00").split(":"))
+    moment = datetime.datetime(day.year, day.month, day.day, hour, minute)
+    if tz:
+        try:
+            moment = moment.replace(tzinfo=ZoneInfo(tz))
+        except ZoneInfoNotFoundError:
+            pass
+    return day_number(moment), time_value is not None and moment.tzinfo is not None
+
+
+def compute_charts(
+    days: np.ndarray,
+    lats: np.ndarray | None = None,
+    lons: np.ndarray | None = None,
+    with_houses: np.ndarray | None = None,
+) -> list[Chart]:
+    days = np.atleast_1d(np.asarray(days, dtype=float))
+    positions, motion = positions_and_motion(days)
+    cusps = houses = polar = None
+    if lats is not None and lons is not None:
+        cusps, polar = house_cusps(days, lats, lons)
+        houses = houses_of(positions, cusps)
+    if with_houses is None:
+        with_houses = np.full(days.shape, cusps is not None)
+    charts = []
+    for index in range(days.size):
+        if cusps is not None and with_houses[index]:
+            charts.append(Chart(
+                positions[:, index],
+                motion[:, index],
+                cusps[:, index],
+                houses[:, index],
+                bool(polar[index]),
+            ))
+        else:
+            charts.append(Chart(positions[:, index], motion[:, index]))
+    return charts
+
+
+def natal_chart(
+    day: datetime.date,
+    time_value: str | None,
+    tz: str | None = None,
+    lat: float | None = None,
+    lon: float | None = None,
+) -> Chart:
+    d, exact = birth_day_number(day, time_value, tz)
+    if lat is None or lon is None:
+        chart = compute_charts([d])[0]
+    else:
+        chart = compute_charts([d], [lat], [lon], [exact])[0]
+    chart.timing = "utc" if exact else "local" if time_value else "noon"
+    return chart
@@ -0,0 +1,217 @@
+import datetime
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+DEFAULT_PATH = Path(__file__).resolve().parent / "data" / "cities.tsv"
+PREFIXES = {"г", "гор", "город", "city", "c", "пгт", "пос", "поселок", "село", "с", "ст", "станица"}
+TRANSLIT = str.maketrans({
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ж": "zh", "з": "z",
+    "и": "i", "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p",
+    "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts", "ч": "ch",
+    "ш": "sh", "щ": "shch", "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+    "і": "i", "ї": "yi", "є": "ye", "ü": "u", "ö": "o", "ä": "a", "é": "e", "è": "e", "ã": "a",
+})
+_SEPARATOR_RE = re.compile(r"[^\w]+")
+_SEGMENT_RE = re.compile(r"[,;/()]+")
+MIN_PREFIX = 3
+MIN_SCORE = 0.4
+# Latin names of the countries in the bundled file, so "Moscow, Russia" still counts as an exact hit.
+COUNTRY_NAMES = {
+    "Россия": "russia,russian federation,rf,рф", "Украина": "ukraine", "Беларусь": "belarus,белоруссия",
+    "США": "usa,us,united states,america", "Казахстан": "kazakhstan", "Турция": "turkey,turkiye",
+    "Китай": "china", "Германия": "germany", "Швейцария": "switzerland", "Узбекистан": "uzbekistan",
+    "Таиланд": "thailand", "Крым": "crimea", "Кипр": "cyprus", "Канада": "canada", "Италия": "italy",
+    "Испания": "spain", "Индия": "india", "Израиль": "israel", "Грузия": "georgia", "Бразилия": "brazil",
+    "Австралия": "australia", "Япония": "japan", "Южная Корея": "south korea,korea", "Эстония": "estonia",
+    "Швеция": "sweden", "Чехия": "czechia,czech republic", "Франция": "france", "Финляндия": "finland",
+    "Туркменистан": "turkmenistan", "Таджикистан": "tajikistan", "Сингапур": "singapore",
+    "Сербия": "serbia", "Румыния": "romania", "Португалия": "portugal", "Польша": "poland",
+    "ОАЭ": "uae,united arab emirates,эмираты", "Норвегия": "norway", "Нидерланды": "netherlands,holland",
+    "Монголия": "mongolia", "Молдова": "moldova", "Мексика": "mexico", "Литва": "lithuania",
+    "Латвия": "latvia", "Кыргызстан": "kyrgyzstan,киргизия", "Иран": "iran", "Индонезия": "indonesia",
+    "Египет": "egypt", "Дания": "denmark", "Греция": "greece", "Венгрия": "hungary",
+    "Великобритания": "uk,united kingdom,great britain,england,англия", "Болгария": "bulgaria",
+    "Бельгия": "belgium", "Армения": "armenia", "Аргентина": "argentina", "Азербайджан": "azerbaijan",
+    "Австрия": "austria",
+}
+
+
+@dataclass(slots=True)
+class Place:
+    name: str
+    country: str
+    lat: float
+    lon: float
+    tz: str
+
+    @property
+    def label(self) -> str:
+        if self.country == self.name:
+            return self.name
+        return f"{self.name}, {self.country}"
+
+    def as_dict(self) -> dict:
+        return {"place": self.label, "lat": self.lat, "lon": self.lon, "tz": self.tz}
+
+
+def normalize(text: str) -> str:
+    words = _SEPARATOR_RE.sub(" ", text.lower().replace("ё", "е")).replace("_", " ").split()
+    while len(words) > 1 and words[0] in PREFIXES:
+        words.pop(0)
+    return " ".join(words)
+
+
+def _trigrams(key: str) -> set[str]:
+    padded = f"  {key} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+def utc_offset(tz: str, day: datetime.date | None, time_value: str | None) -> str | None:
+    if day is None:
+        return None
+    hour, minute = map(int, (time_value or "12:00").split(":"))
+    try:
+        moment = datetime.datetime(day.year, day.month, day.day, hour, minute, tzinfo=ZoneInfo(tz))
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+    total = int(moment.utcoffset().total_seconds()) // 60
+    sign = "-" if total < 0 else "+"
+    hours, minutes = divmod(abs(total), 60)
+    return f"{sign}{hours:02d}:{minutes:02d}"
+
+
+class Gazetteer:
+    def __init__(self, path: str | Path | None = None) -> None:
+        self.path = Path(path) if path else DEFAULT_PATH
+        self.places: list[Place] = []
+        self._exact: dict[str, int] = {}
+        self._keys: list[str] = []
+        self._key_places: list[int] = []
+        self._key_sizes: list[int] = []
+        self._grams: dict[str, list[int]] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self.places)
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if not self._loaded:
+                self._load()
+                self._loaded = True
+
+    def _load(self) -> None:
+        names: dict[str, int] = {}
+        with self.path.open(encoding="utf-8") as handle:
+            for line in handle:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                name, country, lat, lon, tz, aliases = line.rstrip("\n").split("\t")
+                index = len(self.places)
+                self.places.append(Place(name, country, float(lat), float(lon), tz))
+                for alias in (name, *aliases.split(",")):
+                    key = normalize(alias)
+                    if not key:
+                        continue
+                    names.setdefault(key, index)
+                    names.setdefault(key.translate(TRANSLIT), index)
+        self._exact = names
+        self._keys = sorted(names)
+        self._key_places = [names[key] for key in self._keys]
+        for position, key in enumerate(self._keys):
+            grams = _trigrams(key)
+            self._key_sizes.append(len(grams))
+            for gram in grams:
+                self._grams.setdefault(gram, []).append(position)
+
+    def lookup(self, text: str | None) -> Place | None:
+        # Only confident hits: a whole-name or alias match. Prefixes and typos go through suggest().
+        if not text:
+            return None
+        self._ensure_loaded()
+        index = self._find(normalize(text))
+        if index is not None:
+            return self.places[index]
+        segments = self._segments(text)
+        if len(segments) < 2:
+            return None
+        for key in segments:
+            index = self._find(key)
+            # "Paris, Texas" names some other Paris; extra segments may only repeat the country.
+            if index is not None and all(
+                other == key or self._is_country(other, self.places[index].country) for other in segments
+            ):
+                return self.places[index]
+        return None
+
+    def suggest(self, text: str | None) -> Place | None:
+        if not text:
+            return None
+        self._ensure_loaded()
+        keys = [key for key in dict.fromkeys([normalize(text), *self._segments(text)]) if key]
+        # "Ростов" may be Ростов-на-Дону or another Ростов, so a unique prefix is only a suggestion too.
+        for key in keys:
+            index = self._prefix(key)
+            if index is not None:
+                return self.places[index]
+        best_index = None
+        best_score = MIN_SCORE
+        for key in keys:
+            index, score = self._fuzzy(key)
+            if index is not None and score >= best_score:
+                best_index, best_score = index, score
+        return None if best_index is None else self.places[best_index]
+
+    @staticmethod
+    def _segments(text: str) -> list[str]:
+        return [key for key in dict.fromkeys(normalize(part) for part in _SEGMENT_RE.split(text)) if key]
+
+    def _find(self, key: str) -> int | None:
+        if not key:
+            return None
+        index = self._exact.get(key)
+        if index is None:
+            index = self._exact.get(key.translate(TRANSLIT))
+        return index
+
+    def _is_country(self, key: str, country: str) -> bool:
+        names = {normalize(country), *COUNTRY_NAMES.get(country, "").split(",")}
+        return key in names or key.translate(TRANSLIT) in {name.translate(TRANSLIT) for name in names}
+
+    def _prefix(self, key: str) -> int | None:
+        if len(key) < MIN_PREFIX:
+            return None
+        position = bisect_left(self._keys, key)
+        found = None
+        while position < len(self._keys) and self._keys[position].startswith(key):
+            index = self._key_places[position]
+            if found is not None and found != index:
+                return None
+            found = index
+            position += 1
+        return found
+
+    def _fuzzy(self, key: str) -> tuple[int | None, float]:
+        best_position = None
+        best_score = 0.0
+        for variant in {key, key.translate(TRANSLIT)}:
+            grams = _trigrams(variant)
+            hits = Counter()
+            for gram in grams:
+                hits.update(self._grams.get(gram, ()))
+            for position, shared in hits.items():
+                score = shared / (len(grams) + self._key_sizes[position] - shared)
+                if score > best_score:
+                    best_position, best_score = position, score
+        if best_position is None:
+            return None, 0.0
+        return self._key_places[best_position], best_score
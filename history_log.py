@@ -0,0 +1,181 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+
+_STOP = object()
+
+
+class HistoryWriter:
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        queue_size: int = 10000,
+        policy: str = "drop",
+        block_timeout: float = 1.0,
+        max_bytes: int = 0,
+        rotate_interval: float = 0,
+        compress: bool = False,
+        backup_count: int = 7,
+    ) -> None:
+        if policy not in {"drop", "block"}:
+            raise ValueError(f"Unknown history queue policy: {policy}")
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.compress = compress
+        self.backup_count = backup_count
+        self.written = 0
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self._opened_at = time.time()
+
+    def write(self, record: dict) -> None:
+        # The "block" policy waits on the calling thread; code on the event loop uses write_async instead.
+        if not self._accept():
+            return
+        try:
+            if self.policy == "block":
+                self._queue.put(record, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            self._drop()
+
+    async def write_async(self, record: dict) -> None:
+        if not self._accept():
+            return
+        try:
+            self._queue.put_nowait(record)
+            return
+        except queue.Full:
+            if self.policy != "block":
+                self._drop()
+                return
+        try:
+            await asyncio.to_thread(self._queue.put, record, timeout=self.block_timeout)
+        except queue.Full:
+            self._drop()
+
+    def _accept(self) -> bool:
+        if self._closed:
+            self._drop()
+            return False
+        self._ensure_started()
+        return True
+
+    def _drop(self) -> None:
+        self.dropped += 1
+        if self.dropped == 1 or self.dropped % 1000 == 0:
+            reason = "closed" if self._closed else "full"
+            logging.warning("History writer is %s, %s records dropped", reason, self.dropped)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+            self._thread = None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join()
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name="history-writer",
+                    daemon=True,
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        if os.path.exists(self.path):
+            self._opened_at = os.path.getmtime(self.path)
+        else:
+            self._opened_at = time.time()
+        batch: list[dict] = []
+        deadline = time.monotonic() + self.flush_interval
+        stopping = False
+        while not stopping:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                stopping = True
+            elif item is not None:
+                batch.append(item)
+                if len(batch) < self.batch_size:
+                    continue
+            if batch:
+                self._flush(batch)
+                batch = []
+            deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+        if batch:
+            self._flush(batch)
+
+    def _flush(self, batch: list[dict]) -> None:
+        lines = "".join(
+            json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in batch
+        )
+        try:
+            self._maybe_rotate()
+            with open(self.path, "a", encoding="utf-8") as log_file:
+                log_file.write(lines)
+            self.written += len(batch)
+        except OSError:
+            logging.exception("Failed to write %s history records", len(batch))
+
+    def _maybe_rotate(self) -> None:
+        if not os.path.exists(self.path):
+            self._opened_at = time.time()
+            return
+        too_big = self.max_bytes > 0 and os.path.getsize(self.path) >= self.max_bytes
+        too_old = self.rotate_interval > 0 and time.time() - self._opened_at >= self.rotate_interval
+        if not (too_big or too_old):
+            return
+        suffix = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S-%f")
+        rotated = f"{self.path}.{suffix}"
+        os.replace(self.path, rotated)
+        if self.compress:
+            with open(rotated, "rb") as source, gzip.open(f"{rotated}.gz", "wb") as target:
+                shutil.copyfileobj(source, target)
+            os.remove(rotated)
+        self._opened_at = time.time()
+        self._prune_backups()
+
+    def _prune_backups(self) -> None:
+        if self.backup_count <= 0:
+            return
+        directory = os.path.dirname(self.path) or "."
+        prefix = os.path.basename(self.path) + "."
+        backups = sorted(name for name in os.listdir(directory) if name.startswith(prefix))
+        for name in backups[: -self.backup_count]:
+            os.remove(os.path.join(directory, name))
@@ -0,0 +1,137 @@
+import asyncio
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def cache_key(prompt: str, model: str, temperature: float) -> str:
+    normalized = _WHITESPACE_RE.sub(" ", prompt).strip()
+    payload = f"{model}\x00{temperature:.3f}\x00{normalized}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+class ReadingCache:
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 7 * 24 * 3600,
+        db_path: str | None = None,
+        max_disk_entries: int = 50000,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self._memory: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._db: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()
+        self._disk_writes = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+    async def get(self, key: str) -> str | None:
+        value = self._memory_get(key)
+        if value is not None:
+            self.hits += 1
+            self.memory_hits += 1
+            return value
+        if self.db_path:
+            row = await asyncio.to_thread(self._disk_get, key)
+            if row is not None:
+                expires_at, value = row
+                self._memory_set(key, value, expires_at)
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str) -> None:
+        expires_at = time.time() + self.ttl
+        self._memory_set(key, value, expires_at)
+        if self.db_path:
+            await asyncio.to_thread(self._disk_set, key, value, expires_at)
+
+    def close(self) -> None:
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _memory_get(self, key: str) -> str | None:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_set(self, key: str, value: str, expires_at: float) -> None:
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS readings ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS readings_expires_at ON readings (expires_at)"
+            )
+        return self._db
+
+    def _disk_get(self, key: str) -> tuple[float, str] | None:
+        with self._db_lock:
+            row = self._connect().execute(
+                "SELECT expires_at, value FROM readings WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        return row
+
+    def _disk_set(self, key: str, value: str, expires_at: float) -> None:
+        with self._db_lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO readings (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            self._disk_writes += 1
+            if self._disk_writes % 100 == 0:
+                self._prune(db)
+            db.commit()
+
+    def _prune(self, db: sqlite3.Connection) -> None:
+        db.execute("DELETE FROM readings WHERE expires_at <= ?", (time.time(),))
+        db.execute(
+            "DELETE FROM readings WHERE key IN ("
+            "SELECT key FROM readings ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,),
+        )
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from dataclasses import dataclass
+
+MAX_FRAMES = 40
+RECENT_STALLS = 20
+
+
+@dataclass(slots=True)
+class Stall:
+    seconds: float
+    handler: str | None
+    update_id: int | None
+    samples: int
+    stack: str
+
+    def as_dict(self) -> dict:
+        return {
+            "seconds": round(self.seconds, 3),
+            "handler": self.handler,
+            "update_id": self.update_id,
+            "samples": self.samples,
+            "stack": self.stack,
+        }
+
+
+class LoopWatchdog:
+    def __init__(self, threshold: float, interval: float = 0.1, sample_interval: float = 0.01, lag_histogram=None) -> None:
+        self.threshold = threshold
+        self.interval = interval
+        self.sample_interval = sample_interval
+        self.lag_histogram = lag_histogram
+        self.stalls: Counter[str] = Counter()
+        self.stalled_seconds = 0.0
+        self.max_lag = 0.0
+        self.recent: deque[Stall] = deque(maxlen=RECENT_STALLS)
+        self._running: dict[asyncio.Task, tuple[str, int | None]] = {}
+        self._beat = time.monotonic()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread: int | None = None
+        self._heartbeat: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._stopped = threading.Event()
+        # _capture runs in the watchdog thread; readers on the loop thread copy under the same lock.
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._heartbeat = self._loop.create_task(self._beat_forever())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+
+    def enter(self, handler: str, update_id: int | None) -> None:
+        task = asyncio.current_task()
+        if task is not None:
+            self._running[task] = (handler, update_id)
+
+    def leave(self) -> None:
+        self._running.pop(asyncio.current_task(), None)
+
+    def stall_counts(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self.stalls)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stalls = sum(self.stalls.values())
+            stalled_seconds = self.stalled_seconds
+            recent = list(self.recent)[-5:]
+        return {
+            "stalls": stalls,
+            "stalled_s": round(stalled_seconds, 3),
+            "max_lag_s": round(self.max_lag, 3),
+            "recent": [stall.as_dict() for stall in recent],
+        }
+
+    async def _beat_forever(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self._beat = time.monotonic()
+            if lag > self.max_lag:
+                self.max_lag = lag
+            if self.lag_histogram is not None:
+                self.lag_histogram.observe(lag)
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self.interval):
+            beat = self._beat
+            if time.monotonic() - beat > self.interval + self.threshold:
+                self._capture(beat)
+
+    def _capture(self, beat: float) -> None:
+        # Runs in the watchdog thread while the loop is stuck; the loop thread cannot change tasks meanwhile.
+        task = asyncio.current_task(self._loop)
+        handler, update_id = self._running.get(task, (None, None))
+        stacks: Counter[str] = Counter()
+        while self._beat == beat and not self._stopped.is_set():
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is not None:
+                stacks["".join(traceback.format_stack(frame, limit=MAX_FRAMES))] += 1
+            time.sleep(self.sample_interval)
+        seconds = time.monotonic() - beat - self.interval
+        stack, samples = stacks.most_common(1)[0] if stacks else ("", 0)
+        stall = Stall(seconds, handler, update_id, samples, stack)
+        with self._lock:
+            self.recent.append(stall)
+            self.stalls[handler or "unknown"] += 1
+            self.stalled_seconds += seconds
+        logging.warning(
+            "Event loop blocked for %.2fs in %s (update %s), most sampled stack:\n%s",
+            seconds, handler or "no handler", update_id, stack,
+        )
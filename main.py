@@ -1,15 +1,55 @@
 import asyncio
+import functools
+import hmac
 import logging
 import os
-import random
 import re
-from datetime import datetime
-
-from openai import OpenAI
-from telegram import ReplyKeyboardMarkup, ReplyKeyboardRemove, Update
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, ContextTypes, filters
+import signal
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+import httpx
+from openai import (
+    APIConnectionError,
+    AsyncOpenAI,
+    DefaultAsyncHttpxClient,
+    InternalServerError,
+    RateLimitError,
+)
+from telegram import Message, ReplyKeyboardMarkup, ReplyKeyboardRemove, Update
+from telegram.error import BadRequest, RetryAfter, TelegramError
+from telegram.ext import (
+    Application,
+    ApplicationBuilder,
+    CommandHandler,
+    ContextTypes,
+    MessageHandler,
+    filters,
+)
 from telegram.helpers import escape_markdown
 
+from birth_parser import find_time, parse_birth_data
+from concurrency import PerChatUpdateProcessor, RecentKeys, SingleFlight
+from ephemeris import Chart, birth_day_number, natal_chart
+from gazetteer import Gazetteer, utc_offset
+from history_log import HistoryWriter
+from llm_cache import ReadingCache, cache_key
+from loop_watchdog import LoopWatchdog
+from metrics import Registry, TimedHTTPXRequest
+from persistence import RedisStateBackend, SQLiteStateBackend, StatePersistence
+from profiler import UpdateProfiler
+from prompts import Prompt, PromptStats, TokenCounter, assemble
+from resilience import CircuitBreaker, CircuitOpenError, ResilientCaller
+from ratelimit import LocalBuckets, RateLimiter, RedisBuckets, retry_text
+from router import ModelRoute, ModelRouter, parse_prices
+from speculation import SpeculativeTasks
+from synastry import Synastry, synastry
+from templates import PhraseTemplate
+from transits import format_windows, transit_windows
+from webserver import HttpServer, Request, Response
+
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
     level=logging.INFO,
@@ -43,132 +83,510 @@ NATAL_V2_PROMPT = (
     "Стиль — честный, тёплый, с лёгкой иронией и бытовыми деталями, без фраз вроде "
     "«тебя ждёт судьбоносная встреча»."
 )
+CHART_RULE = (
+    "Если в данных есть расчёт карты или транзитов — опирайся только на него, "
+    "не придумывай другие положения планет и даты."
+)
+PASSPORT_SYSTEM = (
+    f"{PERSONA}\n\n"
+    "Сформируй короткий «паспорт карты» в стиле Элайджа. "
+    "Выдай 5–7 буллетов: сильные стороны, слепые зоны, ресурс, вызов роста, "
+    "тема периода, рекомендация и осторожность. "
+    "Добавь короткий вывод в 1-2 предложения. "
+    "Дай CTA: «Хочешь глубже? Выбери расклад», перечисли пакеты. "
+    "Тон мистический, но структурный, без воды. "
+    "Укажи режим точности и дисклеймер.\n"
+    f"{CHART_RULE}"
+)
+NATAL_V2_SYSTEM = (
+    f"{PERSONA}\n\n{NATAL_V2_PROMPT}\n\n"
+    "Сохрани тон Элайджа, но без мистического пафоса — больше человеческой "
+    "реалистичности. В конце короткий дисклеймер, что это не медицинская и не юридическая "
+    "консультация.\n"
+    f"{CHART_RULE}"
+)
+ADDENDUM_SYSTEM = (
+    f"{PERSONA}\n\n"
+    "Пользователь уже получил общий расклад по своей карте. Допиши короткий персональный блок "
+    "под его запрос: 3–4 буллета о том, как карта проявится именно в этой теме, и один "
+    "практический шаг. Обращайся по имени, если оно есть. Не повторяй общий расклад, "
+    "без вступления и дисклеймера.\n"
+    f"{CHART_RULE}"
+)
+COMPATIBILITY_SYSTEM = (
+    f"{PERSONA}\n\n"
+    "Сформируй совместимость отношений в стиле Элайджа. "
+    "Дай 5–7 буллетов: ключ союза, сильная сторона пары, зона напряжения, "
+    "ресурс, что держит связь, рекомендация, следующий шаг. "
+    "Следующий шаг объясни простыми словами, что такое «ритуал поддержки», и дай 2-3 примера. "
+    "Добавь короткий вывод на 1-2 предложения. "
+    "Тон мистический, но структурный, без воды. "
+    "Укажи режимы точности для обоих и дисклеймер.\n"
+    "Ключ союза — ось с наибольшим баллом синастрии, зона напряжения — с наименьшим. "
+    "Не пересчитывай баллы."
+)
 
 OPENAI_MODEL = os.environ.get("OPENAI_MODEL", "gpt-4o-mini")
+OPENAI_TEMPERATURE = 0.7
 HISTORY_LOG_PATH = os.environ.get("HISTORY_LOG_PATH", "history.log")
+HISTORY_BATCH_SIZE = int(os.environ.get("HISTORY_BATCH_SIZE", "100"))
+HISTORY_FLUSH_INTERVAL = float(os.environ.get("HISTORY_FLUSH_INTERVAL", "1.0"))
+HISTORY_QUEUE_SIZE = int(os.environ.get("HISTORY_QUEUE_SIZE", "10000"))
+HISTORY_QUEUE_POLICY = os.environ.get("HISTORY_QUEUE_POLICY", "drop")
+HISTORY_MAX_BYTES = int(os.environ.get("HISTORY_MAX_BYTES", "0"))
+HISTORY_ROTATE_INTERVAL = float(os.environ.get("HISTORY_ROTATE_INTERVAL", "0"))
+HISTORY_COMPRESS = os.environ.get("HISTORY_COMPRESS", "0") == "1"
+HISTORY_BACKUP_COUNT = int(os.environ.get("HISTORY_BACKUP_COUNT", "7"))
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", "60"))
+OPENAI_CONNECT_TIMEOUT = float(os.environ.get("OPENAI_CONNECT_TIMEOUT", "10"))
+OPENAI_MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", "50"))
+OPENAI_MAX_KEEPALIVE = int(os.environ.get("OPENAI_MAX_KEEPALIVE", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.environ.get("OPENAI_KEEPALIVE_EXPIRY", "60"))
+LLM_CACHE_SIZE = int(os.environ.get("LLM_CACHE_SIZE", "1024"))
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH") or None
+LLM_CACHE_DISK_SIZE = int(os.environ.get("LLM_CACHE_DISK_SIZE", "50000"))
+READING_STREAMING = os.environ.get("READING_STREAMING", "1") == "1"
+STREAM_EDIT_INTERVAL = float(os.environ.get("STREAM_EDIT_INTERVAL", "1.5"))
+STREAM_PLACEHOLDER = "🔮 Элайджа читает узоры звёзд…"
+TELEGRAM_TEXT_LIMIT = 4096
+STATE_BACKEND = os.environ.get("STATE_BACKEND", "").lower()
+STATE_SQLITE_PATH = os.environ.get("STATE_SQLITE_PATH", "state.db")
+STATE_REDIS_URL = os.environ.get("STATE_REDIS_URL", "redis://localhost:6379/0")
+STATE_FLUSH_INTERVAL = float(os.environ.get("STATE_FLUSH_INTERVAL", "5"))
+STATE_SHARED = os.environ.get("STATE_SHARED", "0") == "1"
+FLOW_STATE_TTL = float(os.environ.get("FLOW_STATE_TTL", str(24 * 3600)))
+FLOW_STATE_KEYS = (
+    "state",
+    "flow",
+    "compatibility_stage",
+    "compatibility_primary",
+    "pending_data",
+    "pending_profile",
+    "pending_birth_data",
+    "pending_time_request",
+    "reading_mode",
+    "awaiting_action",
+)
+BOT_RUNTIME = os.environ.get("BOT_RUNTIME", "polling").lower()
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "").rstrip("/")
+WEBHOOK_LISTEN = os.environ.get("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT") or os.environ.get("PORT", "8080"))
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/telegram")
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")
+WEBHOOK_DRAIN_TIMEOUT = float(os.environ.get("WEBHOOK_DRAIN_TIMEOUT", "30"))
+UPDATE_CONCURRENCY = int(os.environ.get("UPDATE_CONCURRENCY", "32"))
+UPDATE_BACKLOG = int(os.environ.get("UPDATE_BACKLOG", "1000"))
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "16"))
+GAZETTEER_PATH = os.environ.get("GAZETTEER_PATH") or None
+LLM_DEADLINE = float(os.environ.get("LLM_DEADLINE", "25"))
+LLM_STREAM_DEADLINE = float(os.environ.get("LLM_STREAM_DEADLINE", "90"))
+LLM_RETRIES = int(os.environ.get("LLM_RETRIES", "1"))
+LLM_RETRY_BACKOFF = float(os.environ.get("LLM_RETRY_BACKOFF", "0.5"))
+LLM_HEDGE = os.environ.get("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_MIN_DELAY = float(os.environ.get("LLM_HEDGE_MIN_DELAY", "2"))
+LLM_BREAKER_THRESHOLD = float(os.environ.get("LLM_BREAKER_THRESHOLD", "0.5"))
+LLM_BREAKER_MIN_CALLS = int(os.environ.get("LLM_BREAKER_MIN_CALLS", "10"))
+LLM_BREAKER_WINDOW = int(os.environ.get("LLM_BREAKER_WINDOW", "20"))
+LLM_BREAKER_COOLDOWN = float(os.environ.get("LLM_BREAKER_COOLDOWN", "30"))
+SPECULATIVE_READINGS = os.environ.get("SPECULATIVE_READINGS", "1") == "1"
+SPECULATIVE_MAX_PENDING = int(os.environ.get("SPECULATIVE_MAX_PENDING", "8"))
+SPECULATIVE_TTL = float(os.environ.get("SPECULATIVE_TTL", "600"))
+RATE_LIMIT_USER_PER_MIN = float(os.environ.get("RATE_LIMIT_USER_PER_MIN", "0.5"))
+RATE_LIMIT_USER_BURST = float(os.environ.get("RATE_LIMIT_USER_BURST", "3"))
+RATE_LIMIT_GLOBAL_PER_MIN = float(os.environ.get("RATE_LIMIT_GLOBAL_PER_MIN", "30"))
+RATE_LIMIT_GLOBAL_BURST = float(os.environ.get("RATE_LIMIT_GLOBAL_BURST", "20"))
+RATE_LIMIT_RESERVE = float(os.environ.get("RATE_LIMIT_RESERVE", "5"))
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "").lower()
+RATE_LIMIT_REDIS_URL = os.environ.get("RATE_LIMIT_REDIS_URL", STATE_REDIS_URL)
+RATE_LIMIT_REDIS_TIMEOUT = float(os.environ.get("RATE_LIMIT_REDIS_TIMEOUT", "0.5"))
+METRICS_LISTEN = os.environ.get("METRICS_LISTEN", "0.0.0.0")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+LOOP_WATCHDOG = os.environ.get("LOOP_WATCHDOG", "1") == "1"
+LOOP_STALL_THRESHOLD = float(os.environ.get("LOOP_STALL_THRESHOLD", "0.25"))
+LOOP_WATCHDOG_INTERVAL = float(os.environ.get("LOOP_WATCHDOG_INTERVAL", "0.1"))
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", "0.005"))
+DUPLICATE_CONFIRM_WINDOW = float(os.environ.get("DUPLICATE_CONFIRM_WINDOW", "15"))
+CONFIRM_WORDS = {"да", "верно", "ок", "окей", "yes"}
+# Each state that waits for something keeps it under one user_data key; "birth_data" is the idle state.
+STATE_PAYLOADS = {
+    "action": "awaiting_action",
+    "confirm": "pending_data",
+    "profile": "pending_profile",
+    "exact_time": "pending_time_request",
+    "time_mode": "pending_birth_data",
+}
+# Keyword tables are matched against the lowercased message with "ё" folded into "е".
+STATE_INTENTS = {
+    "consent": {
+        **dict.fromkeys(("согласен", "да", "ok", "ок", "окей"), "agree"),
+        **dict.fromkeys(("не согласен", "нет"), "decline"),
+    },
+    "action": {
+        **dict.fromkeys(("натальная карта", "натальная"), "natal"),
+        **dict.fromkeys(("совместимость", "синастрия"), "compatibility"),
+        **dict.fromkeys(("натальная карта v2", "нотальная карта v2", "натальная v2"), "natal_v2"),
+    },
+    "time_mode": {
+        **dict.fromkeys(("знаю точное время", "точное", "знаю"), "exact"),
+        **dict.fromkeys(("примерно", "примерное"), "approx"),
+        **dict.fromkeys(("не знаю", "нет", "неизвестно"), "no_time"),
+    },
+    "confirm": {
+        **dict.fromkeys(CONFIRM_WORDS, "confirm"),
+        **dict.fromkeys(("исправить", "нет", "неверно"), "correct"),
+    },
+}
+NO_INTENTS: dict[str, str] = {}
+SHORTCUT_STATES = {"birth_data", "time_mode", "exact_time", "profile"}
+COMPATIBILITY_SHORTCUT = re.compile("совместимость|синастрия")
+NATAL_V2_SHORTCUT = re.compile("натальная карта v2|нотальная карта v2")
+LLM_INPUT_BUDGETS = {
+    mode: int(os.environ.get(f"LLM_INPUT_BUDGET_{mode.upper()}", default))
+    for mode, default in (("passport", "1000"), ("natal_v2", "1200"), ("compatibility", "600"), ("addendum", "800"))
+}
+LLM_MAX_TOKENS = {
+    mode: int(os.environ.get(f"LLM_MAX_TOKENS_{mode.upper()}", default))
+    for mode, default in (("passport", "700"), ("natal_v2", "1600"), ("compatibility", "900"), ("addendum", "350"))
+}
+LLM_MODELS = {
+    mode: ModelRoute.parse(os.environ.get(f"LLM_MODEL_{mode.upper()}") or OPENAI_MODEL)
+    for mode in LLM_MAX_TOKENS
+}
+LLM_FALLBACK_MODEL = os.environ.get("LLM_FALLBACK_MODEL", "")
+LLM_DEGRADE_QUEUE = int(os.environ.get("LLM_DEGRADE_QUEUE", "8"))
+LLM_DEGRADE_P95 = float(os.environ.get("LLM_DEGRADE_P95", "20"))
+LLM_PRICES = parse_prices(os.environ.get("LLM_PRICES", ""))
+
+_openai_client: AsyncOpenAI | None = None
+_update_processor = PerChatUpdateProcessor(UPDATE_CONCURRENCY, UPDATE_BACKLOG)
+_llm_slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+_llm_stats = {"in_flight": 0, "waiting": 0}
+_inflight = SingleFlight()
+_router = ModelRouter(
+    LLM_MODELS,
+    ModelRoute.parse(OPENAI_MODEL),
+    ModelRoute.parse(LLM_FALLBACK_MODEL) if LLM_FALLBACK_MODEL else None,
+    max_waiting=LLM_DEGRADE_QUEUE,
+    max_p95=LLM_DEGRADE_P95,
+    prices=LLM_PRICES,
+)
+_extra_clients: dict[str, AsyncOpenAI] = {}
+_speculations = SpeculativeTasks(SPECULATIVE_MAX_PENDING, SPECULATIVE_TTL)
+if RATE_LIMIT_BACKEND not in {"", "memory", "redis"}:
+    raise RuntimeError(f"Unknown RATE_LIMIT_BACKEND: {RATE_LIMIT_BACKEND}")
+_rate_limit_redis = RedisStateBackend(RATE_LIMIT_REDIS_URL) if RATE_LIMIT_BACKEND == "redis" else None
 
-DATE_RE = re.compile(r"(\d{1,2})[./-](\d{1,2})[./-](\d{4})")
-TIME_RE = re.compile(r"\b(\d{1,2}):(\d{2})\b")
-TIME_HINT_RE = re.compile(r"\b(утро|день|вечер|ночь|примерно|±)\b", re.IGNORECASE)
 
-ELEMENTS = ["Огня", "Земли", "Воздуха", "Воды"]
-ARCHETYPES = [
+def _buckets(per_minute: float, burst: float, name: str) -> LocalBuckets | RedisBuckets | None:
+    if per_minute <= 0:
+        return None
+    if _rate_limit_redis is None:
+        return LocalBuckets(per_minute / 60, burst)
+    return RedisBuckets(_rate_limit_redis, per_minute / 60, burst, name, RATE_LIMIT_REDIS_TIMEOUT)
+
+
+_metrics = Registry()
+_handler_seconds = _metrics.histogram(
+    "bot_handler_seconds", "Time spent in an update handler.", ("handler", "outcome")
+)
+_reading_seconds = _metrics.histogram(
+    "bot_reading_seconds", "Time to produce reading text, by source.", ("mode", "outcome")
+)
+_telegram_seconds = _metrics.histogram(
+    "bot_telegram_request_seconds", "Bot API request latency.", ("method", "outcome")
+)
+_metrics_server: HttpServer | None = None
+_application: Application | None = None
+_watchdog = LoopWatchdog(
+    LOOP_STALL_THRESHOLD,
+    LOOP_WATCHDOG_INTERVAL,
+    lag_histogram=_metrics.histogram(
+        "bot_event_loop_lag_seconds",
+        "How late the event loop woke up for a timer.",
+        buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+    ),
+)
+_profiler = UpdateProfiler(PROFILE_SAMPLE_RATE, PROFILE_DIR, PROFILE_INTERVAL)
+READING_MODE_LABELS = {
+    "passport": "natal",
+    "natal_v2": "natal_v2",
+    "compatibility": "compatibility",
+    "addendum": "addendum",
+}
+_rate_limiter = RateLimiter(
+    _buckets(RATE_LIMIT_USER_PER_MIN, RATE_LIMIT_USER_BURST, "user"),
+    _buckets(RATE_LIMIT_GLOBAL_PER_MIN, RATE_LIMIT_GLOBAL_BURST, "global"),
+    RATE_LIMIT_RESERVE,
+)
+_llm = ResilientCaller(
+    CircuitBreaker(LLM_BREAKER_THRESHOLD, LLM_BREAKER_MIN_CALLS, LLM_BREAKER_WINDOW, LLM_BREAKER_COOLDOWN),
+    deadline=LLM_DEADLINE,
+    retries=LLM_RETRIES,
+    backoff=LLM_RETRY_BACKOFF,
+    hedge=LLM_HEDGE,
+    hedge_min_delay=LLM_HEDGE_MIN_DELAY,
+    retry_on=(TimeoutError, APIConnectionError, RateLimitError, InternalServerError),
+)
+_recent_confirmations = RecentKeys(DUPLICATE_CONFIRM_WINDOW)
+_gazetteer = Gazetteer(GAZETTEER_PATH)
+_token_counter = TokenCounter(OPENAI_MODEL)
+_prompt_stats = PromptStats()
+_history_writer = HistoryWriter(
+    HISTORY_LOG_PATH,
+    batch_size=HISTORY_BATCH_SIZE,
+    flush_interval=HISTORY_FLUSH_INTERVAL,
+    queue_size=HISTORY_QUEUE_SIZE,
+    policy=HISTORY_QUEUE_POLICY,
+    max_bytes=HISTORY_MAX_BYTES,
+    rotate_interval=HISTORY_ROTATE_INTERVAL,
+    compress=HISTORY_COMPRESS,
+    backup_count=HISTORY_BACKUP_COUNT,
+)
+_reading_cache = ReadingCache(
+    max_entries=LLM_CACHE_SIZE,
+    ttl=LLM_CACHE_TTL,
+    db_path=LLM_CACHE_PATH,
+    max_disk_entries=LLM_CACHE_DISK_SIZE,
+)
+
+
+ELEMENTS = ("Огня", "Земли", "Воздуха", "Воды")
+ARCHETYPES = (
     "Искатель", "Хранитель", "Творец", "Проводник", "Алхимик", "Странник",
     "Мудрец", "Воин", "Целитель", "Певец", "Звездочёт", "Вдохновитель",
-]
-ASPECTS = [
+)
+ASPECTS = (
     "гармоничное соединение", "тёплая трина", "напряжённая квадратура",
     "зеркальная оппозиция", "исцеляющий секстиль", "тайная конъюнкция",
-]
-HOUSES = [
+)
+HOUSES = (
     "первом доме личности", "втором доме ценностей", "третьем доме общения",
     "четвёртом доме корней", "пятом доме творчества", "шестом доме служения",
     "седьмом доме союзов", "восьмом доме трансформации", "девятом доме пути",
     "десятом доме предназначения", "одиннадцатом доме надежды", "двенадцатом доме тайн",
-]
-STRENGTHS = [
+)
+STRENGTHS = (
     "умение вести за собой без давления",
     "дар чувствовать скрытые мотивы",
     "стойкость в кризисных периодах",
     "способность видеть картину целиком",
     "интуитивный вкус к верным решениям",
-]
-BLIND_SPOTS = [
+)
+BLIND_SPOTS = (
     "склонность держать эмоции под замком",
     "перфекционизм, который крадёт радость",
     "страх показать уязвимость",
     "спешка в принятии важных решений",
-]
-RESOURCES = [
+)
+RESOURCES = (
     "доверие к телесным сигналам и ритуалам заботы",
     "чёткие границы и честный диалог",
     "тишина и уединение как источник силы",
     "работа со смыслом, а не только с результатом",
-]
-CHALLENGES = [
+)
+CHALLENGES = (
     "научиться делегировать и просить поддержку",
     "отпустить устаревшие обещания",
     "смягчить контроль и добавить гибкости",
     "не спорить с чувствами, а слушать их",
-]
-PERIOD_THEMES = [
+)
+STRONG_PERIODS_GOAL = "сильные периоды"
+PERIOD_THEMES = (
     "пересборка личных целей",
     "перезапуск отношений и союзов",
     "рост в карьере через новый навык",
     "расчистка пространства для больших перемен",
-]
-GUIDANCE = [
+)
+GUIDANCE = (
     "Скажи вслух своё намерение — и путь откликнется.",
     "Доверяй медленным решениям: они прочнее быстрых.",
     "Сохрани ритуал тишины хотя бы на один вечер.",
     "Найди союзника, который будет зеркалом твоей силы.",
-]
-CAUTIONS = [
+)
+CAUTIONS = (
     "избегай обещаний, где нет ясных сроков",
     "не игнорируй сигналы усталости",
     "не принимай решения из чувства вины",
     "не откладывай честный разговор",
-]
-V2_FOCUS = [
+)
+V2_FOCUS = (
     "личные границы и чувство опоры",
     "отношения и стиль привязанности",
     "карьерная стратегия и долгий рост",
     "самореализация через творчество",
     "деньги как отражение ценности себя",
-]
-V2_PLANETARY_NOTES = [
+)
+V2_PLANETARY_NOTES = (
     "Солнце задаёт вектор проявления, Луна — базовый эмоциональный ритм.",
     "Венера показывает стиль любви, Марс — способ действовать и защищать своё.",
     "Сатурн требует зрелости, Юпитер расширяет возможности через обучение.",
     "Лунные узлы подсвечивают главную развилку развития.",
-]
-V2_PRACTICES = [
+)
+V2_PRACTICES = (
     "договориться с собой о ритуале отдыха на неделю вперёд",
     "вести дневник решений, чтобы видеть повторяющиеся мотивы",
     "сделать одну честную просьбу о поддержке в ближайшие 7 дней",
     "поставить личную цель на 30 дней и отслеживать прогресс",
-]
-V2_RISKS = [
+)
+V2_RISKS = (
     "задерживаться в знакомых сценариях, даже если они уже тесны",
     "перегорать из-за желания всё контролировать",
     "путать заботу о других с отказом от собственных нужд",
     "срываться в резкость, когда накопилось напряжение",
-]
-V2_PERIOD_TIPS = [
+)
+V2_PERIOD_TIPS = (
     "лучшее время для мягкого ребрендинга себя и своего образа",
     "период, когда важно укреплять финансовые привычки",
     "месяцы, когда отношения требуют ясных договорённостей",
     "окно для обучения и смены профессионального фокуса",
-]
+)
 
-COMPATIBILITY_KEYS = [
+COMPATIBILITY_KEYS = (
     "магнетизм", "доверие", "синхронность", "темп сближения", "общие ценности",
     "эмоциональная безопасность", "пространство свободы", "ритм общения",
-]
-COMPATIBILITY_STRENGTHS = [
+)
+COMPATIBILITY_STRENGTHS = (
     "быстрое ощущение «своего человека»",
     "способность поддерживать друг друга без давления",
     "живой обмен идеями и вдохновением",
     "мягкое проживание кризисов без разрушений",
-]
-COMPATIBILITY_TENSIONS = [
+)
+COMPATIBILITY_TENSIONS = (
     "разные темпы принятия решений",
     "контраст в потребности к свободе",
     "периоды молчания вместо диалога",
     "склонность копить обиды",
-]
-COMPATIBILITY_RESOURCES = [
+)
+COMPATIBILITY_RESOURCES = (
     "ритуал еженедельного разговора о чувствах",
     "планирование совместных целей на 3 месяца",
     "бережные правила для конфликтов",
     "сохранение личного пространства",
-]
-COMPATIBILITY_GUIDANCE = [
+)
+COMPATIBILITY_GUIDANCE = (
     "Главный ключ союза — честность без упрёков.",
     "Договоритесь о границах, прежде чем обсуждать планы.",
     "Сначала — признание чувств, потом решения.",
     "Сила связи растёт через общие ритуалы.",
-]
+)
+
+READING_POOLS = {
+    "element": ELEMENTS,
+    "archetype": ARCHETYPES,
+    "aspect": ASPECTS,
+    "house": HOUSES,
+    "strength": STRENGTHS,
+    "blind_spot": BLIND_SPOTS,
+    "resource": RESOURCES,
+    "challenge": CHALLENGES,
+    "period": PERIOD_THEMES,
+    "guidance": GUIDANCE,
+    "caution": CAUTIONS,
+    "focus": V2_FOCUS,
+    "planetary_note": V2_PLANETARY_NOTES,
+    "practice": V2_PRACTICES,
+    "risk": V2_RISKS,
+    "period_tip": V2_PERIOD_TIPS,
+}
+COMPATIBILITY_POOLS = {
+    "strength": COMPATIBILITY_STRENGTHS,
+    "tension": COMPATIBILITY_TENSIONS,
+    "resource": COMPATIBILITY_RESOURCES,
+    "guidance": COMPATIBILITY_GUIDANCE,
+}
+DEEPER_OPTIONS = (
+    "*Хочешь глубже? Выбери расклад:*\n"
+    "— Личность и предназначение\n"
+    "— Отношения\n"
+    "— Карьера и деньги\n"
+    "— Сильные периоды на 3/6/12 месяцев\n"
+    "— Совместимость (синастрия)\n\n"
+)
+PASSPORT_TEMPLATE = PhraseTemplate(
+    "🪐 *Паспорт карты Элайджа*\n"
+    "{name_line}"
+    "{goal_line}"
+    "_{element}_, архетип *{archetype}*; {aspect} в {house}.\n"
+    "*Режим точности:* {time_mode}.\n"
+    "{time_note}"
+    "*Твой профиль (5–7 тезисов):*\n"
+    "• Сильная сторона: {strength}.\n"
+    "• Слепая зона: {blind_spot}.\n"
+    "• Ресурс: {resource}.\n"
+    "• Вызов роста: {challenge}.\n"
+    "• Тема периода: {period}.\n"
+    "• Рекомендация: {guidance}.\n"
+    "• Осторожность: {caution}.\n\n"
+    "{transit_block}"
+    f"{DEEPER_OPTIONS}"
+    f"_{DISCLAIMER}_",
+    READING_POOLS,
+)
+NATAL_V2_TEMPLATE = PhraseTemplate(
+    "🪐 *Натальная карта v2 — расширенный портрет Элайджа*\n"
+    "{name_line}"
+    "{goal_line}"
+    "_{element}_, архетип *{archetype}*; {aspect} в {house}.\n"
+    "*Фокус разбора:* {focus}.\n"
+    "*Режим точности:* {time_mode}.\n"
+    "{time_note}\n"
+    "*Глубинный профиль:*\n"
+    "• Сильная сторона: {strength}.\n"
+    "• Уязвимость: {blind_spot}.\n"
+    "• Ресурс: {resource}.\n"
+    "• Вызов роста: {challenge}.\n\n"
+    "*Планетарный слой:*\n"
+    "• {planetary_note}\n\n"
+    "*Практика на ближайший период:*\n"
+    "• {practice}.\n"
+    "• Риск периода: {risk}.\n"
+    "• Подсказка времени: {period_tip}.\n\n"
+    "{transit_block}"
+    f"{DEEPER_OPTIONS}"
+    f"_{DISCLAIMER}_",
+    READING_POOLS,
+)
+COMPATIBILITY_TEMPLATE = PhraseTemplate(
+    "💞 *Совместимость Элайджа*\n"
+    "Ключ союза: *{key}*.\n"
+    "*Твои данные:* {primary_mode}.\n"
+    "*Данные партнёра:* {partner_mode}.\n\n"
+    "{note_block}"
+    "*Баланс пары (0–100):* {scores}.\n\n"
+    "*Карта отношений (5–7 тезисов):*\n"
+    "• Сильная сторона пары: {strength}.\n"
+    "• Зона напряжения: {tension}.\n"
+    "• Ресурс союза: {resource}.\n"
+    "• Что держит связь: {bond}.\n"
+    "• Рекомендация: {guidance}.\n"
+    "• Следующий шаг: уточните ожидания и договоритесь о ритуале поддержки — "
+    "это простой повторяющийся способ заботы друг о друге. Например: "
+    "созвон раз в неделю на 20 минут без телефонов, вечер благодарностей по пятницам "
+    "или короткий ритуал «как ты?» перед сном.\n\n"
+    "*Хочешь глубже? Выбери расклад:*\n"
+    "— Совместимость (синастрия)\n"
+    "— Отношения\n"
+    "— Личность и предназначение\n\n"
+    f"_{DISCLAIMER}_",
+    COMPATIBILITY_POOLS,
+)
+TIME_MODE_LABELS = {
+    "exact": "✅ точное время — максимум точности",
+    "approx": "⚠️ примерное время — возможна погрешность",
+    "no_time": "🟡 без времени — без Асцендента и домов",
+    "unknown": "🟡 без времени — без Асцендента и домов",
+}
+MARKDOWN_V1_SPECIALS = frozenset("_*`[")
+TIME_MODE_SHORT = {"exact": "точное", "approx": "примерное", "no_time": "нет", "unknown": "нет"}
+TIME_NOTES = {
+    "no_time": "Асцендент и дома не рассчитаны из-за отсутствия времени.\n",
+    "unknown": "Асцендент и дома не рассчитаны из-за отсутствия времени.\n",
+    "approx": "Точность снижена из-за примерного времени рождения.\n",
+}
 
 CONSENT_KEYBOARD = ReplyKeyboardMarkup(
     [["Согласен", "Не согласен"]],
@@ -209,6 +627,8 @@ ACTION_KEYBOARD = ReplyKeyboardMarkup(
 
 
 def _clear_flow(context: ContextTypes.DEFAULT_TYPE) -> None:
+    context.user_data.pop("state", None)
+    context.user_data.pop("awaiting_action", None)
     context.user_data.pop("flow", None)
     context.user_data.pop("compatibility_stage", None)
     context.user_data.pop("compatibility_primary", None)
@@ -229,157 +649,110 @@ async def _prompt_birth_data(update: Update) -> None:
 
 
 def _extract_birth_data(text: str) -> dict:
-    date_match = DATE_RE.search(text)
-    time_match = TIME_RE.search(text)
-    date_value = None
-    time_value = None
-    time_mode = "unknown"
-
-    if date_match:
-        day, month, year = map(int, date_match.groups())
-        try:
-            date_value = datetime(year, month, day).date()
-        except ValueError:
-            date_value = None
-
-    if time_match:
-        hour, minute = map(int, time_match.groups())
-        if 0 <= hour < 24 and 0 <= minute < 60:
-            time_value = f"{hour:02d}:{minute:02d}"
-            time_mode = "exact"
-    elif TIME_HINT_RE.search(text):
-        time_mode = "approx"
-    elif "не знаю" in text.lower():
-        time_mode = "no_time"
-
-    place_value = _extract_place(text)
-    return {
-        "date": date_value,
-        "time": time_value,
-        "place": place_value,
-        "time_mode": time_mode,
-    }
+    with _profiler.phase("parse"):
+        data = parse_birth_data(text).as_dict()
+        place = _gazetteer.lookup(data["place"])
+        if place is not None:
+            data.update(place.as_dict())
+        elif data["place"]:
+            # A fuzzy hit may be a different city, so it is only offered back to the user.
+            suggestion = _gazetteer.suggest(data["place"])
+            if suggestion is not None:
+                data["place_suggestion"] = suggestion.label
+    return data
+
+
+def _format_place(data: dict) -> str:
+    place_value = data["place"] or "не указан"
+    if not data.get("tz"):
+        return place_value
+    details = f"{data['lat']:.2f}, {data['lon']:.2f}; {data['tz']}"
+    offset = utc_offset(data["tz"], data["date"], data["time"])
+    if offset:
+        details += f", UTC{offset}"
+    return f"{place_value} ({details})"
 
 
-def _build_reading(data: dict, seed_text: str) -> str:
-    if data.get("reading_mode") == "natal_v2":
-        return _build_natal_v2_reading(data, seed_text)
-    rng = random.Random(seed_text)
-    element = rng.choice(ELEMENTS)
-    archetype = rng.choice(ARCHETYPES)
-    aspect = rng.choice(ASPECTS)
-    house = rng.choice(HOUSES)
-    strength = rng.choice(STRENGTHS)
-    blind_spot = rng.choice(BLIND_SPOTS)
-    resource = rng.choice(RESOURCES)
-    challenge = rng.choice(CHALLENGES)
-    period = rng.choice(PERIOD_THEMES)
-    guidance = rng.choice(GUIDANCE)
-    caution = rng.choice(CAUTIONS)
+def _confirmation_place(data: dict) -> str:
+    place_value = _safe_markdown(data["place"]) or "не указан"
+    if data.get("place_suggestion"):
+        suggestion = _safe_markdown(data["place_suggestion"])
+        place_value += f" (не нашёл в справочнике; если это {suggestion}, нажми «Исправить» и напиши так)"
+    return place_value
 
-    time_mode = _format_time_mode(data["time_mode"])
-    time_note = ""
-    if data["time_mode"] in {"no_time", "unknown"}:
-        time_note = "Асцендент и дома не рассчитаны из-за отсутствия времени.\n\n"
-    elif data["time_mode"] == "approx":
-        time_note = "Точность снижена из-за примерного времени рождения.\n\n"
 
-    name_value = _safe_markdown(data.get("name"))
-    goal_value = _safe_markdown(data.get("goal"))
-    name_line = f"*Имя:* {name_value}.\n" if name_value else ""
-    goal_line = f"*Запрос:* {goal_value}.\n" if goal_value else ""
+def _natal_chart(data: dict) -> Chart:
+    return natal_chart(data["date"], data["time"], data.get("tz"), data.get("lat"), data.get("lon"))
+
+
+def _chart_block(data: dict) -> str:
+    if not data["date"]:
+        return ""
+    return _natal_chart(data).summary()
+
+
+def _transit_windows(data: dict) -> str:
+    if not data["date"] or data.get("goal") != STRONG_PERIODS_GOAL:
+        return ""
+    today = datetime.now(timezone.utc).date()
+    return format_windows(transit_windows(_natal_chart(data), today), today)
+
+
+def _transit_block(data: dict) -> str:
+    windows = _transit_windows(data)
+    if not windows:
+        return ""
     return (
-        "🪐 *Паспорт карты Элайджа*\n"
-        f"{name_line}"
-        f"{goal_line}"
-        f"_{element}_, архетип *{archetype}*; {aspect} в {house}.\n"
-        f"*Режим точности:* {time_mode}.\n"
-        f"{time_note}"
-        "*Твой профиль (5–7 тезисов):*\n"
-        f"• Сильная сторона: {strength}.\n"
-        f"• Слепая зона: {blind_spot}.\n"
-        f"• Ресурс: {resource}.\n"
-        f"• Вызов роста: {challenge}.\n"
-        f"• Тема периода: {period}.\n"
-        f"• Рекомендация: {guidance}.\n"
-        f"• Осторожность: {caution}.\n\n"
-        "*Хочешь глубже? Выбери расклад:*\n"
-        "— Личность и предназначение\n"
-        "— Отношения\n"
-        "— Карьера и деньги\n"
-        "— Сильные периоды на 3/6/12 месяцев\n"
-        "— Совместимость (синастрия)\n\n"
-        f"_{DISCLAIMER}_"
+        "Транзиты медленных планет на 12 месяцев (окно орбиса и дата точного аспекта):\n"
+        f"{windows}\n"
+        "Построй раздел «Сильные периоды» по этим окнам: 3, 6 и 12 месяцев, с датами."
     )
 
 
-def _build_natal_v2_reading(data: dict, seed_text: str) -> str:
-    rng = random.Random(seed_text)
-    element = rng.choice(ELEMENTS)
-    archetype = rng.choice(ARCHETYPES)
-    aspect = rng.choice(ASPECTS)
-    house = rng.choice(HOUSES)
-    focus = rng.choice(V2_FOCUS)
-    strength = rng.choice(STRENGTHS)
-    blind_spot = rng.choice(BLIND_SPOTS)
-    resource = rng.choice(RESOURCES)
-    challenge = rng.choice(CHALLENGES)
-    practice = rng.choice(V2_PRACTICES)
-    risk = rng.choice(V2_RISKS)
-    period_tip = rng.choice(V2_PERIOD_TIPS)
-    planetary_note = rng.choice(V2_PLANETARY_NOTES)
+def _transit_reading_block(data: dict) -> str:
+    windows = _transit_windows(data)
+    if not windows:
+        return ""
+    return f"*Сильные периоды:*\n{windows}\n\n"
 
-    time_mode = _format_time_mode(data["time_mode"])
-    time_note = ""
-    if data["time_mode"] in {"no_time", "unknown"}:
-        time_note = "Асцендент и дома не рассчитаны из-за отсутствия времени.\n"
-    elif data["time_mode"] == "approx":
-        time_note = "Точность снижена из-за примерного времени рождения.\n"
 
+def _profile_lines(data: dict) -> dict[str, str]:
     name_value = _safe_markdown(data.get("name"))
     goal_value = _safe_markdown(data.get("goal"))
-    name_line = f"*Имя:* {name_value}.\n" if name_value else ""
-    goal_line = f"*Запрос:* {goal_value}.\n" if goal_value else ""
+    return {
+        "name_line": f"*Имя:* {name_value}.\n" if name_value else "",
+        "goal_line": f"*Запрос:* {goal_value}.\n" if goal_value else "",
+    }
 
-    return (
-        "🪐 *Натальная карта v2 — расширенный портрет Элайджа*\n"
-        f"{name_line}"
-        f"{goal_line}"
-        f"_{element}_, архетип *{archetype}*; {aspect} в {house}.\n"
-        f"*Фокус разбора:* {focus}.\n"
-        f"*Режим точности:* {time_mode}.\n"
-        f"{time_note}\n"
-        "*Глубинный профиль:*\n"
-        f"• Сильная сторона: {strength}.\n"
-        f"• Уязвимость: {blind_spot}.\n"
-        f"• Ресурс: {resource}.\n"
-        f"• Вызов роста: {challenge}.\n\n"
-        "*Планетарный слой:*\n"
-        f"• {planetary_note}\n\n"
-        "*Практика на ближайший период:*\n"
-        f"• {practice}.\n"
-        f"• Риск периода: {risk}.\n"
-        f"• Подсказка времени: {period_tip}.\n\n"
-        "*Хочешь глубже? Выбери расклад:*\n"
-        "— Личность и предназначение\n"
-        "— Отношения\n"
-        "— Карьера и деньги\n"
-        "— Сильные периоды на 3/6/12 месяцев\n"
-        "— Совместимость (синастрия)\n\n"
-        f"_{DISCLAIMER}_"
+
+def _build_reading(data: dict, seed_text: str) -> str:
+    if data.get("reading_mode") == "natal_v2":
+        return _build_natal_v2_reading(data, seed_text)
+    time_note = TIME_NOTES.get(data["time_mode"], "")
+    return PASSPORT_TEMPLATE.render(
+        seed_text,
+        {
+            **_profile_lines(data),
+            "time_mode": _format_time_mode(data["time_mode"]),
+            "time_note": f"{time_note}\n" if time_note else "",
+            "transit_block": _transit_reading_block(data),
+        },
+    )
+
+
+def _build_natal_v2_reading(data: dict, seed_text: str) -> str:
+    return NATAL_V2_TEMPLATE.render(
+        seed_text,
+        {
+            **_profile_lines(data),
+            "time_mode": _format_time_mode(data["time_mode"]),
+            "time_note": TIME_NOTES.get(data["time_mode"], ""),
+            "transit_block": _transit_reading_block(data),
+        },
     )
 
 
 def _build_compatibility_reading(primary: dict, partner: dict, seed_text: str) -> str:
-    rng = random.Random(seed_text)
-    key = rng.choice(COMPATIBILITY_KEYS)
-    strength = rng.choice(COMPATIBILITY_STRENGTHS)
-    tension = rng.choice(COMPATIBILITY_TENSIONS)
-    resource = rng.choice(COMPATIBILITY_RESOURCES)
-    guidance = rng.choice(COMPATIBILITY_GUIDANCE)
-
-    primary_mode = _format_time_mode(primary["time_mode"])
-    partner_mode = _format_time_mode(partner["time_mode"])
     notes = []
     if primary["time_mode"] in {"no_time", "unknown"}:
         notes.append("У тебя режим без времени — точность домов и Асцендента снижена.")
@@ -392,38 +765,21 @@ def _build_compatibility_reading(primary: dict, partner: dict, seed_text: str) -
     if note_block:
         note_block = f"*Точность:*\n{note_block}\n\n"
 
-    return (
-        "💞 *Совместимость Элайджа*\n"
-        f"Ключ союза: *{key}*.\n"
-        f"*Твои данные:* {primary_mode}.\n"
-        f"*Данные партнёра:* {partner_mode}.\n\n"
-        f"{note_block}"
-        "*Карта отношений (5–7 тезисов):*\n"
-        f"• Сильная сторона пары: {strength}.\n"
-        f"• Зона напряжения: {tension}.\n"
-        f"• Ресурс союза: {resource}.\n"
-        f"• Что держит связь: {rng.choice(COMPATIBILITY_KEYS)}.\n"
-        f"• Рекомендация: {guidance}.\n"
-        "• Следующий шаг: уточните ожидания и договоритесь о ритуале поддержки — "
-        "это простой повторяющийся способ заботы друг о друге. Например: "
-        "созвон раз в неделю на 20 минут без телефонов, вечер благодарностей по пятницам "
-        "или короткий ритуал «как ты?» перед сном.\n\n"
-        "*Хочешь глубже? Выбери расклад:*\n"
-        "— Совместимость (синастрия)\n"
-        "— Отношения\n"
-        "— Личность и предназначение\n\n"
-        f"_{DISCLAIMER}_"
+    pair = _synastry(primary, partner)
+    ranked = pair.ranked()
+    return COMPATIBILITY_TEMPLATE.render(
+        seed_text,
+        {
+            "key": ranked[0],
+            "bond": ranked[1],
+            "scores": " · ".join(f"{key} {pair.scores[key]}" for key in COMPATIBILITY_KEYS),
+            "primary_mode": _format_time_mode(primary["time_mode"]),
+            "partner_mode": _format_time_mode(partner["time_mode"]),
+            "note_block": note_block,
+        },
     )
 
 
-def _extract_place(text: str) -> str | None:
-    cleaned = DATE_RE.sub("", text)
-    cleaned = TIME_RE.sub("", cleaned)
-    cleaned = cleaned.replace("не знаю", "").replace("примерно", "")
-    cleaned = cleaned.strip(" ,.-")
-    return cleaned or None
-
-
 def _extract_profile_data(text: str) -> tuple[str | None, str | None]:
     cleaned = text.strip()
     if not cleaned:
@@ -444,8 +800,8 @@ def _normalize_goal(text: str) -> str | None:
         "карьера": "карьера",
         "деньги": "деньги",
         "самореализация": "самореализация",
-        "период": "сильные периоды",
-        "периоды": "сильные периоды",
+        "период": STRONG_PERIODS_GOAL,
+        "периоды": STRONG_PERIODS_GOAL,
         "другое": "другое",
     }
     for key, label in goals.items():
@@ -455,100 +811,108 @@ def _normalize_goal(text: str) -> str | None:
 
 
 def _format_time_mode(time_mode: str) -> str:
-    return {
-        "exact": "✅ точное время — максимум точности",
-        "approx": "⚠️ примерное время — возможна погрешность",
-        "no_time": "🟡 без времени — без Асцендента и домов",
-        "unknown": "🟡 без времени — без Асцендента и домов",
-    }.get(time_mode, "🟡 без времени — без Асцендента и домов")
+    return TIME_MODE_LABELS.get(time_mode, TIME_MODE_LABELS["unknown"])
 
 
 def _safe_markdown(value: str | None) -> str:
     if not value:
         return ""
+    # escape_markdown compiles its pattern on every call; most names and goals have nothing to escape.
+    if MARKDOWN_V1_SPECIALS.isdisjoint(value):
+        return value
     return escape_markdown(value, version=1)
 
 
-def _build_prompt(data: dict) -> str:
-    if data.get("reading_mode") == "natal_v2":
-        return _build_natal_v2_prompt(data)
-    return _build_passport_prompt(data)
+def _build_prompt(data: dict) -> Prompt:
+    with _profiler.phase("prompt"):
+        if data.get("reading_mode") == "natal_v2":
+            return _build_natal_v2_prompt(data)
+        return _build_passport_prompt(data)
 
 
-def _build_passport_prompt(data: dict) -> str:
+def _data_block(data: dict) -> str:
     date_value = data["date"].strftime("%d.%m.%Y") if data["date"] else "не указана"
-    time_value = data["time"] or "не указано"
-    place_value = data["place"] or "не указан"
-    time_mode = _format_time_mode(data["time_mode"])
-    name_value = data.get("name") or "не указано"
-    goal_value = data.get("goal") or "не указан"
-    return (
-        "Сформируй короткий «паспорт карты» в стиле Элайджа. "
-        "Выдай 5–7 буллетов: сильные стороны, слепые зоны, ресурс, вызов роста, "
-        "тема периода, рекомендация и осторожность. "
-        "Добавь короткий вывод в 1-2 предложения. "
-        "Дай CTA: «Хочешь глубже? Выбери расклад», перечисли пакеты. "
-        "Тон мистический, но структурный, без воды. "
-        "Укажи режим точности и дисклеймер."
-        f"\n\nДанные:\nДата рождения: {date_value}\n"
-        f"Время: {time_value}\nМесто: {place_value}\nРежим: {time_mode}\n"
-        f"Имя: {name_value}\nЗапрос: {goal_value}\n"
-    )
+    lines = [
+        "Данные:",
+        f"Дата рождения: {date_value}",
+        f"Время: {data['time'] or 'не указано'}",
+        f"Место: {_format_place(data)}",
+        f"Режим: {_format_time_mode(data['time_mode'])}",
+    ]
+    if data.get("name"):
+        lines.append(f"Имя: {data['name']}")
+    if data.get("goal"):
+        lines.append(f"Запрос: {data['goal']}")
+    return "\n".join(lines)
 
 
-def _build_natal_v2_prompt(data: dict) -> str:
-    date_value = data["date"].strftime("%d.%m.%Y") if data["date"] else "не указана"
-    time_value = data["time"] or "не указано"
-    place_value = data["place"] or "не указан"
-    time_mode = _format_time_mode(data["time_mode"])
-    name_value = data.get("name") or "не указано"
-    goal_value = data.get("goal") or "не указан"
-    return (
-        f"{NATAL_V2_PROMPT}\n\n"
-        f"Данные:\nДата рождения: {date_value}\n"
-        f"Время: {time_value}\n"
-        f"Место: {place_value}\n"
-        f"Режим: {time_mode}\n"
-        f"Имя: {name_value}\n"
-        f"Запрос: {goal_value}\n\n"
-        "Сохрани тон Элайджа, но без мистического пафоса — больше человеческой "
-        "реалистичности. В конце короткий дисклеймер, что это не медицинская и не юридическая "
-        "консультация."
-    )
+def _assemble(mode: str, system: str, sections: list[tuple[str, bool]]) -> Prompt:
+    return assemble(mode, system, sections, _token_counter, LLM_INPUT_BUDGETS[mode], LLM_MAX_TOKENS[mode])
 
 
-def _build_compatibility_prompt(primary: dict, partner: dict) -> str:
-    def format_data(data: dict) -> str:
-        date_value = data["date"].strftime("%d.%m.%Y") if data["date"] else "не указана"
-        time_value = data["time"] or "не указано"
-        place_value = data["place"] or "не указан"
-        time_mode = _format_time_mode(data["time_mode"])
-        return (
-            f"Дата рождения: {date_value}\n"
-            f"Время: {time_value}\n"
-            f"Место: {place_value}\n"
-            f"Режим: {time_mode}\n"
-        )
+def _build_passport_prompt(data: dict) -> Prompt:
+    return _assemble("passport", PASSPORT_SYSTEM, [
+        (_data_block(data), False),
+        (_chart_block(data), False),
+        (_transit_block(data), True),
+    ])
 
-    return (
-        "Сформируй совместимость отношений в стиле Элайджа. "
-        "Дай 5–7 буллетов: ключ союза, сильная сторона пары, зона напряжения, "
-        "ресурс, что держит связь, рекомендация, следующий шаг. "
-        "Следующий шаг объясни простыми словами, что такое «ритуал поддержки», и дай 2-3 примера. "
-        "Добавь короткий вывод на 1-2 предложения. "
-        "Тон мистический, но структурный, без воды. "
-        "Укажи режимы точности для обоих и дисклеймер.\n\n"
-        "Данные человека 1:\n"
-        f"{format_data(primary)}\n"
-        "Данные человека 2:\n"
-        f"{format_data(partner)}"
-    )
+
+def _build_natal_v2_prompt(data: dict) -> Prompt:
+    return _assemble("natal_v2", NATAL_V2_SYSTEM, [
+        (_data_block(data), False),
+        (_chart_block(data), False),
+        (_transit_block(data), True),
+    ])
+
+
+def _build_addendum_prompt(data: dict) -> Prompt:
+    with _profiler.phase("prompt"):
+        return _assemble("addendum", ADDENDUM_SYSTEM, [
+            (_data_block(data), False),
+            (_transit_block(data), False),
+            (_chart_block(data), True),
+        ])
+
+
+def _speculation_base(data: dict) -> dict:
+    return {**data, "name": None, "goal": None}
+
+
+def _personal_block(data: dict, addendum: str | None) -> str:
+    name_value = _safe_markdown(data.get("name"))
+    if addendum is None:
+        return f"*{name_value}*, вот твой расклад." if name_value else ""
+    goal_value = _safe_markdown(data.get("goal"))
+    header = f"*{name_value}, твой запрос — {goal_value}:*" if name_value else f"*Твой запрос — {goal_value}:*"
+    return f"{header}\n{addendum}"
+
+
+def _synastry(primary: dict, partner: dict) -> Synastry:
+    days, exact = zip(*(
+        birth_day_number(data["date"], data["time"], data.get("tz")) for data in (primary, partner)
+    ))
+    return synastry(days, exact)
+
+
+def _build_compatibility_prompt(primary: dict, partner: dict) -> Prompt:
+    with _profiler.phase("prompt"):
+        scores, *details = _synastry(primary, partner).summary().split("\n")
+        modes = (
+            f"Время: 1 {TIME_MODE_SHORT.get(primary['time_mode'], 'нет')}, "
+            f"2 {TIME_MODE_SHORT.get(partner['time_mode'], 'нет')}"
+        )
+        return _assemble(
+            "compatibility",
+            COMPATIBILITY_SYSTEM,
+            [(modes, False), (scores, False), *((line, True) for line in details)],
+        )
 
 
 def _build_confirmation(data: dict) -> str:
     date_value = data["date"].strftime("%d.%m.%Y") if data["date"] else "не указана"
     time_value = data["time"] or "не указано"
-    place_value = _safe_markdown(data["place"]) or "не указан"
+    place_value = _confirmation_place(data)
     time_mode = _format_time_mode(data["time_mode"])
     return (
         "Шаг 4/6 — проверь данные:\n"
@@ -563,7 +927,7 @@ def _build_confirmation(data: dict) -> str:
 def _build_compatibility_confirmation(data: dict, stage_label: str) -> str:
     date_value = data["date"].strftime("%d.%m.%Y") if data["date"] else "не указана"
     time_value = data["time"] or "не указано"
-    place_value = _safe_markdown(data["place"]) or "не указан"
+    place_value = _confirmation_place(data)
     time_mode = _format_time_mode(data["time_mode"])
     return (
         f"Шаг 2/6 — проверь данные ({stage_label}):\n"
@@ -575,7 +939,7 @@ def _build_compatibility_confirmation(data: dict, stage_label: str) -> str:
     )
 
 
-def _log_history(update: Update, action: str, message_text: str | None = None) -> None:
+async def _log_history(update: Update, action: str, message_text: str | None = None) -> None:
     timestamp = datetime.utcnow().isoformat(timespec="seconds")
     user = update.effective_user
     payload = {
@@ -586,47 +950,527 @@ def _log_history(update: Update, action: str, message_text: str | None = None) -
         "action": action,
         "message": message_text,
     }
-    with open(HISTORY_LOG_PATH, "a", encoding="utf-8") as log_file:
-        log_file.write(f"{payload}\n")
+    await _history_writer.write_async(payload)
+
+
+def _create_openai_client(base_url: str | None = None) -> AsyncOpenAI:
+    endpoint = {}
+    if base_url:
+        # Local OpenAI-compatible servers usually ignore the key, but the SDK insists on one.
+        endpoint = {"base_url": base_url, "api_key": os.environ.get("OPENAI_API_KEY") or "local"}
+    return AsyncOpenAI(
+        **endpoint,
+        timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+        max_retries=0,
+        http_client=DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+            ),
+        ),
+    )
+
+
+def _client_for(route: ModelRoute) -> AsyncOpenAI:
+    if route.base_url is None:
+        return _openai_client
+    client = _extra_clients.get(route.base_url)
+    if client is None:
+        client = _extra_clients[route.base_url] = _create_openai_client(route.base_url)
+    return client
+
+
+async def _close_openai_clients() -> None:
+    global _openai_client
+    clients = [*_extra_clients.values(), *([_openai_client] if _openai_client is not None else [])]
+    _extra_clients.clear()
+    _openai_client = None
+    for client in clients:
+        await client.close()
+
+
+def _build_persistence() -> StatePersistence | None:
+    if not STATE_BACKEND:
+        return None
+    if STATE_BACKEND == "sqlite":
+        backend = SQLiteStateBackend(STATE_SQLITE_PATH)
+    elif STATE_BACKEND == "redis":
+        backend = RedisStateBackend(STATE_REDIS_URL)
+    else:
+        raise RuntimeError(f"Unknown STATE_BACKEND: {STATE_BACKEND}")
+    return StatePersistence(
+        backend,
+        update_interval=STATE_FLUSH_INTERVAL,
+        expiring_keys=FLOW_STATE_KEYS,
+        expire_after=FLOW_STATE_TTL,
+        shared=STATE_SHARED,
+    )
 
 
-def _call_openai(prompt: str) -> str:
-    client = OpenAI()
-    completion = client.chat.completions.create(
-        model=OPENAI_MODEL,
-        messages=[
-            {"role": "system", "content": PERSONA},
-            {"role": "user", "content": prompt},
+async def _post_init(app) -> None:
+    global _openai_client, _metrics_server
+    if os.environ.get("OPENAI_API_KEY"):
+        _openai_client = _create_openai_client()
+    if LOOP_WATCHDOG:
+        _watchdog.start()
+    _profiler.start()
+    if METRICS_PORT and BOT_RUNTIME != "webhook":
+        _metrics_server = HttpServer(METRICS_LISTEN, METRICS_PORT)
+        _metrics_server.route("GET", "/metrics", _metrics_endpoint)
+        await _metrics_server.start()
+
+
+async def _post_shutdown(app) -> None:
+    await _watchdog.stop()
+    await _profiler.stop()
+    if _metrics_server is not None:
+        await _metrics_server.stop()
+    await _close_openai_clients()
+    logging.info("LLM cache stats: %s", _reading_cache.stats())
+    _reading_cache.close()
+    await asyncio.to_thread(_history_writer.close)
+    if _rate_limit_redis is not None:
+        await _rate_limit_redis.close()
+
+
+@asynccontextmanager
+async def _llm_slot() -> AsyncIterator[None]:
+    _llm_stats["waiting"] += 1
+    try:
+        await _llm_slots.acquire()
+    finally:
+        _llm_stats["waiting"] -= 1
+    _llm_stats["in_flight"] += 1
+    try:
+        yield
+    finally:
+        _llm_stats["in_flight"] -= 1
+        _llm_slots.release()
+
+
+def _runtime_stats(app: Application) -> dict:
+    return {
+        "update_queue": app.update_queue.qsize(),
+        **_update_processor.stats(),
+        "llm_in_flight": _llm_stats["in_flight"],
+        "llm_waiting": _llm_stats["waiting"],
+        "prompt_tokens": _prompt_stats.stats(),
+        "token_counter": _token_counter.backend,
+        "llm_coalesced": _inflight.coalesced,
+        "llm_abandoned": _inflight.abandoned,
+        "duplicate_confirmations": _recent_confirmations.repeats,
+        "llm_calls_saved": _inflight.coalesced + _recent_confirmations.repeats,
+        "llm": _llm.stats(),
+        "llm_routes": _router.stats(),
+        "speculative": _speculations.stats(),
+        "rate_limit": _rate_limiter.stats(),
+        "event_loop": _watchdog.stats(),
+        "profiler": _profiler.stats(),
+    }
+
+
+def _register_runtime_metrics() -> None:
+    # Registered once at import; collectors read the current globals, so rebuilding the application
+    # (tests, benches) keeps reporting the live one.
+    gauges = {
+        "bot_update_queue": (
+            "Updates received but not yet dispatched.",
+            lambda: _application.update_queue.qsize() if _application is not None else 0,
+        ),
+        "bot_updates_in_flight": ("Updates being handled.", lambda: _update_processor.in_flight),
+        "bot_update_backlog": ("Updates waiting for their chat or a slot.", lambda: _update_processor.queued),
+        "bot_llm_in_flight": ("LLM requests in flight.", lambda: _llm_stats["in_flight"]),
+        "bot_llm_waiting": ("LLM requests waiting for a slot.", lambda: _llm_stats["waiting"]),
+        "bot_llm_circuit_open": ("1 while the LLM circuit breaker rejects calls.", lambda: _llm.breaker.state != "closed"),
+    }
+    for name, (help_text, read) in gauges.items():
+        _metrics.gauge(name, help_text, lambda read=read: [((), float(read()))])
+    _metrics.gauge(
+        "bot_rate_limited_total", "Requests turned away by the rate limiter.",
+        lambda: [
+            (("user",), _rate_limiter.throttled_user),
+            (("global",), _rate_limiter.throttled_global),
+            (("session",), _rate_limiter.throttled_sessions),
+        ],
+        ("reason",), kind="counter",
+    )
+    _metrics.gauge(
+        "bot_llm_calls_saved_total", "LLM calls avoided by coalescing or dropped repeats.",
+        lambda: [
+            (("coalesced",), _inflight.coalesced),
+            (("duplicate_confirmation",), _recent_confirmations.repeats),
         ],
-        temperature=0.7,
+        ("reason",), kind="counter",
     )
-    return completion.choices[0].message.content.strip()
+    _metrics.gauge(
+        "bot_event_loop_stalls_total", "Times the event loop was blocked past LOOP_STALL_THRESHOLD.",
+        lambda: [((handler,), count) for handler, count in _watchdog.stall_counts().items()],
+        ("handler",), kind="counter",
+    )
+    _metrics.gauge(
+        "bot_update_rejected_total", "Updates rejected because the backlog was full.",
+        lambda: [((), _update_processor.rejected)], kind="counter",
+    )
+
+
+_register_runtime_metrics()
+
+
+async def _metrics_endpoint(request: Request) -> Response:
+    return Response(body=_metrics.render().encode("utf-8"), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _instrumented(name: str, handler: Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable[None]]):
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        started = time.perf_counter()
+        outcome = "error"
+        _watchdog.enter(name, update.update_id)
+        profile = _profiler.begin(name, update.update_id)
+        try:
+            await handler(update, context)
+            outcome = "ok"
+        finally:
+            _watchdog.leave()
+            _handler_seconds.labels(name, outcome).observe(time.perf_counter() - started)
+            if profile is not None:
+                await _profiler.finish(profile)
+
+    return wrapper
+
+
+def _observe_reading(mode: str, outcome: str, started: float) -> None:
+    _profiler.note_mode(READING_MODE_LABELS.get(mode, mode))
+    _reading_seconds.labels(READING_MODE_LABELS.get(mode, mode), outcome).observe(time.perf_counter() - started)
+
+
+def _prompt_key(prompt: Prompt) -> str:
+    return cache_key(prompt.text, _router.primary(prompt.mode).label, OPENAI_TEMPERATURE)
+
+
+async def _call_openai(prompt: Prompt) -> str:
+    started = time.perf_counter()
+    key = _prompt_key(prompt)
+    cached = await _reading_cache.get(key)
+    if cached is not None:
+        _observe_reading(prompt.mode, "cache", started)
+        return cached
+    try:
+        with _profiler.phase("llm"):
+            content = await _inflight.do(key, lambda: _complete(prompt, key))
+    except Exception:
+        _observe_reading(prompt.mode, "error", started)
+        raise
+    _observe_reading(prompt.mode, "llm", started)
+    return content
+
+
+async def _complete(prompt: Prompt, key: str) -> str:
+    _prompt_stats.record_prompt(prompt)
+    route = _router.choose(prompt.mode, _llm_stats["waiting"])
+    client = _client_for(route)
+    async with _llm_slot():
+        started = time.perf_counter()
+        completion = await _llm.call(lambda: client.chat.completions.create(
+            model=route.model,
+            messages=prompt.messages(),
+            temperature=OPENAI_TEMPERATURE,
+            max_tokens=prompt.max_tokens,
+        ))
+    _router.record(route, time.perf_counter() - started, completion.usage)
+    _prompt_stats.record_usage(prompt.mode, completion.usage)
+    content = completion.choices[0].message.content.strip()
+    await _cache_reading(prompt, route, key, content)
+    return content
+
+
+async def _cache_reading(prompt: Prompt, route: ModelRoute, key: str, content: str) -> None:
+    # The key names the primary model; a degraded fallback answer must not outlive the overload.
+    if route == _router.primary(prompt.mode):
+        await _reading_cache.set(key, content)
+
+
+def _fallback_reading(data: dict, seed_text: str) -> str:
+    started = time.perf_counter()
+    reading = _build_reading(data, seed_text)
+    _observe_reading(data.get("reading_mode") or "passport", "fallback", started)
+    return reading
+
+
+def _fallback_compatibility_reading(primary: dict, partner: dict, seed_text: str) -> str:
+    started = time.perf_counter()
+    reading = _build_compatibility_reading(primary, partner, seed_text)
+    _observe_reading("compatibility", "fallback", started)
+    return reading
 
 
 async def _generate_reading(data: dict, seed_text: str) -> str:
-    if not os.environ.get("OPENAI_API_KEY"):
-        return _build_reading(data, seed_text)
+    if _openai_client is None:
+        return _fallback_reading(data, seed_text)
     prompt = _build_prompt(data)
     try:
-        return await asyncio.to_thread(_call_openai, prompt)
+        return await _call_openai(prompt)
     except Exception:
-        return _build_reading(data, seed_text)
+        return _fallback_reading(data, seed_text)
 
 
 async def _generate_compatibility_reading(primary: dict, partner: dict, seed_text: str) -> str:
-    if not os.environ.get("OPENAI_API_KEY"):
-        return _build_compatibility_reading(primary, partner, seed_text)
+    if _openai_client is None:
+        return _fallback_compatibility_reading(primary, partner, seed_text)
     prompt = _build_compatibility_prompt(primary, partner)
     try:
-        return await asyncio.to_thread(_call_openai, prompt)
+        return await _call_openai(prompt)
     except Exception:
-        return _build_compatibility_reading(primary, partner, seed_text)
+        return _fallback_compatibility_reading(primary, partner, seed_text)
+
+
+def _partial_markdown(text: str) -> str:
+    complete, _, _ = text.rpartition("\n")
+    if complete:
+        text = complete
+    text = text[: TELEGRAM_TEXT_LIMIT - 2].rstrip()
+    if any(text.count(marker) % 2 for marker in ("*", "_", "`")):
+        text = _safe_markdown(text)
+    return f"{text} …"
+
+
+async def _edit_reading(message: Message, text: str) -> None:
+    try:
+        await message.edit_text(text, parse_mode="Markdown")
+    except BadRequest as exc:
+        if "not modified" in str(exc).lower():
+            return
+        await message.edit_text(text)
+
+
+async def _stream_reading(
+    update: Update,
+    prompt: Prompt,
+    fallback: Callable[[], Awaitable[str]],
+) -> None:
+    started = time.perf_counter()
+    key = _prompt_key(prompt)
+    cached = await _reading_cache.get(key)
+    if cached is not None:
+        _observe_reading(prompt.mode, "cache", started)
+        await update.message.reply_text(
+            cached,
+            parse_mode="Markdown",
+            reply_markup=ReplyKeyboardRemove(),
+        )
+        return
+
+    shared = _inflight.pending(key)
+    if shared is not None:
+        try:
+            with _profiler.phase("llm"):
+                content = await _inflight.wait(shared)
+            _observe_reading(prompt.mode, "llm", started)
+        except Exception:
+            _observe_reading(prompt.mode, "error", started)
+            content = await fallback()
+        await update.message.reply_text(
+            content,
+            parse_mode="Markdown",
+            reply_markup=ReplyKeyboardRemove(),
+        )
+        return
+
+    if _llm.breaker.rejects():
+        _observe_reading(prompt.mode, "error", started)
+        await update.message.reply_text(
+            await fallback(),
+            parse_mode="Markdown",
+            reply_markup=ReplyKeyboardRemove(),
+        )
+        return
+
+    with _inflight.lead(key) as shared:
+        message = await update.message.reply_text(
+            STREAM_PLACEHOLDER,
+            reply_markup=ReplyKeyboardRemove(),
+        )
+        loop = asyncio.get_running_loop()
+        parts: list[str] = []
+        shown = ""
+        next_edit_at = loop.time() + STREAM_EDIT_INTERVAL
+        _prompt_stats.record_prompt(prompt)
+        route = _router.choose(prompt.mode, _llm_stats["waiting"])
+        usage = None
+        admitted = False
+        try:
+            # Partial edits made while the stream runs are profiled as "llm;telegram".
+            with _profiler.phase("llm"):
+                async with _llm_slot(), asyncio.timeout(LLM_STREAM_DEADLINE):
+                    if not _llm.breaker.allow():
+                        raise CircuitOpenError("LLM circuit is open")
+                    admitted = True
+                    llm_started = loop.time()
+                    stream = await _client_for(route).chat.completions.create(
+                        model=route.model,
+                        messages=prompt.messages(),
+                        temperature=OPENAI_TEMPERATURE,
+                        max_tokens=prompt.max_tokens,
+                        stream=True,
+                        stream_options={"include_usage": True},
+                    )
+                    async for chunk in stream:
+                        if chunk.usage is not None:
+                            usage = chunk.usage
+                            _prompt_stats.record_usage(prompt.mode, usage)
+                        if not chunk.choices or not chunk.choices[0].delta.content:
+                            continue
+                        parts.append(chunk.choices[0].delta.content)
+                        if loop.time() < next_edit_at:
+                            continue
+                        partial = _partial_markdown("".join(parts))
+                        if partial == shown:
+                            continue
+                        try:
+                            await message.edit_text(partial, parse_mode="Markdown")
+                            shown = partial
+                        except RetryAfter as exc:
+                            next_edit_at = loop.time() + float(exc.retry_after)
+                            continue
+                        except TelegramError:
+                            logging.warning("Partial reading edit failed", exc_info=True)
+                        next_edit_at = loop.time() + STREAM_EDIT_INTERVAL
+            content = "".join(parts).strip()
+            if not content:
+                raise ValueError("empty completion stream")
+        except BaseException as exc:
+            # Every admitted call settles the breaker, cancellation included, so a half-open probe is released.
+            if admitted:
+                _llm.record_outcome(exc)
+            if not isinstance(exc, Exception):
+                raise
+            _observe_reading(prompt.mode, "error", started)
+            logging.warning("Streaming reading failed, using one-shot path", exc_info=True)
+            shared.set_exception(RuntimeError("streaming reading failed"))
+            await _edit_reading(message, await fallback())
+            return
+
+        _llm.record_outcome(None)
+        _llm.latency.observe(loop.time() - llm_started)
+        _router.record(route, loop.time() - llm_started, usage)
+        _observe_reading(prompt.mode, "llm", started)
+        shared.set_result(content)
+        await _cache_reading(prompt, route, key, content)
+        await _edit_reading(message, content)
+
+
+def _speculate(update: Update, data: dict) -> None:
+    if not SPECULATIVE_READINGS or _openai_client is None or update.effective_chat is None:
+        return
+    if _llm_stats["waiting"]:
+        _speculations.skipped += 1
+        return
+    prompt = _build_prompt(_speculation_base(data))
+    _speculations.start(update.effective_chat.id, _prompt_key(prompt), lambda: _call_openai(prompt))
+
+
+def _take_speculation(update: Update, data: dict) -> asyncio.Task | None:
+    if update.effective_chat is None:
+        return None
+    prompt = _build_prompt(_speculation_base(data))
+    return _speculations.take(update.effective_chat.id, _prompt_key(prompt))
+
+
+async def _reply_speculative(update: Update, data: dict, base: asyncio.Task, seed_text: str) -> None:
+    _profiler.note_mode(READING_MODE_LABELS[data.get("reading_mode") or "passport"])
+    message = await update.message.reply_text(
+        STREAM_PLACEHOLDER,
+        reply_markup=ReplyKeyboardRemove(),
+    )
+    # The goal-specific part is short, so it runs alongside whatever is left of the base reading.
+    addendum = asyncio.ensure_future(_call_openai(_build_addendum_prompt(data))) if data.get("goal") else None
+    try:
+        try:
+            with _profiler.phase("llm"):
+                reading = await base
+        except Exception:
+            logging.warning("Speculative reading failed, generating from scratch", exc_info=True)
+            if addendum is not None:
+                addendum.cancel()
+            await _edit_reading(message, await _generate_reading(data, seed_text))
+            return
+        personal = _personal_block(data, None)
+        if addendum is not None:
+            try:
+                with _profiler.phase("llm"):
+                    addendum_text = await addendum
+                personal = _personal_block(data, addendum_text)
+                reading = f"{reading}\n\n{personal}"
+            except Exception:
+                logging.warning("Reading addendum failed", exc_info=True)
+        elif personal:
+            reading = f"{personal}\n\n{reading}"
+        await _edit_reading(message, reading)
+    finally:
+        if update.effective_chat is not None:
+            _recent_confirmations.refresh(update.effective_chat.id)
+
+
+async def _reply_reading(
+    update: Update,
+    prompt: Prompt,
+    generate: Callable[[], Awaitable[str]],
+) -> None:
+    try:
+        if READING_STREAMING and _openai_client is not None:
+            await _stream_reading(update, prompt, generate)
+            return
+        reading = await generate()
+        await update.message.reply_text(
+            reading,
+            parse_mode="Markdown",
+            reply_markup=ReplyKeyboardRemove(),
+        )
+    finally:
+        # Repeated taps on "Да" queue up behind the reading, so the window counts from its end.
+        if update.effective_chat is not None:
+            _recent_confirmations.refresh(update.effective_chat.id)
+
+
+async def _admit_reading(update: Update) -> bool:
+    user = update.effective_user or update.effective_chat
+    if user is None:
+        return True
+    reason, wait = await _rate_limiter.admit_reading(user.id)
+    if reason is None:
+        return True
+    logging.info("Reading throttled (%s) for %s, retry in %.0fs", reason, user.id, wait)
+    if reason == "user":
+        text = "Звёзды просят передышки: расклады идут один за другим."
+    else:
+        text = "Сейчас ко мне выстроилась очередь искателей."
+    await update.message.reply_text(
+        f"{text} Попробуй через {retry_text(wait)} — данные я сохранил, просто ответь «Да».",
+        reply_markup=CONFIRM_KEYBOARD,
+    )
+    return False
+
+
+async def _admit_session(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    if any(key in context.user_data for key in FLOW_STATE_KEYS):
+        return True
+    wait = await _rate_limiter.admit_session()
+    if not wait:
+        return True
+    await update.message.reply_text(
+        "Сейчас очень много запросов, и я сначала заканчиваю уже начатые расклады. "
+        f"Загляни через {retry_text(wait)}.",
+    )
+    return False
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    _log_history(update, "command:/start")
+    await _log_history(update, "command:/start")
+    if not await _admit_session(update, context):
+        return
     if context.user_data.get("consent"):
-        context.user_data["awaiting_action"] = True
+        _enter(context, "action")
         await update.message.reply_text(
             "С возвращением. Выбери, что нужно посчитать:",
             reply_markup=ACTION_KEYBOARD,
@@ -652,7 +1496,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    _log_history(update, "command:/help")
+    await _log_history(update, "command:/help")
     await update.message.reply_text(
         "Шаг 1/6 — согласие на обработку данных.\n"
         "Ответь: «Согласен» или «Не согласен».\n\n"
@@ -670,7 +1514,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 
 
 async def compatibility_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    _log_history(update, "command:/compatibility")
+    await _log_history(update, "command:/compatibility")
     if not context.user_data.get("consent"):
         await update.message.reply_text(
             "Сначала нужно согласие. Нажми /start, чтобы начать.",
@@ -692,7 +1536,7 @@ async def compatibility_command(update: Update, context: ContextTypes.DEFAULT_TY
 
 
 async def natal_v2_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    _log_history(update, "command:/natal_v2")
+    await _log_history(update, "command:/natal_v2")
     if not context.user_data.get("consent"):
         await update.message.reply_text(
             "Сначала нужно согласие. Нажми /start, чтобы начать.",
@@ -705,8 +1549,10 @@ async def natal_v2_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 
 
 async def delete_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    _log_history(update, "command:/delete")
+    await _log_history(update, "command:/delete")
     context.user_data.clear()
+    if update.effective_chat is not None:
+        _speculations.discard(update.effective_chat.id)
     await update.message.reply_text(
         "Данные сессии удалены. Если захочешь начать заново — напиши /start."
         "\n\nКоманды доступны кнопками ниже.",
@@ -714,221 +1560,199 @@ async def delete_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     )
 
 
-async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    text = update.message.text
-    lower_text = text.lower().strip()
-    _log_history(update, "message", text)
-    pending = context.user_data.get("pending_data")
-    flow = context.user_data.get("flow")
-    stage = context.user_data.get("compatibility_stage")
-    pending_profile = context.user_data.get("pending_profile")
-    pending_birth_data = context.user_data.get("pending_birth_data")
-    pending_time_request = context.user_data.get("pending_time_request")
-    awaiting_action = context.user_data.get("awaiting_action")
+def _flow_state(user_data: dict) -> str:
+    if not user_data.get("consent"):
+        return "consent"
+    state = user_data.get("state")
+    payload = STATE_PAYLOADS.get(state)
+    if state is not None and (payload is None or payload in user_data):
+        return state
+    # Sessions saved before the state key existed, or whose payload expired on its own.
+    state = next((name for name, key in STATE_PAYLOADS.items() if user_data.get(key)), "birth_data")
+    user_data["state"] = state
+    return state
+
+
+def _enter(context: ContextTypes.DEFAULT_TYPE, state: str, payload: object = True) -> None:
+    user_data = context.user_data
+    previous = STATE_PAYLOADS.get(user_data.get("state"))
+    if previous is not None:
+        user_data.pop(previous, None)
+    user_data["state"] = state
+    key = STATE_PAYLOADS.get(state)
+    if key is not None:
+        user_data[key] = payload
+
+
+async def _ask_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE, data: dict) -> None:
+    _enter(context, "confirm", data)
+    if context.user_data.get("flow") == "compatibility":
+        stage_label = "ты" if context.user_data.get("compatibility_stage") == "primary" else "партнёр"
+        text = _build_compatibility_confirmation(data, stage_label)
+    else:
+        text = _build_confirmation(data)
+    await update.message.reply_text(text, parse_mode="Markdown", reply_markup=CONFIRM_KEYBOARD)
 
-    if not context.user_data.get("consent"):
-        if lower_text in {"согласен", "да", "ok", "ок", "окей"}:
-            context.user_data["consent"] = True
-            context.user_data["awaiting_action"] = True
-            await update.message.reply_text(
-                "Согласие получено. Выбери, что нужно посчитать:",
-                reply_markup=ACTION_KEYBOARD,
-            )
-            return
-        if lower_text in {"не согласен", "нет"}:
-            await update.message.reply_text(
-                "Без согласия я не могу продолжить. "
-                "Если передумаешь — напиши «Согласен»."
-            )
-            return
-        if not context.user_data.get("consent_requested"):
-            await update.message.reply_text("Нажми /start, чтобы начать и дать согласие.")
-            return
-        await update.message.reply_text("Я жду ответ: «Согласен» или «Не согласен».")
-        return
 
-    if awaiting_action:
-        normalized = lower_text.replace("ё", "е")
-        if normalized in {"натальная карта", "натальная"}:
-            context.user_data.pop("awaiting_action", None)
-            _clear_flow(context)
-            await update.message.reply_text("Шаг 2/6 — натальная карта.")
-            await _prompt_birth_data(update)
-            return
-        if normalized in {"совместимость", "синастрия"}:
-            context.user_data.pop("awaiting_action", None)
-            await compatibility_command(update, context)
-            return
-        if normalized in {"натальная карта v2", "нотальная карта v2", "натальная v2"}:
-            context.user_data.pop("awaiting_action", None)
-            await natal_v2_command(update, context)
-            return
-        await update.message.reply_text(
-            "Выбери вариант кнопкой ниже.",
-            reply_markup=ACTION_KEYBOARD,
-        )
-        return
+async def _accept_consent(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> None:
+    context.user_data["consent"] = True
+    _enter(context, "action")
+    await update.message.reply_text(
+        "Согласие получено. Выбери, что нужно посчитать:",
+        reply_markup=ACTION_KEYBOARD,
+    )
 
-    if not pending and any(keyword in lower_text for keyword in {"совместимость", "синастрия"}):
-        await compatibility_command(update, context)
-        return
 
-    if not pending and any(keyword in lower_text for keyword in {"натальная карта v2", "нотальная карта v2"}):
-        await natal_v2_command(update, context)
+async def _decline_consent(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> None:
+    await update.message.reply_text(
+        "Без согласия я не могу продолжить. "
+        "Если передумаешь — напиши «Согласен»."
+    )
+
+
+async def _remind_consent(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> None:
+    if not context.user_data.get("consent_requested"):
+        await update.message.reply_text("Нажми /start, чтобы начать и дать согласие.")
         return
+    await update.message.reply_text("Я жду ответ: «Согласен» или «Не согласен».")
+
+
+async def _choose_natal(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> None:
+    _clear_flow(context)
+    await update.message.reply_text("Шаг 2/6 — натальная карта.")
+    await _prompt_birth_data(update)
+
+
+async def _choose_compatibility(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> None:
+    await compatibility_command(update, context)
+
+
+async def _choose_natal_v2(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> None:
+    await natal_v2_command(update, context)
+
+
+async def _repeat_action(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> None:
+    await update.message.reply_text(
+        "Выбери вариант кнопкой ниже.",
+        reply_markup=ACTION_KEYBOARD,
+    )
 
-    if pending and lower_text in {"да", "верно", "ок", "окей", "yes"}:
-        context.user_data.pop("pending_data", None)
-        if flow == "compatibility":
-            if stage == "primary":
-                context.user_data["compatibility_primary"] = pending
-                context.user_data["compatibility_stage"] = "partner"
-                await update.message.reply_text(
-                    "Шаг 3/6 — данные партнёра.\n"
-                    "Отправь дату рождения, время и город партнёра.\n"
-                    "Пример: 02.11.1993 09:10 Санкт-Петербург\n\n"
-                    "Если время неизвестно, напиши «не знаю» или «примерно»."
-                )
-                return
-            if stage == "partner":
-                primary = context.user_data.get("compatibility_primary")
-                context.user_data.pop("compatibility_primary", None)
-                context.user_data.pop("compatibility_stage", None)
-                context.user_data.pop("flow", None)
-                reading = await _generate_compatibility_reading(primary, pending, text)
-                await update.message.reply_text(
-                    reading,
-                    parse_mode="Markdown",
-                    reply_markup=ReplyKeyboardRemove(),
-                )
-                return
-        context.user_data["pending_profile"] = pending
+
+async def _confirm_data(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> None:
+    pending = context.user_data["pending_data"]
+    stage = context.user_data.get("compatibility_stage")
+    compatibility = context.user_data.get("flow") == "compatibility"
+    if not (compatibility and stage == "primary") and not await _admit_reading(update):
+        return
+    if compatibility and stage == "primary":
+        _enter(context, "birth_data")
+        context.user_data["compatibility_primary"] = pending
+        context.user_data["compatibility_stage"] = "partner"
         await update.message.reply_text(
-            "Шаг 5/6 — имя и цель.\n"
-            "Напиши имя (или псевдоним) и цель, например:\n"
-            "Алина, отношения\n\n"
-            "Цели: отношения / карьера / деньги / самореализация / период / другое.",
-            reply_markup=GOAL_KEYBOARD,
+            "Шаг 3/6 — данные партнёра.\n"
+            "Отправь дату рождения, время и город партнёра.\n"
+            "Пример: 02.11.1993 09:10 Санкт-Петербург\n\n"
+            "Если время неизвестно, напиши «не знаю» или «примерно»."
         )
         return
-
-    if pending and lower_text in {"исправить", "нет", "неверно"}:
-        context.user_data.pop("pending_data", None)
-        if flow == "compatibility":
-            await update.message.reply_text(
-                "Шаг 2/6 — отправь данные заново: дата, время, город.\n"
-                "Пример: 12.07.1991 14:25 Москва\n"
-                "Если время неизвестно, напиши «не знаю» или «примерно»."
-            )
-            return
-        await update.message.reply_text(
-            "Шаг 2/6 — отправь данные заново: дата, время, город.\n"
-            "Пример: 12.07.1991 14:25 Москва\n"
-            "Если время неизвестно, напиши «не знаю» или «примерно».",
-            reply_markup=ReplyKeyboardRemove(),
+    if compatibility and stage == "partner":
+        primary = context.user_data.get("compatibility_primary")
+        _clear_flow(context)
+        await _reply_reading(
+            update,
+            _build_compatibility_prompt(primary, pending),
+            lambda: _generate_compatibility_reading(primary, pending, text),
         )
         return
+    _enter(context, "profile", pending)
+    _speculate(update, pending)
+    await update.message.reply_text(
+        "Шаг 5/6 — имя и цель.\n"
+        "Напиши имя (или псевдоним) и цель, например:\n"
+        "Алина, отношения\n\n"
+        "Цели: отношения / карьера / деньги / самореализация / период / другое.",
+        reply_markup=GOAL_KEYBOARD,
+    )
 
-    if pending_profile:
-        context.user_data.pop("pending_profile", None)
-        context.user_data.pop("reading_mode", None)
-        name, goal = _extract_profile_data(text)
-        pending_profile["name"] = name
-        pending_profile["goal"] = goal
-        reading = await _generate_reading(pending_profile, text)
-        await update.message.reply_text(
-            reading,
-            parse_mode="Markdown",
-            reply_markup=ReplyKeyboardRemove(),
-        )
+
+async def _correct_data(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> None:
+    _enter(context, "birth_data")
+    reply = (
+        "Шаг 2/6 — отправь данные заново: дата, время, город.\n"
+        "Пример: 12.07.1991 14:25 Москва\n"
+        "Если время неизвестно, напиши «не знаю» или «примерно»."
+    )
+    if context.user_data.get("flow") == "compatibility":
+        await update.message.reply_text(reply)
         return
+    await update.message.reply_text(reply, reply_markup=ReplyKeyboardRemove())
 
-    if pending_time_request:
-        time_match = TIME_RE.search(text)
-        if not time_match:
-            await update.message.reply_text(
-                "Шаг 3/6 — укажи точное время в формате чч:мм, например 14:25.",
-                reply_markup=TIME_MODE_KEYBOARD,
-            )
-            return
-        hour, minute = map(int, time_match.groups())
-        if not (0 <= hour < 24 and 0 <= minute < 60):
-            await update.message.reply_text(
-                "Шаг 3/6 — время должно быть в пределах суток. Пример: 14:25.",
-                reply_markup=TIME_MODE_KEYBOARD,
-            )
-            return
-        pending_time_request["time"] = f"{hour:02d}:{minute:02d}"
-        pending_time_request["time_mode"] = "exact"
-        context.user_data.pop("pending_time_request", None)
-        context.user_data["pending_data"] = pending_time_request
-        if flow == "compatibility":
-            stage_label = "ты" if stage == "primary" else "партнёр"
-            await update.message.reply_text(
-                _build_compatibility_confirmation(pending_time_request, stage_label),
-                parse_mode="Markdown",
-                reply_markup=CONFIRM_KEYBOARD,
-            )
-            return
+
+async def _receive_profile(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> None:
+    pending_profile = context.user_data["pending_profile"]
+    _clear_flow(context)
+    name, goal = _extract_profile_data(text)
+    pending_profile["name"] = name
+    pending_profile["goal"] = goal
+    base = _take_speculation(update, pending_profile)
+    if base is not None:
+        await _reply_speculative(update, pending_profile, base, text)
+        return
+    await _reply_reading(
+        update,
+        _build_prompt(pending_profile),
+        lambda: _generate_reading(pending_profile, text),
+    )
+
+
+async def _receive_exact_time(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> None:
+    time_value = find_time(text)
+    if time_value is None:
         await update.message.reply_text(
-            _build_confirmation(pending_time_request),
-            parse_mode="Markdown",
-            reply_markup=CONFIRM_KEYBOARD,
+            "Шаг 3/6 — укажи точное время в формате чч:мм, например 14:25.",
+            reply_markup=TIME_MODE_KEYBOARD,
         )
         return
-
-    if pending_birth_data:
-        normalized = lower_text.replace("ё", "е")
-        if normalized in {"знаю точное время", "точное", "знаю"}:
-            context.user_data.pop("pending_birth_data", None)
-            context.user_data["pending_time_request"] = pending_birth_data
-            await update.message.reply_text(
-                "Шаг 3/6 — укажи точное время в формате чч:мм.",
-                reply_markup=ReplyKeyboardRemove(),
-            )
-            return
-        if normalized in {"примерно", "примерное"}:
-            pending_birth_data["time_mode"] = "approx"
-            context.user_data.pop("pending_birth_data", None)
-            context.user_data["pending_data"] = pending_birth_data
-            if flow == "compatibility":
-                stage_label = "ты" if stage == "primary" else "партнёр"
-                await update.message.reply_text(
-                    _build_compatibility_confirmation(pending_birth_data, stage_label),
-                    parse_mode="Markdown",
-                    reply_markup=CONFIRM_KEYBOARD,
-                )
-                return
-            await update.message.reply_text(
-                _build_confirmation(pending_birth_data),
-                parse_mode="Markdown",
-                reply_markup=CONFIRM_KEYBOARD,
-            )
-            return
-        if normalized in {"не знаю", "нет", "неизвестно"}:
-            pending_birth_data["time_mode"] = "no_time"
-            context.user_data.pop("pending_birth_data", None)
-            context.user_data["pending_data"] = pending_birth_data
-            if flow == "compatibility":
-                stage_label = "ты" if stage == "primary" else "партнёр"
-                await update.message.reply_text(
-                    _build_compatibility_confirmation(pending_birth_data, stage_label),
-                    parse_mode="Markdown",
-                    reply_markup=CONFIRM_KEYBOARD,
-                )
-                return
-            await update.message.reply_text(
-                _build_confirmation(pending_birth_data),
-                parse_mode="Markdown",
-                reply_markup=CONFIRM_KEYBOARD,
-            )
-            return
+    hour, minute = time_value
+    if not (0 <= hour < 24 and 0 <= minute < 60):
         await update.message.reply_text(
-            "Шаг 3/6 — выбери режим времени кнопкой ниже.",
+            "Шаг 3/6 — время должно быть в пределах суток. Пример: 14:25.",
             reply_markup=TIME_MODE_KEYBOARD,
         )
         return
+    data = context.user_data["pending_time_request"]
+    data["time"] = f"{hour:02d}:{minute:02d}"
+    data["time_mode"] = "exact"
+    await _ask_confirmation(update, context, data)
+
 
+async def _choose_exact_time(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> None:
+    _enter(context, "exact_time", context.user_data["pending_birth_data"])
+    await update.message.reply_text(
+        "Шаг 3/6 — укажи точное время в формате чч:мм.",
+        reply_markup=ReplyKeyboardRemove(),
+    )
+
+
+async def _choose_time_mode(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    text: str,
+    time_mode: str,
+) -> None:
+    data = context.user_data["pending_birth_data"]
+    data["time_mode"] = time_mode
+    await _ask_confirmation(update, context, data)
+
+
+async def _repeat_time_mode(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> None:
+    await update.message.reply_text(
+        "Шаг 3/6 — выбери режим времени кнопкой ниже.",
+        reply_markup=TIME_MODE_KEYBOARD,
+    )
+
+
+async def _receive_birth_data(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> None:
     data = _extract_birth_data(text)
     if context.user_data.get("reading_mode"):
         data["reading_mode"] = context.user_data["reading_mode"]
@@ -947,7 +1771,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
 
     if data["time_mode"] == "unknown":
-        context.user_data["pending_birth_data"] = data
+        _enter(context, "time_mode", data)
         await update.message.reply_text(
             "Шаг 3/6 — выбери режим времени:\n"
             "✅ «знаю точное время» (например: 14:25)\n"
@@ -957,20 +1781,157 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         return
 
-    context.user_data["pending_data"] = data
-    if flow == "compatibility":
-        stage_label = "ты" if stage == "primary" else "партнёр"
-        await update.message.reply_text(
-            _build_compatibility_confirmation(data, stage_label),
-            parse_mode="Markdown",
-            reply_markup=CONFIRM_KEYBOARD,
-        )
-        return
-    await update.message.reply_text(
-        _build_confirmation(data),
-        parse_mode="Markdown",
-        reply_markup=CONFIRM_KEYBOARD,
+    await _ask_confirmation(update, context, data)
+
+
+FlowHandler = Callable[[Update, ContextTypes.DEFAULT_TYPE, str], Awaitable[None]]
+
+# (state, intent) -> handler; intent None is whatever the state's keyword table did not recognise.
+FLOW_TRANSITIONS: dict[tuple[str, str | None], FlowHandler] = {
+    ("consent", "agree"): _accept_consent,
+    ("consent", "decline"): _decline_consent,
+    ("consent", None): _remind_consent,
+    ("action", "natal"): _choose_natal,
+    ("action", "compatibility"): _choose_compatibility,
+    ("action", "natal_v2"): _choose_natal_v2,
+    ("action", None): _repeat_action,
+    ("birth_data", None): _receive_birth_data,
+    ("time_mode", "exact"): _choose_exact_time,
+    ("time_mode", "approx"): functools.partial(_choose_time_mode, time_mode="approx"),
+    ("time_mode", "no_time"): functools.partial(_choose_time_mode, time_mode="no_time"),
+    ("time_mode", None): _repeat_time_mode,
+    ("exact_time", None): _receive_exact_time,
+    ("confirm", "confirm"): _confirm_data,
+    ("confirm", "correct"): _correct_data,
+    ("confirm", None): _receive_birth_data,
+    ("profile", None): _receive_profile,
+}
+
+
+async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    text = update.message.text
+    lower_text = text.lower().strip()
+    await _log_history(update, "message", text)
+    state = _flow_state(context.user_data)
+    intent = STATE_INTENTS.get(state, NO_INTENTS).get(lower_text.replace("ё", "е"))
+
+    if state in SHORTCUT_STATES:
+        if COMPATIBILITY_SHORTCUT.search(lower_text):
+            await compatibility_command(update, context)
+            return
+        if NATAL_V2_SHORTCUT.search(lower_text):
+            await natal_v2_command(update, context)
+            return
+
+    if lower_text in CONFIRM_WORDS and state != "consent" and state != "action" and update.effective_chat is not None:
+        if state == "confirm":
+            _recent_confirmations.mark(update.effective_chat.id)
+        elif _recent_confirmations.is_repeat(update.effective_chat.id):
+            logging.info("Ignoring repeated confirmation in chat %s", update.effective_chat.id)
+            return
+
+    await FLOW_TRANSITIONS[(state, intent)](update, context, text)
+
+
+def _build_webhook_server(app: Application, draining: asyncio.Event) -> HttpServer:
+    server = HttpServer(WEBHOOK_LISTEN, WEBHOOK_PORT)
+
+    async def webhook(request: Request) -> Response:
+        if draining.is_set():
+            return Response(status=503, body=b"draining")
+        if WEBHOOK_SECRET:
+            token = request.headers.get("x-telegram-bot-api-secret-token", "")
+            if not hmac.compare_digest(token, WEBHOOK_SECRET):
+                return Response(status=403, body=b"forbidden")
+        try:
+            update = Update.de_json(request.json(), app.bot)
+        except ValueError:
+            return Response(status=400, body=b"bad update")
+        if update is None:
+            return Response(status=400, body=b"bad update")
+        await app.update_queue.put(update)
+        return Response(body=b"ok")
+
+    async def health(request: Request) -> Response:
+        payload = {
+            "status": "draining" if draining.is_set() else "ok",
+            **_runtime_stats(app),
+        }
+        return Response.json(payload, status=503 if draining.is_set() else 200)
+
+    server.route("POST", WEBHOOK_PATH, webhook)
+    server.route("GET", "/healthz", health)
+    server.route("GET", "/metrics", _metrics_endpoint)
+    return server
+
+
+async def _run_webhook(app: Application) -> None:
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    draining = asyncio.Event()
+    server = _build_webhook_server(app, draining)
+
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    try:
+        await app.start()
+        await server.start()
+        if WEBHOOK_URL:
+            await app.bot.set_webhook(
+                url=f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET or None,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        elif not WEBHOOK_SECRET:
+            logging.warning("WEBHOOK_SECRET is not set, webhook requests are not verified")
+        await stop.wait()
+
+        logging.info("Draining %s pending updates", app.update_queue.qsize())
+        draining.set()
+        try:
+            await asyncio.wait_for(app.update_queue.join(), WEBHOOK_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logging.warning("Drain timed out, %s updates dropped", app.update_queue.qsize())
+        await server.stop()
+        await app.stop()
+        if app.post_stop:
+            await app.post_stop(app)
+    finally:
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+
+
+def _build_application(token: str) -> Application:
+    global _application
+    builder = (
+        ApplicationBuilder()
+        .token(token)
+        .post_init(_post_init)
+        .post_shutdown(_post_shutdown)
+        .concurrent_updates(_update_processor)
+        .request(TimedHTTPXRequest(_telegram_seconds, _profiler.phase, connection_pool_size=256))
     )
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(f"{TELEGRAM_API_URL}/bot").base_file_url(
+            f"{TELEGRAM_API_URL}/file/bot"
+        )
+    persistence = _build_persistence()
+    if persistence is not None:
+        builder = builder.persistence(persistence)
+    app = builder.build()
+    _application = app
+
+    app.add_handler(CommandHandler("start", _instrumented("start", start)))
+    app.add_handler(CommandHandler("help", _instrumented("help", help_command)))
+    app.add_handler(CommandHandler("compatibility", _instrumented("compatibility", compatibility_command)))
+    app.add_handler(CommandHandler("natal_v2", _instrumented("natal_v2", natal_v2_command)))
+    app.add_handler(CommandHandler("delete", _instrumented("delete", delete_command)))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, _instrumented("message", handle_message)))
+    return app
 
 
 def main() -> None:
@@ -978,16 +1939,13 @@ def main() -> None:
     if not token:
         raise RuntimeError("BOT_TOKEN environment variable is required")
 
-    app = ApplicationBuilder().token(token).build()
-
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("help", help_command))
-    app.add_handler(CommandHandler("compatibility", compatibility_command))
-    app.add_handler(CommandHandler("natal_v2", natal_v2_command))
-    app.add_handler(CommandHandler("delete", delete_command))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-
-    app.run_polling()
+    app = _build_application(token)
+    if BOT_RUNTIME == "webhook":
+        asyncio.run(_run_webhook(app))
+    elif BOT_RUNTIME == "polling":
+        app.run_polling()
+    else:
+        raise RuntimeError(f"Unknown BOT_RUNTIME: {BOT_RUNTIME}")
 
 
 if __name__ == "__main__":
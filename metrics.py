@@ -0,0 +1,181 @@
+import bisect
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterable
+from contextlib import AbstractContextManager, nullcontext
+
+from telegram.request import HTTPXRequest
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+Sample = tuple[tuple[str, ...], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+
+
+class LabelledMetric(Metric, ABC):
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help_text, labelnames)
+        self._children: dict[tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        # Children are created once per label set; after that a lookup is a single dict hit.
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            child = self._children[values] = self._child()
+        return child
+
+    @abstractmethod
+    def _child(self):
+        ...
+
+
+class Histogram(LabelledMetric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.buckets = buckets
+
+    def _child(self) -> HistogramChild:
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def render(self) -> Iterable[str]:
+        yield from super().render()
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), child.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                labels = _labels(self.labelnames, values, f'le="{le}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, values)} {child.sum:.6f}"
+            yield f"{self.name}_count{_labels(self.labelnames, values)} {child.count}"
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        collect: Callable[[], Iterable[Sample]],
+        labelnames: tuple[str, ...] = (),
+        kind: str = "gauge",
+    ) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.collect = collect
+        self.kind = kind
+
+    def render(self) -> Iterable[str]:
+        yield from super().render()
+        for values, value in self.collect():
+            yield f"{self.name}{_labels(self.labelnames, values)} {value:g}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(
+        self,
+        name: str,
+        help_text: str,
+        collect: Callable[[], Iterable[Sample]],
+        labelnames: tuple[str, ...] = (),
+        kind: str = "gauge",
+    ) -> Gauge:
+        return self._register(Gauge(name, help_text, collect, labelnames, kind))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class TimedHTTPXRequest(HTTPXRequest):
+    def __init__(
+        self,
+        histogram: Histogram,
+        phase: Callable[[str], AbstractContextManager] | None = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.histogram = histogram
+        self.phase = phase
+
+    async def do_request(self, url: str, method: str, *args, **kwargs) -> tuple[int, bytes]:
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            with self.phase("telegram") if self.phase is not None else nullcontext():
+                code, payload = await super().do_request(url, method, *args, **kwargs)
+            outcome = "ok" if code < 400 else "error"
+            return code, payload
+        finally:
+            self.histogram.labels(url.rsplit("/", 1)[-1], outcome).observe(time.perf_counter() - started)
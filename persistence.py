@@ -0,0 +1,446 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from datetime import date
+from urllib.parse import urlparse
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+TOUCHED_KEY = "__touched__"
+
+# Fields are stored as "<updated_at>|<value>"; the check and delete run together so a fresh write is never lost.
+PURGE_SCRIPT = """
+local cutoff = tonumber(ARGV[1])
+local removed = 0
+for _, key in ipairs(KEYS) do
+  for i = 2, #ARGV do
+    local packed = redis.call('HGET', key, ARGV[i])
+    if packed then
+      local updated = tonumber(string.match(packed, '^[^|]*'))
+      if updated and updated < cutoff then
+        redis.call('HDEL', key, ARGV[i])
+        removed = removed + 1
+      end
+    end
+  end
+end
+return removed
+"""
+
+
+def _encode_default(value: object) -> object:
+    if isinstance(value, date):
+        return {"$d": value.toordinal()}
+    raise TypeError(f"Cannot persist value of type {type(value).__name__}")
+
+
+def _decode_hook(value: dict) -> object:
+    if len(value) == 1 and "$d" in value:
+        return date.fromordinal(value["$d"])
+    return value
+
+
+def dumps(value: object) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_encode_default)
+
+
+def loads(raw: str) -> object:
+    return json.loads(raw, object_hook=_decode_hook)
+
+
+class SQLiteStateBackend:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._db: sqlite3.Connection | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS user_state ("
+                "user_id INTEGER NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "updated_at REAL NOT NULL, PRIMARY KEY (user_id, key))"
+            )
+        return self._db
+
+    async def load_all(self) -> dict[int, dict[str, tuple[str, float]]]:
+        return await asyncio.to_thread(self._load, None)
+
+    async def load_user(self, user_id: int) -> dict[str, tuple[str, float]]:
+        return (await asyncio.to_thread(self._load, user_id)).get(user_id, {})
+
+    async def write(self, changes: dict[int, tuple[dict[str, str], set[str]]], now: float) -> None:
+        await asyncio.to_thread(self._write, changes, now)
+
+    async def drop_user(self, user_id: int) -> None:
+        await asyncio.to_thread(self._drop, user_id)
+
+    async def purge_expired(self, keys: tuple[str, ...], cutoff: float) -> None:
+        await asyncio.to_thread(self._purge, keys, cutoff)
+
+    async def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _load(self, user_id: int | None) -> dict[int, dict[str, tuple[str, float]]]:
+        query = "SELECT user_id, key, value, updated_at FROM user_state"
+        params: tuple = ()
+        if user_id is not None:
+            query += " WHERE user_id = ?"
+            params = (user_id,)
+        result: dict[int, dict[str, tuple[str, float]]] = {}
+        for row_user_id, key, value, updated_at in self._connect().execute(query, params):
+            result.setdefault(row_user_id, {})[key] = (value, updated_at)
+        return result
+
+    def _write(self, changes: dict[int, tuple[dict[str, str], set[str]]], now: float) -> None:
+        db = self._connect()
+        with db:
+            for user_id, (upserts, deletes) in changes.items():
+                db.executemany(
+                    "INSERT OR REPLACE INTO user_state (user_id, key, value, updated_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    [(user_id, key, value, now) for key, value in upserts.items()],
+                )
+                db.executemany(
+                    "DELETE FROM user_state WHERE user_id = ? AND key = ?",
+                    [(user_id, key) for key in deletes],
+                )
+
+    def _drop(self, user_id: int) -> None:
+        db = self._connect()
+        with db:
+            db.execute("DELETE FROM user_state WHERE user_id = ?", (user_id,))
+
+    def _purge(self, keys: tuple[str, ...], cutoff: float) -> None:
+        if not keys:
+            return
+        db = self._connect()
+        placeholders = ", ".join("?" for _ in keys)
+        with db:
+            db.execute(
+                f"DELETE FROM user_state WHERE key IN ({placeholders}) AND updated_at < ?",
+                (*keys, cutoff),
+            )
+
+
+class RedisStateBackend:
+    def __init__(self, url: str, prefix: str = "elaidji") -> None:
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.prefix = prefix
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._lock = asyncio.Lock()
+
+    def _user_key(self, user_id: int) -> str:
+        return f"{self.prefix}:user:{user_id}"
+
+    async def _connect(self) -> None:
+        if self._writer is not None and not self._writer.is_closing():
+            return
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._roundtrip([("AUTH", self.password)])
+        if self.db:
+            await self._roundtrip([("SELECT", str(self.db))])
+
+    async def execute(self, *commands: tuple) -> list:
+        async with self._lock:
+            try:
+                await self._connect()
+                return await self._roundtrip(list(commands))
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self._writer = None
+                raise
+            except (asyncio.CancelledError, TimeoutError):
+                # A cancelled round trip may leave replies unread (or AUTH unsent), so start over next time.
+                await self.close()
+                raise
+
+    async def _roundtrip(self, commands: list[tuple]) -> list:
+        payload = bytearray()
+        for command in commands:
+            payload += b"*%d\r\n" % len(command)
+            for part in command:
+                encoded = str(part).encode("utf-8")
+                payload += b"$%d\r\n%s\r\n" % (len(encoded), encoded)
+        self._writer.write(bytes(payload))
+        await self._writer.drain()
+        replies = [await self._read_reply() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RuntimeError):
+                raise reply
+        return replies
+
+    async def _read_reply(self) -> object:
+        line = await self._reader.readuntil(b"\r\n")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode("utf-8")
+        if kind == b"-":
+            return RuntimeError(f"Redis error: {body.decode('utf-8')}")
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2].decode("utf-8")
+        if kind == b"*":
+            length = int(body)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise RuntimeError(f"Unexpected Redis reply: {line!r}")
+
+    @staticmethod
+    def _unpack(fields: list) -> dict[str, tuple[str, float]]:
+        result = {}
+        for key, packed in zip(fields[::2], fields[1::2]):
+            updated_at, _, value = packed.partition("|")
+            result[key] = (value, float(updated_at))
+        return result
+
+    async def load_all(self) -> dict[int, dict[str, tuple[str, float]]]:
+        result = {}
+        cursor = "0"
+        pattern = f"{self.prefix}:user:*"
+        while True:
+            (reply,) = await self.execute(("SCAN", cursor, "MATCH", pattern, "COUNT", "500"))
+            cursor, keys = reply
+            if keys:
+                replies = await self.execute(*[("HGETALL", key) for key in keys])
+                for key, fields in zip(keys, replies):
+                    result[int(key.rsplit(":", 1)[1])] = self._unpack(fields)
+            if cursor == "0":
+                return result
+
+    async def load_user(self, user_id: int) -> dict[str, tuple[str, float]]:
+        (fields,) = await self.execute(("HGETALL", self._user_key(user_id)))
+        return self._unpack(fields)
+
+    async def write(self, changes: dict[int, tuple[dict[str, str], set[str]]], now: float) -> None:
+        commands = []
+        for user_id, (upserts, deletes) in changes.items():
+            key = self._user_key(user_id)
+            if upserts:
+                fields = []
+                for field, value in upserts.items():
+                    fields += [field, f"{now:.3f}|{value}"]
+                commands.append(("HSET", key, *fields))
+            if deletes:
+                commands.append(("HDEL", key, *deletes))
+        if commands:
+            await self.execute(*commands)
+
+    async def drop_user(self, user_id: int) -> None:
+        await self.execute(("DEL", self._user_key(user_id)))
+
+    async def purge_expired(self, keys: tuple[str, ...], cutoff: float) -> None:
+        if not keys:
+            return
+        cursor = "0"
+        pattern = f"{self.prefix}:user:*"
+        while True:
+            (reply,) = await self.execute(("SCAN", cursor, "MATCH", pattern, "COUNT", "500"))
+            cursor, user_keys = reply
+            if user_keys:
+                await self.execute(("EVAL", PURGE_SCRIPT, str(len(user_keys)), *user_keys, repr(cutoff), *keys))
+            if cursor == "0":
+                return
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class StatePersistence(BasePersistence):
+    def __init__(
+        self,
+        backend: SQLiteStateBackend | RedisStateBackend,
+        update_interval: float = 5,
+        expiring_keys: tuple[str, ...] = (),
+        expire_after: float = 0,
+        shared: bool = False,
+    ) -> None:
+        super().__init__(
+            store_data=PersistenceInput(
+                bot_data=False,
+                chat_data=False,
+                user_data=True,
+                callback_data=False,
+            ),
+            update_interval=update_interval,
+        )
+        self.backend = backend
+        self.expiring_keys = expiring_keys
+        self.expire_after = expire_after
+        self.shared = shared
+        self.flushed_keys = 0
+        self.expired_flows = 0
+        self._snapshots: dict[int, dict[str, str]] = {}
+        self._synced_at: dict[int, float] = {}
+        self._last_seen: dict[int, float] = {}
+        self._pending: dict[int, tuple[dict[str, str], set[str]]] = {}
+        self._write_lock = asyncio.Lock()
+        self._last_purge = 0.0
+
+    def _is_expired(self, updated_at: float, now: float) -> bool:
+        return self.expire_after > 0 and now - updated_at > self.expire_after
+
+    def _decode_user(self, user_id: int, rows: dict[str, tuple[str, float]], now: float) -> dict:
+        data = {}
+        snapshot = {}
+        for key, (raw, updated_at) in rows.items():
+            if key == TOUCHED_KEY:
+                continue
+            if key in self.expiring_keys and self._is_expired(updated_at, now):
+                self.expired_flows += 1
+                continue
+            snapshot[key] = raw
+            data[key] = loads(raw)
+        self._snapshots[user_id] = snapshot
+        touched = rows.get(TOUCHED_KEY)
+        self._synced_at[user_id] = touched[1] if touched else now
+        self._last_seen[user_id] = self._synced_at[user_id]
+        return data
+
+    async def get_user_data(self) -> dict[int, dict]:
+        now = time.time()
+        rows = await self.backend.load_all()
+        return {user_id: self._decode_user(user_id, fields, now) for user_id, fields in rows.items()}
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        now = time.time()
+        if self.shared and user_id not in self._pending and self._is_clean(user_id, user_data):
+            try:
+                rows = await self.backend.load_user(user_id)
+            except Exception:
+                logging.warning("Failed to refresh state for user %s", user_id, exc_info=True)
+                rows = {}
+            touched = rows.get(TOUCHED_KEY)
+            if touched and touched[1] > self._synced_at.get(user_id, 0):
+                user_data.clear()
+                user_data.update(self._decode_user(user_id, rows, now))
+        last_seen = self._last_seen.get(user_id)
+        if last_seen is not None and self._is_expired(last_seen, now):
+            for key in self.expiring_keys:
+                if user_data.pop(key, None) is not None:
+                    self.expired_flows += 1
+        self._last_seen[user_id] = now
+
+    def _is_clean(self, user_id: int, user_data: dict) -> bool:
+        snapshot = self._snapshots.get(user_id, {})
+        if snapshot.keys() != user_data.keys():
+            return False
+        try:
+            return all(dumps(value) == snapshot[key] for key, value in user_data.items())
+        except TypeError:
+            return False
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        snapshot = self._snapshots.setdefault(user_id, {})
+        upserts = {}
+        for key, value in data.items():
+            try:
+                raw = dumps(value)
+            except TypeError:
+                logging.warning("Skipping non-serializable user_data key %r", key)
+                continue
+            if snapshot.get(key) != raw:
+                upserts[key] = raw
+        deletes = set(snapshot) - set(data)
+        if not upserts and not deletes:
+            return
+        snapshot.update(upserts)
+        for key in deletes:
+            snapshot.pop(key, None)
+        pending_upserts, pending_deletes = self._pending.setdefault(user_id, ({}, set()))
+        pending_upserts.update(upserts)
+        pending_deletes.difference_update(upserts)
+        for key in deletes:
+            pending_upserts.pop(key, None)
+        pending_deletes.update(deletes)
+        await asyncio.sleep(0)
+        await self._write_pending()
+
+    async def _write_pending(self) -> None:
+        async with self._write_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            now = time.time()
+            for upserts, _ in batch.values():
+                upserts[TOUCHED_KEY] = "1"
+            try:
+                await self.backend.write(batch, now)
+            except Exception:
+                logging.exception("Failed to persist state for %s users", len(batch))
+                for user_id, (upserts, deletes) in batch.items():
+                    upserts.pop(TOUCHED_KEY, None)
+                    pending_upserts, pending_deletes = self._pending.setdefault(
+                        user_id, ({}, set())
+                    )
+                    for key, value in upserts.items():
+                        pending_upserts.setdefault(key, value)
+                    pending_deletes.update(deletes - set(pending_upserts))
+                return
+            for user_id, (upserts, _) in batch.items():
+                self._synced_at[user_id] = now
+                self.flushed_keys += len(upserts) - 1
+            if self.expire_after > 0 and now - self._last_purge > self.expire_after:
+                self._last_purge = now
+                await self.backend.purge_expired(self.expiring_keys, now - self.expire_after)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._pending.pop(user_id, None)
+        self._snapshots.pop(user_id, None)
+        self._synced_at.pop(user_id, None)
+        await self.backend.drop_user(user_id)
+
+    async def flush(self) -> None:
+        await self._write_pending()
+        await self.backend.close()
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def update_conversation(self, name: str, key: tuple, new_state: object) -> None:
+        return None
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        return None
+
+    async def update_bot_data(self, data: dict) -> None:
+        return None
+
+    async def update_callback_data(self, data: object) -> None:
+        return None
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        return None
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        return None
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        return None
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field
+from types import FrameType
+
+MAX_FRAMES = 64
+# Frames up to the task step belong to the event loop and are the same for every sample.
+LOOP_FRAMES = {("events.py", "_run"), ("base_events.py", "_run_once")}
+
+_current: ContextVar["Profile | None"] = ContextVar("profile", default=None)
+
+
+@dataclass(slots=True)
+class Profile:
+    handler: str
+    update_id: int | None
+    task: asyncio.Task
+    mark: float
+    mode: str | None = None
+    stack: list[str] = field(default_factory=list)
+    wall: Counter[tuple[str, ...]] = field(default_factory=Counter)
+    samples: Counter[tuple[tuple[str, ...], tuple[str, ...]]] = field(default_factory=Counter)
+    token: Token | None = None
+
+    def charge(self, now: float) -> None:
+        self.wall[tuple(self.stack)] += now - self.mark
+        self.mark = now
+
+
+class _Phase:
+    __slots__ = ("name", "profile")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.profile: Profile | None = None
+
+    def __enter__(self) -> None:
+        profile = _current.get()
+        # Tasks spawned from a sampled update inherit its context but keep their own timeline.
+        if profile is None or asyncio.current_task() is not profile.task:
+            return
+        if profile.stack and profile.stack[-1] == self.name:
+            return
+        profile.charge(time.perf_counter())
+        profile.stack.append(self.name)
+        self.profile = profile
+
+    def __exit__(self, *exc_info) -> None:
+        if self.profile is not None:
+            self.profile.charge(time.perf_counter())
+            self.profile.stack.pop()
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)})"
+
+
+def _task_stack(frame: FrameType | None) -> tuple[str, ...]:
+    frames = []
+    while frame is not None and len(frames) < MAX_FRAMES:
+        if (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in LOOP_FRAMES:
+            break
+        frames.append(_frame_name(frame))
+        frame = frame.f_back
+    return tuple(reversed(frames))
+
+
+class UpdateProfiler:
+    def __init__(self, rate: float, directory: str, interval: float = 0.005) -> None:
+        self.rate = rate
+        self.directory = directory
+        self.interval = interval
+        self.sampled = 0
+        self.written = 0
+        self.write_errors = 0
+        self._active: dict[asyncio.Task, Profile] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread: int | None = None
+        self._thread: threading.Thread | None = None
+        self._write_lock = threading.Lock()
+        self._sample_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def start(self) -> None:
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._sample_forever, name="update-profiler", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+
+    def begin(self, handler: str, update_id: int | None) -> Profile | None:
+        if not self.enabled or self._thread is None or random.random() >= self.rate:
+            return None
+        task = asyncio.current_task()
+        if task is None or task in self._active:
+            return None
+        profile = Profile(handler, update_id, task, time.perf_counter())
+        self._active[task] = profile
+        profile.token = _current.set(profile)
+        self._wake.set()
+        self.sampled += 1
+        return profile
+
+    async def finish(self, profile: Profile) -> None:
+        # Once the profile leaves _active under the lock, the sampler can no longer touch its samples.
+        with self._sample_lock:
+            self._active.pop(profile.task, None)
+        if profile.token is not None:
+            _current.reset(profile.token)
+        profile.charge(time.perf_counter())
+        try:
+            await asyncio.to_thread(self._write, profile)
+            self.written += 1
+        except OSError:
+            self.write_errors += 1
+            logging.warning("Failed to write update profile", exc_info=True)
+
+    def phase(self, name: str) -> _Phase:
+        return _Phase(name)
+
+    def note_mode(self, mode: str) -> None:
+        profile = _current.get()
+        if profile is None or profile.task not in self._active:
+            return
+        # A reading the update produces itself wins over background work it started or waits on.
+        if profile.mode is None or asyncio.current_task() is profile.task:
+            profile.mode = mode
+
+    def stats(self) -> dict:
+        return {
+            "rate": self.rate,
+            "sampled": self.sampled,
+            "written": self.written,
+            "write_errors": self.write_errors,
+            "active": len(self._active),
+        }
+
+    def summary(self, profile: Profile) -> dict:
+        phases: dict[str, dict[str, float]] = {}
+        for path, seconds in profile.wall.items():
+            entry = phases.setdefault(path[-1] if path else "other", {"wall_s": 0.0, "cpu_s": 0.0})
+            entry["wall_s"] += seconds
+        for (path, _), count in profile.samples.items():
+            entry = phases.setdefault(path[-1] if path else "other", {"wall_s": 0.0, "cpu_s": 0.0})
+            entry["cpu_s"] += count * self.interval
+        return {
+            "ts": round(time.time(), 3),
+            "handler": profile.handler,
+            "update_id": profile.update_id,
+            "mode": profile.mode,
+            "wall_s": round(sum(profile.wall.values()), 6),
+            "cpu_s": round(sum(profile.samples.values()) * self.interval, 6),
+            "samples": sum(profile.samples.values()),
+            "phases": {
+                name: {key: round(value, 6) for key, value in entry.items()}
+                for name, entry in sorted(phases.items())
+            },
+        }
+
+    def _write(self, profile: Profile) -> None:
+        with self._write_lock:
+            self._append(profile)
+
+    def _append(self, profile: Profile) -> None:
+        root = profile.handler if profile.mode is None else f"{profile.handler}/{profile.mode}"
+        pid = os.getpid()
+        # Collapsed stacks: "frame;frame;frame count". Lines from many updates add up in any flamegraph tool.
+        with open(os.path.join(self.directory, f"wall-{pid}.folded"), "a", encoding="utf-8") as output:
+            for path, seconds in profile.wall.items():
+                micros = round(seconds * 1e6)
+                if micros:
+                    output.write(f"{';'.join((root, *path))} {micros}\n")
+        if profile.samples:
+            with open(os.path.join(self.directory, f"cpu-{pid}.folded"), "a", encoding="utf-8") as output:
+                for (path, frames), count in profile.samples.items():
+                    output.write(f"{';'.join((root, *path, *frames))} {count}\n")
+        with open(os.path.join(self.directory, f"updates-{pid}.jsonl"), "a", encoding="utf-8") as output:
+            output.write(json.dumps(self.summary(profile), ensure_ascii=False) + "\n")
+
+    def _sample_forever(self) -> None:
+        while not self._stopped.is_set():
+            if not self._active:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            time.sleep(self.interval)
+            # Only time the loop spends running a sampled update's task is counted as that update's CPU.
+            profile = self._active.get(asyncio.current_task(self._loop))
+            if profile is None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            key = (tuple(profile.stack), _task_stack(frame))
+            with self._sample_lock:
+                if self._active.get(profile.task) is profile:
+                    profile.samples[key] += 1
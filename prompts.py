@@ -0,0 +1,140 @@
+import logging
+import math
+import re
+import threading
+from dataclasses import dataclass
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+FALLBACK_ENCODING = "o200k_base"
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+# Rough BPE rates for the heuristic counter: Latin words split into fewer pieces than Cyrillic ones.
+LATIN_CHARS_PER_TOKEN = 4.0
+OTHER_CHARS_PER_TOKEN = 3.0
+MESSAGE_OVERHEAD = 4
+
+
+class TokenCounter:
+    def __init__(self, model: str, use_tiktoken: bool = True) -> None:
+        self.model = model
+        self.backend = "heuristic"
+        self._encoding = None
+        self._loaded = not use_tiktoken
+        self._lock = threading.Lock()
+
+    def _load(self) -> None:
+        with self._lock:
+            if self._loaded:
+                return
+            if tiktoken is None:
+                logging.warning("tiktoken is not installed, counting tokens heuristically")
+            else:
+                try:
+                    try:
+                        self._encoding = tiktoken.encoding_for_model(self.model)
+                    except KeyError:
+                        self._encoding = tiktoken.get_encoding(FALLBACK_ENCODING)
+                    self.backend = "tiktoken"
+                except Exception as exc:
+                    logging.warning("tiktoken encoding unavailable (%s), counting tokens heuristically", exc)
+            self._loaded = True
+
+    def count(self, text: str) -> int:
+        if not self._loaded:
+            self._load()
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        total = 0
+        for word in _WORD_RE.findall(text):
+            rate = LATIN_CHARS_PER_TOKEN if word.isascii() else OTHER_CHARS_PER_TOKEN
+            total += math.ceil(len(word) / rate)
+        return total
+
+
+@dataclass(slots=True)
+class Prompt:
+    mode: str
+    system: str
+    user: str
+    max_tokens: int
+    input_tokens: int = 0
+    trimmed: int = 0
+
+    @property
+    def text(self) -> str:
+        return f"{self.system}\n\n{self.user}"
+
+    def messages(self) -> list[dict[str, str]]:
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.user},
+        ]
+
+
+def assemble(
+    mode: str,
+    system: str,
+    sections: list[tuple[str, bool]],
+    counter: TokenCounter,
+    input_budget: int,
+    max_tokens: int,
+) -> Prompt:
+    kept = [text for text, _ in sections if text]
+    base = counter.count(system) + 2 * MESSAGE_OVERHEAD
+    tokens = base + counter.count("\n".join(kept))
+    trimmed = 0
+    for text, optional in reversed(sections):
+        if tokens <= input_budget:
+            break
+        if optional and text:
+            kept.remove(text)
+            trimmed += 1
+            tokens = base + counter.count("\n".join(kept))
+    return Prompt(mode, system, "\n".join(kept), max_tokens, tokens, trimmed)
+
+
+class PromptStats:
+    FIELDS = ("input_tokens", "prompt_tokens", "completion_tokens", "cached_tokens")
+
+    def __init__(self) -> None:
+        self._modes: dict[str, dict[str, int]] = {}
+
+    def _mode(self, mode: str) -> dict[str, int]:
+        if mode not in self._modes:
+            self._modes[mode] = {"prompts": 0, "completions": 0, "trimmed": 0, **dict.fromkeys(self.FIELDS, 0)}
+        return self._modes[mode]
+
+    def record_prompt(self, prompt: Prompt) -> None:
+        entry = self._mode(prompt.mode)
+        entry["prompts"] += 1
+        entry["input_tokens"] += prompt.input_tokens
+        entry["trimmed"] += bool(prompt.trimmed)
+
+    def record_usage(self, mode: str, usage) -> None:
+        if usage is None:
+            return
+        entry = self._mode(mode)
+        entry["completions"] += 1
+        entry["prompt_tokens"] += usage.prompt_tokens or 0
+        entry["completion_tokens"] += usage.completion_tokens or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        entry["cached_tokens"] += getattr(details, "cached_tokens", None) or 0
+
+    def stats(self) -> dict:
+        result = {}
+        for mode, entry in self._modes.items():
+            prompts = entry["prompts"] or 1
+            completions = entry["completions"] or 1
+            result[mode] = {
+                "prompts": entry["prompts"],
+                "completions": entry["completions"],
+                "trimmed": entry["trimmed"],
+                "input_tokens_avg": round(entry["input_tokens"] / prompts, 1),
+                "prompt_tokens_avg": round(entry["prompt_tokens"] / completions, 1),
+                "completion_tokens_avg": round(entry["completion_tokens"] / completions, 1),
+                "cached_tokens_share": round(entry["cached_tokens"] / (entry["prompt_tokens"] or 1), 3),
+            }
+        return result
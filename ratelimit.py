@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+
+from persistence import RedisStateBackend
+
+MAX_LOCAL_KEYS = 100_000
+REDIS_TIMEOUT = 0.5
+
+# Refill and take in one round trip; the Redis clock keeps several workers on the same timeline.
+TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local floor = tonumber(ARGV[4])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens - cost < floor then
+  wait = (floor + cost - tokens) / rate
+else
+  tokens = math.min(burst, tokens - cost)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class LocalBuckets:
+    def __init__(self, rate: float, burst: float, max_keys: int = MAX_LOCAL_KEYS) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def take(self, key: str, cost: float = 1.0, floor: float = 0.0) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens - cost < floor:
+            wait = (floor + cost - tokens) / self.rate
+        else:
+            tokens = min(self.burst, tokens - cost)
+        self._buckets[key] = (tokens, now)
+        # Least recently used buckets have had the longest to refill, so dropping them is nearly free.
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class RedisBuckets:
+    def __init__(
+        self, redis: RedisStateBackend, rate: float, burst: float, name: str, timeout: float = REDIS_TIMEOUT,
+    ) -> None:
+        self.redis = redis
+        self.rate = rate
+        self.burst = burst
+        self.name = name
+        self.timeout = timeout
+
+    async def take(self, key: str, cost: float = 1.0, floor: float = 0.0) -> float:
+        async with asyncio.timeout(self.timeout):
+            (reply,) = await self.redis.execute((
+                "EVAL", TAKE_SCRIPT, "1", f"{self.redis.prefix}:ratelimit:{self.name}:{key}",
+                repr(self.rate), repr(self.burst), repr(cost), repr(floor),
+            ))
+        return float(reply)
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        user: LocalBuckets | RedisBuckets | None,
+        shared: LocalBuckets | RedisBuckets | None,
+        reserve: float,
+    ) -> None:
+        self.user = user
+        self.shared = shared
+        self.reserve = reserve
+        self.admitted = 0
+        self.throttled_user = 0
+        self.throttled_global = 0
+        self.throttled_sessions = 0
+        self.backend_errors = 0
+
+    def stats(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "throttled_user": self.throttled_user,
+            "throttled_global": self.throttled_global,
+            "throttled_sessions": self.throttled_sessions,
+            "backend_errors": self.backend_errors,
+        }
+
+    async def admit_reading(self, user_id: int) -> tuple[str | None, float]:
+        if self.user is not None:
+            wait = await self._take(self.user, str(user_id))
+            if wait:
+                self.throttled_user += 1
+                return "user", wait
+        if self.shared is not None:
+            wait = await self._take(self.shared, "all")
+            if wait:
+                if self.user is not None:
+                    # The reading is not admitted, so the user's token goes back.
+                    await self._take(self.user, str(user_id), cost=-1.0)
+                self.throttled_global += 1
+                return "global", wait
+        self.admitted += 1
+        return None, 0.0
+
+    async def admit_session(self) -> float:
+        # New sessions only look at the shared bucket and leave the reserve to users already mid-flow.
+        if self.shared is None or not self.reserve:
+            return 0.0
+        wait = await self._take(self.shared, "all", cost=0.0, floor=self.reserve)
+        if wait:
+            self.throttled_sessions += 1
+        return wait
+
+    async def _take(self, buckets: LocalBuckets | RedisBuckets, key: str, cost: float = 1.0, floor: float = 0.0) -> float:
+        try:
+            return await buckets.take(key, cost, floor)
+        except (OSError, EOFError, RuntimeError, ValueError):
+            self.backend_errors += 1
+            logging.warning("Rate limit backend failed, admitting request", exc_info=True)
+            return 0.0
+
+
+def retry_text(seconds: float) -> str:
+    if seconds < 60:
+        return f"{max(1, math.ceil(seconds))} сек."
+    return f"{math.ceil(seconds / 60)} мин."
@@ -0,0 +1,246 @@
+import asyncio
+import bisect
+import logging
+import random
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+RECENT_SIZE = 200
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class LatencyHistogram:
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self._recent: deque[float] = deque(maxlen=RECENT_SIZE)
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        self._recent.append(seconds)
+
+    def recent_percentile(self, fraction: float) -> float | None:
+        if not self._recent:
+            return None
+        ordered = sorted(self._recent)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def snapshot(self) -> dict:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip((*self.buckets, float("inf")), self.counts):
+            cumulative += count
+            buckets["+Inf" if bound == float("inf") else f"{bound:g}"] = cumulative
+        p95 = self.recent_percentile(0.95)
+        return {
+            "count": self.count,
+            "sum_s": round(self.total, 3),
+            "p50_s": round(self.recent_percentile(0.5) or 0.0, 3),
+            "p95_s": round(p95 or 0.0, 3),
+            "buckets": buckets,
+        }
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, threshold: float, min_calls: int, window: int, cooldown: float) -> None:
+        self.threshold = threshold
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.opened = 0
+        self.rejected = 0
+        self._outcomes: deque[bool] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = False
+
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+            self.state = self.HALF_OPEN
+            self._probing = False
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        self.rejected += 1
+        return False
+
+    def rejects(self) -> bool:
+        # Same answer as allow() without claiming the half-open probe, for callers that reserve it later.
+        if self.state == self.CLOSED or (
+            self.state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown
+        ):
+            return False
+        if self.state == self.HALF_OPEN and not self._probing:
+            return False
+        self.rejected += 1
+        return True
+
+    def record(self, success: bool) -> None:
+        if self.state == self.HALF_OPEN:
+            self._probing = False
+            if success:
+                logging.info("LLM circuit closed after a successful probe")
+                self.state = self.CLOSED
+                self._outcomes.clear()
+            else:
+                self._open()
+            return
+        self._outcomes.append(success)
+        if (
+            self.state == self.CLOSED
+            and len(self._outcomes) >= self.min_calls
+            and self.error_rate() >= self.threshold
+        ):
+            self._open()
+
+    def release(self) -> None:
+        # A cancelled call says nothing about the upstream; free the half-open probe without an outcome.
+        if self.state == self.HALF_OPEN:
+            self._probing = False
+
+    def _open(self) -> None:
+        logging.warning("LLM circuit opened, error rate %.0f%%", self.error_rate() * 100)
+        self.state = self.OPEN
+        self.opened += 1
+        self._opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "error_rate": round(self.error_rate(), 3),
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+class ResilientCaller:
+    def __init__(
+        self,
+        breaker: CircuitBreaker,
+        deadline: float,
+        retries: int,
+        backoff: float,
+        hedge: bool,
+        hedge_min_delay: float,
+        retry_on: tuple[type[BaseException], ...] = (Exception,),
+    ) -> None:
+        self.breaker = breaker
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.retry_on = retry_on
+        self.latency = LatencyHistogram()
+        self.attempt_latency = LatencyHistogram()
+        self.calls = 0
+        self.failures = 0
+        self.retried = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "retried": self.retried,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay_s": round(self.hedge_delay(), 3),
+            "breaker": self.breaker.stats(),
+            "latency": self.latency.snapshot(),
+            "attempt_latency": self.attempt_latency.snapshot(),
+        }
+
+    def record_outcome(self, error: BaseException | None) -> None:
+        # Only retryable errors (transport, timeouts, 429, 5xx) mean the upstream is unhealthy. A 4xx is
+        # an answer, and cancellation is the caller leaving.
+        if isinstance(error, asyncio.CancelledError):
+            self.breaker.release()
+        else:
+            self.breaker.record(not isinstance(error, self.retry_on))
+
+    def hedge_delay(self) -> float:
+        p95 = self.attempt_latency.recent_percentile(0.95)
+        return max(self.hedge_min_delay, p95 or self.hedge_min_delay)
+
+    async def call(self, factory: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        started = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                self.failures += 1
+                raise CircuitOpenError("LLM circuit is open")
+            try:
+                result = await self._attempt(factory)
+            except self.retry_on as exc:
+                self.record_outcome(exc)
+                if attempt == self.retries:
+                    self.failures += 1
+                    raise
+                self.retried += 1
+                delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+                logging.info("LLM attempt %s failed (%s), retrying in %.2fs", attempt + 1, type(exc).__name__, delay)
+                await asyncio.sleep(delay)
+                continue
+            except BaseException as exc:
+                self.record_outcome(exc)
+                self.failures += 1
+                raise
+            self.record_outcome(None)
+            self.latency.observe(time.perf_counter() - started)
+            return result
+
+    async def _attempt(self, factory: Callable[[], Awaitable[Any]]) -> Any:
+        started = time.perf_counter()
+        tasks = [asyncio.ensure_future(factory())]
+        try:
+            async with asyncio.timeout(self.deadline):
+                if self.hedge:
+                    done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay())
+                    if not done:
+                        self.hedges += 1
+                        tasks.append(asyncio.ensure_future(factory()))
+                pending = set(tasks)
+                error: BaseException | None = None
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None:
+                            if task is not tasks[0]:
+                                self.hedge_wins += 1
+                            self.attempt_latency.observe(time.perf_counter() - started)
+                            return task.result()
+                        error = task.exception()
+                raise error
+        except TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()
@@ -0,0 +1,128 @@
+from collections import Counter
+from dataclasses import dataclass
+
+from resilience import LatencyHistogram
+
+# USD per million prompt / completion tokens; LLM_PRICES overrides or extends this table.
+DEFAULT_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+}
+MIN_LATENCY_SAMPLES = 20
+PROBE_EVERY = 10
+
+
+@dataclass(frozen=True, slots=True)
+class ModelRoute:
+    model: str
+    base_url: str | None = None
+
+    @classmethod
+    def parse(cls, spec: str) -> "ModelRoute":
+        model, _, base_url = spec.strip().partition("@")
+        return cls(model.strip(), base_url.strip().rstrip("/") or None)
+
+    @property
+    def label(self) -> str:
+        return f"{self.model}@{self.base_url}" if self.base_url else self.model
+
+
+def parse_prices(spec: str) -> dict[str, tuple[float, float]]:
+    prices = {}
+    for item in spec.split(","):
+        model, _, value = item.partition("=")
+        if not value:
+            continue
+        prompt_price, _, completion_price = value.partition("/")
+        prices[model.strip()] = (float(prompt_price), float(completion_price or prompt_price))
+    return prices
+
+
+class ModelStats:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.latency = LatencyHistogram()
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        routes: dict[str, ModelRoute],
+        default: ModelRoute,
+        fallback: ModelRoute | None,
+        max_waiting: int,
+        max_p95: float,
+        prices: dict[str, tuple[float, float]] | None = None,
+    ) -> None:
+        self.routes = routes
+        self.default = default
+        self.fallback = fallback
+        self.max_waiting = max_waiting
+        self.max_p95 = max_p95
+        self.prices = {**DEFAULT_PRICES, **(prices or {})}
+        self.decisions: Counter[tuple[str, str, str]] = Counter()
+        self.models: dict[str, ModelStats] = {}
+        self._degraded = 0
+
+    def primary(self, mode: str) -> ModelRoute:
+        return self.routes.get(mode, self.default)
+
+    def choose(self, mode: str, waiting: int) -> ModelRoute:
+        route, reason = self._choose(mode, waiting)
+        self.decisions[(mode, route.label, reason)] += 1
+        return route
+
+    def _choose(self, mode: str, waiting: int) -> tuple[ModelRoute, str]:
+        primary = self.primary(mode)
+        if self.fallback is None or self.fallback == primary:
+            return primary, "mode"
+        if waiting >= self.max_waiting:
+            return self.fallback, "queue"
+        stats = self.models.get(primary.label)
+        if stats is not None and stats.latency.count >= MIN_LATENCY_SAMPLES:
+            p95 = stats.latency.recent_percentile(0.95)
+            if p95 is not None and p95 > self.max_p95:
+                # Keep a trickle of traffic on the primary so its p95 can recover.
+                self._degraded += 1
+                if self._degraded % PROBE_EVERY:
+                    return self.fallback, "latency"
+                return primary, "probe"
+        return primary, "mode"
+
+    def record(self, route: ModelRoute, seconds: float, usage) -> None:
+        stats = self.models.get(route.label)
+        if stats is None:
+            stats = self.models[route.label] = ModelStats()
+        stats.calls += 1
+        stats.latency.observe(seconds)
+        if usage is None:
+            return
+        prompt_tokens = usage.prompt_tokens or 0
+        completion_tokens = usage.completion_tokens or 0
+        stats.prompt_tokens += prompt_tokens
+        stats.completion_tokens += completion_tokens
+        prompt_price, completion_price = self.prices.get(route.model, (0.0, 0.0))
+        stats.cost += (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+
+    def stats(self) -> dict:
+        return {
+            "decisions": {
+                f"{mode}/{label}/{reason}": count for (mode, label, reason), count in self.decisions.items()
+            },
+            "models": {
+                label: {
+                    "calls": stats.calls,
+                    "p50_s": round(stats.latency.recent_percentile(0.5) or 0.0, 3),
+                    "p95_s": round(stats.latency.recent_percentile(0.95) or 0.0, 3),
+                    "prompt_tokens": stats.prompt_tokens,
+                    "completion_tokens": stats.completion_tokens,
+                    "cost_usd": round(stats.cost, 6),
+                }
+                for label, stats in self.models.items()
+            },
+        }
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+
+@dataclass(slots=True)
+class Speculation:
+    fingerprint: str
+    task: asyncio.Task
+    started: float = field(default_factory=time.monotonic)
+    expiry: asyncio.TimerHandle | None = None
+
+
+class SpeculativeTasks:
+    def __init__(self, max_pending: int, ttl: float) -> None:
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.started = 0
+        self.skipped = 0
+        self.used = 0
+        self.ready_on_use = 0
+        self.mismatched = 0
+        self.discarded = 0
+        self.cancelled_running = 0
+        self.head_start = 0.0
+        self._entries: dict[int, Speculation] = {}
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._entries),
+            "started": self.started,
+            "skipped": self.skipped,
+            "used": self.used,
+            "ready_on_use": self.ready_on_use,
+            "mismatched": self.mismatched,
+            "discarded": self.discarded,
+            "cancelled_running": self.cancelled_running,
+            "head_start_s": round(self.head_start, 1),
+        }
+
+    def start(self, key: int, fingerprint: str, factory: Callable[[], Awaitable[Any]]) -> bool:
+        self.discard(key)
+        if len(self._entries) >= self.max_pending:
+            self.skipped += 1
+            return False
+        loop = asyncio.get_running_loop()
+        entry = Speculation(fingerprint, asyncio.ensure_future(factory()))
+        entry.task.add_done_callback(_consume_exception)
+        entry.expiry = loop.call_later(self.ttl, self.discard, key)
+        self._entries[key] = entry
+        self.started += 1
+        return True
+
+    def take(self, key: int, fingerprint: str) -> asyncio.Task | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.fingerprint != fingerprint:
+            self.mismatched += 1
+            self.discard(key)
+            return None
+        self._forget(key)
+        self.used += 1
+        if entry.task.done():
+            self.ready_on_use += 1
+        self.head_start += time.monotonic() - entry.started
+        return entry.task
+
+    def discard(self, key: int) -> None:
+        entry = self._forget(key)
+        if entry is None:
+            return
+        self.discarded += 1
+        if not entry.task.done():
+            self.cancelled_running += 1
+            entry.task.cancel()
+        logging.debug("Discarded speculative reading for %s", key)
+
+    def _forget(self, key: int) -> Speculation | None:
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry.expiry is not None:
+            entry.expiry.cancel()
+        return entry
+
+
+def _consume_exception(task: asyncio.Task) -> None:
+    if not task.cancelled():
+        task.exception()
@@ -0,0 +1,115 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from ephemeris import ASPECT_ANGLES, ASPECT_ORBS, ASPECTS, BODY_NAMES, PLANETS, longitudes
+
+# Per-dimension planet pairs (first partner's body, second partner's body, weight); every pair is
+# counted in both directions.
+DIMENSIONS = {
+    "магнетизм": (("venus", "mars", 3.0), ("sun", "moon", 1.5), ("venus", "pluto", 1.5),
+                  ("mars", "pluto", 1.0), ("mars", "mars", 1.0), ("venus", "venus", 0.5)),
+    "доверие": (("moon", "saturn", 2.0), ("sun", "saturn", 1.0), ("venus", "saturn", 1.5),
+                ("sun", "moon", 1.0), ("moon", "jupiter", 1.0)),
+    "синхронность": (("sun", "sun", 2.0), ("moon", "moon", 2.0), ("sun", "moon", 2.0),
+                     ("mercury", "mercury", 1.0), ("mars", "mars", 1.0)),
+    "темп сближения": (("mars", "mars", 2.0), ("sun", "mars", 1.5), ("venus", "venus", 1.0),
+                       ("venus", "jupiter", 1.0), ("moon", "mars", 1.0)),
+    "общие ценности": (("jupiter", "sun", 1.5), ("jupiter", "jupiter", 1.0), ("saturn", "saturn", 1.0),
+                       ("venus", "jupiter", 1.5), ("sun", "sun", 1.0), ("venus", "venus", 1.0)),
+    "эмоциональная безопасность": (("moon", "moon", 2.0), ("moon", "venus", 2.0), ("moon", "jupiter", 1.5),
+                                   ("moon", "saturn", 1.0), ("moon", "pluto", 1.0)),
+    "пространство свободы": (("uranus", "venus", 1.5), ("uranus", "moon", 1.5), ("uranus", "sun", 1.0),
+                             ("saturn", "mars", 1.0), ("jupiter", "mars", 1.0)),
+    "ритм общения": (("mercury", "mercury", 2.0), ("mercury", "moon", 1.5), ("mercury", "sun", 1.5),
+                     ("mercury", "jupiter", 1.0), ("mercury", "mars", 1.0)),
+}
+# Aspect polarity per dimension: conjunction, sextile, square, trine, opposition.
+HARMONY = (0.6, 0.8, -1.0, 1.0, -0.7)
+INTENSITY = (1.0, 0.5, 0.8, 0.6, 1.0)
+POLARITY = np.array([INTENSITY if name == "магнетизм" else HARMONY for name in DIMENSIONS])
+# Median raw score of random chart pairs, so that a typical pair lands near 50.
+BASELINE = np.array([1.4 if name == "магнетизм" else 0.15 for name in DIMENSIONS])
+KEYS = tuple(DIMENSIONS)
+SCALE = 1.5
+SPREAD = 45.0
+UNCERTAIN_MOON_WEIGHT = 0.5
+MAX_CONTACTS = 2
+_COUNT = len(PLANETS)
+
+
+def _weights() -> np.ndarray:
+    weights = np.zeros((len(DIMENSIONS), _COUNT, _COUNT))
+    for dimension, pairs in enumerate(DIMENSIONS.values()):
+        for first, second, weight in pairs:
+            weights[dimension, PLANETS.index(first), PLANETS.index(second)] = weight
+            weights[dimension, PLANETS.index(second), PLANETS.index(first)] = weight
+    return weights
+
+
+WEIGHTS = _weights()
+
+
+def aspect_strength(primary: np.ndarray, partner: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    separation = np.abs(np.mod(primary[:_COUNT, None] - partner[None, :_COUNT] + 180.0, 360.0) - 180.0)
+    deviation = np.abs(separation[..., None] - ASPECT_ANGLES)
+    strength = np.clip(1.0 - deviation / ASPECT_ORBS, 0.0, None)
+    return strength, deviation
+
+
+def score_pairs(
+    primary: np.ndarray,
+    partner: np.ndarray,
+    primary_exact: np.ndarray | bool = True,
+    partner_exact: np.ndarray | bool = True,
+) -> np.ndarray:
+    separation = np.abs(np.mod(primary[:_COUNT, None] - partner[None, :_COUNT] + 180.0, 360.0) - 180.0)
+    deviation = np.abs(separation[..., None, :] - ASPECT_ANGLES[:, None])
+    strength = np.clip(1.0 - deviation / ASPECT_ORBS[:, None], 0.0, None)
+    moon = PLANETS.index("moon")
+    strength[moon] *= np.where(primary_exact, 1.0, UNCERTAIN_MOON_WEIGHT)
+    strength[:, moon] *= np.where(partner_exact, 1.0, UNCERTAIN_MOON_WEIGHT)
+    raw = np.einsum("dij,ijkn,dk->nd", WEIGHTS, strength, POLARITY, optimize=True)
+    return np.rint(50.0 + SPREAD * np.tanh((raw - BASELINE) / SCALE)).astype(int)
+
+
+@dataclass(slots=True)
+class Synastry:
+    scores: dict[str, int]
+    contacts: list[tuple[str, str, str, float]]
+
+    def ranked(self) -> list[str]:
+        return sorted(self.scores, key=lambda key: (-self.scores[key], KEYS.index(key)))
+
+    def summary(self) -> str:
+        lines = [
+            "Баллы: " + ", ".join(f"{key} {score}" for key, score in self.scores.items()),
+        ]
+        if self.contacts:
+            lines.append("Связи 1→2: " + ", ".join(
+                f"{BODY_NAMES[first]} {aspect} {BODY_NAMES[second]} {orb:.0f}°"
+                for first, aspect, second, orb in self.contacts
+            ))
+        return "\n".join(lines)
+
+
+def compare(primary: np.ndarray, partner: np.ndarray, primary_exact: bool, partner_exact: bool) -> Synastry:
+    scores = score_pairs(primary[:, None], partner[:, None], primary_exact, partner_exact)[0]
+    strength, deviation = aspect_strength(primary, partner)
+    weighted = strength * WEIGHTS.max(axis=0)[..., None]
+    contacts = []
+    for first, second, kind in np.argwhere(weighted > 0):
+        contacts.append((weighted[first, second, kind], first, second, kind))
+    contacts.sort(key=lambda item: -item[0])
+    return Synastry(
+        scores=dict(zip(KEYS, (int(score) for score in scores))),
+        contacts=[
+            (PLANETS[first], ASPECTS[kind][0], PLANETS[second], float(deviation[first, second, kind]))
+            for _, first, second, kind in contacts[:MAX_CONTACTS]
+        ],
+    )
+
+
+def synastry(days: tuple[float, float], exact: tuple[bool, bool]) -> Synastry:
+    positions = longitudes(np.asarray(days, dtype=float))
+    return compare(positions[:, 0], positions[:, 1], *exact)
@@ -0,0 +1,42 @@
+import hashlib
+from string import Formatter
+
+
+def seed_digest(seed_text: str, size: int) -> bytes:
+    return hashlib.blake2b(seed_text.encode("utf-8"), digest_size=size).digest()
+
+
+class PhraseTemplate:
+    __slots__ = ("_format", "_slots", "_digest_size")
+
+    def __init__(self, text: str, pools: dict[str, tuple[str, ...]]) -> None:
+        literals = []
+        slots = []
+        offset = 0
+        for literal, field, _, _ in Formatter().parse(text):
+            literals.append(literal.replace("{", "{{").replace("}", "}}"))
+            if field is None:
+                continue
+            literals.append("{}")
+            if field in pools:
+                pool = tuple(pools[field])
+                slots.append((field, pool, len(pool), offset))
+                offset += 2
+            else:
+                slots.append((field, None, 0, 0))
+        if offset > hashlib.blake2b.MAX_DIGEST_SIZE:
+            raise ValueError("too many pool slots in one template")
+        self._format = "".join(literals)
+        self._slots = tuple(slots)
+        self._digest_size = max(offset, 1)
+
+    def render(self, seed_text: str, context: dict[str, str]) -> str:
+        digest = seed_digest(seed_text, self._digest_size)
+        return self._format.format(
+            *[
+                context[field]
+                if pool is None
+                else pool[(digest[offset] | digest[offset + 1] << 8) % size]
+                for field, pool, size, offset in self._slots
+            ]
+        )
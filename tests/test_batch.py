@@ -0,0 +1,31 @@
+import asyncio
+import json
+
+import batch
+import main
+
+
+def _run(tmp_path, monkeypatch, reply) -> dict:
+    monkeypatch.setattr(main, "_call_openai", reply)
+    runner = batch.BatchRunner(
+        tmp_path / "records.jsonl", tmp_path / "out.jsonl", tmp_path / "out.checkpoint", concurrency=4,
+    )
+    return asyncio.run(runner.run())
+
+
+def test_failed_records_are_retried_on_resume(tmp_path, monkeypatch):
+    records = [{"id": index, "text": f"{index % 28 + 1:02d}.07.1991 14:25 Москва"} for index in range(60)]
+    (tmp_path / "records.jsonl").write_text("".join(json.dumps(record) + "\n" for record in records), encoding="utf-8")
+
+    async def broken(prompt):
+        raise RuntimeError("LLM circuit is open")
+
+    async def healthy(prompt):
+        return "расклад"
+
+    first = _run(tmp_path, monkeypatch, broken)
+    assert (first["processed"], first["failed"]) == (60, 60)
+    second = _run(tmp_path, monkeypatch, healthy)
+    assert (second["succeeded"], second["failed"], second["skipped"]) == (60, 0, 0)
+    third = _run(tmp_path, monkeypatch, healthy)
+    assert (third["processed"], third["skipped"]) == (0, 60)
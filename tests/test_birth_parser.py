@@ -0,0 +1,39 @@
+import random
+from datetime import date
+
+import pytest
+
+from bench.bench_parser import comparable, compare, extended_corpus, fuzz_inputs, legacy_corpus
+from birth_parser import parse_birth_data
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_legacy_parser(seed):
+    rng = random.Random(seed)
+    inputs = [text for text in legacy_corpus(rng, 2000) + fuzz_inputs(rng, 2000) if comparable(text)]
+    mismatches = {text: problems for text in inputs if (problems := compare(text))}
+    assert len(inputs) > 2000
+    assert not mismatches
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_extended_formats(seed):
+    for text, expected in extended_corpus(random.Random(seed), 500):
+        assert parse_birth_data(text).as_dict() == expected, text
+
+
+@pytest.mark.parametrize(
+    ("text", "time", "place", "time_mode"),
+    [
+        ("12.07.1991 Около Сочи", None, "Около Сочи", "unknown"),
+        ("12.07.1991 около 14:25 Москва", "14:25", "Москва", "exact"),
+        ("12.07.1991 около 2 pm Казань", "14:00", "Казань", "exact"),
+        ("12.07.1991 в 14:25 в Москве", "14:25", "в Москве", "exact"),
+        ("12.07.1991 Москва во 9:05", "09:05", "Москва", "exact"),
+        ("12.07.1991 вечером Москва", None, "Москва", "approx"),
+        ("12.07.1991 не знаю Тверь", None, "Тверь", "no_time"),
+    ],
+)
+def test_time_words_and_prepositions(text, time, place, time_mode):
+    parsed = parse_birth_data(text)
+    assert (parsed.date, parsed.time, parsed.place, parsed.time_mode) == (date(1991, 7, 12), time, place, time_mode)
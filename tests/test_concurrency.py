@@ -0,0 +1,67 @@
+import asyncio
+
+from concurrency import SingleFlight
+from speculation import SpeculativeTasks
+
+
+class _Request:
+    def __init__(self) -> None:
+        self.cancelled = False
+
+    async def __call__(self) -> str:
+        try:
+            await asyncio.sleep(0.2)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return "расклад"
+
+
+def test_cancelling_the_only_caller_cancels_the_request():
+    flight = SingleFlight()
+    request = _Request()
+
+    async def scenario() -> None:
+        caller = asyncio.create_task(flight.do("key", request))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.gather(caller, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert request.cancelled
+    assert flight.abandoned == 1
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_followers_keep_the_request_alive():
+    flight = SingleFlight()
+    request = _Request()
+
+    async def scenario() -> str:
+        leader = asyncio.create_task(flight.do("key", request))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flight.do("key", request))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(scenario()) == "расклад"
+    assert not request.cancelled
+    assert flight.abandoned == 0
+
+
+def test_discarded_speculation_stops_the_request():
+    flight = SingleFlight()
+    speculations = SpeculativeTasks(max_pending=4, ttl=60.0)
+    request = _Request()
+
+    async def scenario() -> None:
+        speculations.start(1, "seed", lambda: flight.do("key", request))
+        await asyncio.sleep(0.01)
+        speculations.discard(1)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    assert request.cancelled
+    assert speculations.cancelled_running == 1
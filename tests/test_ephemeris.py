@@ -0,0 +1,26 @@
+import datetime
+
+import pytest
+
+import main
+from ephemeris import birth_day_number, natal_chart
+
+
+@pytest.mark.parametrize(
+    ("text", "header"),
+    [
+        ("12.07.1991 14:25 Нижний Тагил", "часовой пояс места неизвестен"),
+        ("12.07.1991 Нижний Тагил", "время неизвестно"),
+        ("12.07.1991 Москва", "время неизвестно"),
+        ("12.07.1991 14:25 Москва", "дома Плацидус"),
+    ],
+)
+def test_chart_header_matches_what_was_known(text, header):
+    assert header in main._chart_block(main._extract_birth_data(text)).split("\n")[0]
+
+
+def test_time_without_zone_is_not_exact():
+    day = datetime.date(1991, 7, 12)
+    assert birth_day_number(day, "14:25", None)[1] is False
+    assert birth_day_number(day, "14:25", "Europe/Moscow")[1] is True
+    assert natal_chart(day, "14:25", "Europe/Moscow").timing == "utc"
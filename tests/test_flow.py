@@ -0,0 +1,128 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import main
+from bench.bench_flow import fake_update
+from history_log import HistoryWriter
+from ratelimit import RateLimiter
+
+SILENT = object()
+BIRTH = "12.07.1991 Москва"
+
+# (name, initial user_data, [(message, state afterwards, fragment of the last reply)]).
+# A fragment of None accepts any reply, SILENT expects none.
+CASES = [
+    ("no consent requested", {}, [("привет", "consent", "Нажми /start")]),
+    ("consent declined", {"consent_requested": True}, [
+        ("Не согласен", "consent", "Без согласия"),
+        ("что?", "consent", "Я жду ответ"),
+    ]),
+    ("natal, approximate time", {"consent_requested": True}, [
+        ("Согласен", "action", "Согласие получено"),
+        ("что это", "action", "Выбери вариант"),
+        ("Натальная карта", "birth_data", "Шаг 2/6"),
+        (BIRTH, "time_mode", "выбери режим времени"),
+        ("завтра", "time_mode", "кнопкой ниже"),
+        ("Примерно", "confirm", None),
+        ("Да", "profile", "Шаг 5/6"),
+        ("Да", "profile", SILENT),
+        ("Алина, карьера", "birth_data", None),
+    ]),
+    ("exact time", {"consent": True}, [
+        (BIRTH, "time_mode", "выбери режим времени"),
+        ("знаю", "exact_time", "чч:мм"),
+        ("скоро", "exact_time", "например 14:25"),
+        ("25:10", "exact_time", "в пределах суток"),
+        ("14:25", "confirm", None),
+    ]),
+    ("unknown time and correction", {"consent": True}, [
+        (BIRTH, "time_mode", None),
+        ("не знаю", "confirm", None),
+        ("нет", "birth_data", "отправь данные заново"),
+        ("12.07.1991 14:25 Москва", "confirm", None),
+        ("02.11.1993 09:10 Казань", "confirm", None),
+    ]),
+    ("missing date and place", {"consent": True}, [
+        ("Москва", "birth_data", "нужна дата"),
+        ("12.07.1991 14:25", "birth_data", "нужен город"),
+    ]),
+    ("compatibility", {"consent": True, "state": "action", "awaiting_action": True}, [
+        ("Совместимость", "birth_data", "совместимость"),
+        ("12.07.1991 14:25 Москва", "confirm", None),
+        ("Да", "birth_data", "данные партнёра"),
+        ("02.11.1993 09:10 Казань", "confirm", None),
+        ("верно", "birth_data", None),
+    ]),
+    ("shortcut out of a step", {"consent": True}, [
+        (BIRTH, "time_mode", None),
+        ("хочу совместимость", "birth_data", "совместимость"),
+        ("натальная карта v2", "birth_data", "данные рождения"),
+    ]),
+    ("natal v2 from the menu", {"consent": True, "state": "action", "awaiting_action": True}, [
+        ("Натальная v2", "birth_data", "Шаг 2/6"),
+    ]),
+    ("session saved before the state key", {"consent": True, "pending_birth_data": None}, [
+        ("примерно", "confirm", None),
+    ]),
+    ("stale state without payload", {"consent": True, "state": "profile"}, [
+        ("12.07.1991 14:25 Москва", "confirm", None),
+    ]),
+]
+
+
+@pytest.fixture(autouse=True)
+def _quiet_flow(monkeypatch, tmp_path):
+    writer = HistoryWriter(str(tmp_path / "history.log"))
+    monkeypatch.setattr(main, "_history_writer", writer)
+    monkeypatch.setattr(main, "_rate_limiter", RateLimiter(None, None, 0))
+    monkeypatch.setattr(main._recent_confirmations, "window", 60)
+    yield
+    writer.close()
+
+
+def test_every_state_has_a_default_transition():
+    states = {state for state, _ in main.FLOW_TRANSITIONS}
+    assert [state for state in states if (state, None) not in main.FLOW_TRANSITIONS] == []
+
+
+def test_every_intent_has_a_transition():
+    missing = [
+        (state, intent)
+        for state, intents in main.STATE_INTENTS.items()
+        for intent in set(intents.values())
+        if (state, intent) not in main.FLOW_TRANSITIONS
+    ]
+    assert missing == []
+
+
+def test_every_payload_state_is_dispatched():
+    states = {state for state, _ in main.FLOW_TRANSITIONS}
+    assert [state for state in main.STATE_PAYLOADS if state not in states] == []
+
+
+@pytest.mark.parametrize(
+    ("chat_id", "initial", "steps"),
+    [(chat_id, initial, steps) for chat_id, (_, initial, steps) in enumerate(CASES, start=1)],
+    ids=[name for name, _, _ in CASES],
+)
+def test_scripted_dialogue(chat_id, initial, steps):
+    user_data = dict(initial)
+    if "pending_birth_data" in user_data:
+        user_data["pending_birth_data"] = main._extract_birth_data(BIRTH)
+    context = SimpleNamespace(user_data=user_data)
+
+    async def scenario() -> None:
+        for text, expected_state, fragment in steps:
+            replies: list[str] = []
+            await main.handle_message(fake_update(chat_id, text, replies), context)
+            assert main._flow_state(user_data) == expected_state, f"after {text!r}"
+            if fragment is SILENT:
+                assert not replies, f"after {text!r}"
+                continue
+            assert replies, f"no reply after {text!r}"
+            if fragment is not None:
+                assert fragment.lower() in replies[-1].lower(), f"after {text!r}"
+
+    asyncio.run(scenario())
@@ -0,0 +1,44 @@
+import pytest
+
+from gazetteer import Gazetteer
+
+GAZETTEER = Gazetteer()
+
+
+@pytest.mark.parametrize(
+    ("query", "label"),
+    [
+        ("г. Москва", "Москва, Россия"),
+        ("москва,", "Москва, Россия"),
+        ("Moscow, Russia", "Москва, Россия"),
+        ("Paris, France", "Париж, Франция"),
+        ("Алма-Ата", "Алматы, Казахстан"),
+    ],
+)
+def test_confident_matches(query, label):
+    assert GAZETTEER.lookup(query).label == label
+
+
+@pytest.mark.parametrize(
+    ("query", "suggestion"),
+    [
+        ("Нижний Тагил", "Нижний Новгород, Россия"),
+        ("Paris, Texas", "Париж, Франция"),
+        ("Масква", "Москва, Россия"),
+        ("Екатеринбур", "Екатеринбург, Россия"),
+        ("Лос", "Лос-Анджелес, США"),
+        ("Ростов", "Ростов-на-Дону, Россия"),
+    ],
+)
+def test_fuzzy_hits_are_only_suggested(query, suggestion):
+    assert GAZETTEER.lookup(query) is None
+    assert GAZETTEER.suggest(query).label == suggestion
+
+
+def test_fuzzy_place_keeps_raw_text_without_coordinates():
+    import main
+
+    data = main._extract_birth_data("12.07.1991 14:25 Нижний Тагил")
+    assert data["place"] == "Нижний Тагил"
+    assert "tz" not in data and "lat" not in data
+    assert "Нижний Новгород" in main._build_confirmation(data)
@@ -0,0 +1,10 @@
+import main
+
+
+def test_rebuilt_application_reports_its_own_queue():
+    main._build_application("123:test")
+    app = main._build_application("123:test")
+    app.update_queue.put_nowait(object())
+    lines = main._metrics.render().splitlines()
+    assert "bot_update_queue 1" in lines
+    assert sum(line.startswith("# TYPE bot_update_queue ") for line in lines) == 1
@@ -0,0 +1,79 @@
+import asyncio
+import time
+from datetime import date
+
+from bench.fake_redis import FakeRedis
+from persistence import RedisStateBackend, StatePersistence
+
+FLOW_KEYS = ("pending_data", "pending_profile")
+
+
+def _run(scenario) -> None:
+    async def main() -> None:
+        fake = FakeRedis(password="secret")
+        await fake.start()
+        try:
+            await scenario(fake)
+        finally:
+            await fake.stop()
+
+    asyncio.run(main())
+
+
+def test_redis_round_trip():
+    async def scenario(fake: FakeRedis) -> None:
+        persistence = StatePersistence(RedisStateBackend(fake.url), expiring_keys=FLOW_KEYS, expire_after=3600)
+        pending = {"date": date(1991, 7, 12), "time": "14:25", "place": "Москва"}
+        await persistence.update_user_data(42, {"consent": True, "pending_data": pending})
+        await persistence.update_user_data(7, {"consent": False})
+        await persistence.update_user_data(42, {"consent": True})
+        await persistence.flush()
+
+        restored = await StatePersistence(RedisStateBackend(fake.url), expiring_keys=FLOW_KEYS).get_user_data()
+        assert restored == {42: {"consent": True}, 7: {"consent": False}}
+        assert ("AUTH", "secret") in fake.commands
+
+    _run(scenario)
+
+
+def test_redis_date_values_survive():
+    async def scenario(fake: FakeRedis) -> None:
+        persistence = StatePersistence(RedisStateBackend(fake.url))
+        pending = {"date": date(1991, 7, 12), "partner": {"date": date(1993, 11, 2)}}
+        await persistence.update_user_data(1, {"pending_data": pending})
+        await persistence.flush()
+        restored = await StatePersistence(RedisStateBackend(fake.url)).get_user_data()
+        assert restored[1]["pending_data"] == pending
+
+    _run(scenario)
+
+
+def test_redis_purge_drops_only_stale_flow_fields():
+    async def scenario(fake: FakeRedis) -> None:
+        backend = RedisStateBackend(fake.url)
+        now = time.time()
+        for user_id in range(1200):
+            await backend.write({user_id: ({"consent": "true", "pending_data": "{}"}, set())}, now - 7200)
+        await backend.write({5: ({"pending_data": "{}"}, set())}, now)
+
+        await backend.purge_expired(FLOW_KEYS, now - 3600)
+
+        remaining = await backend.load_all()
+        assert len(remaining) == 1200
+        assert all("consent" in fields for fields in remaining.values())
+        assert [user_id for user_id, fields in remaining.items() if "pending_data" in fields] == [5]
+        await backend.close()
+
+    _run(scenario)
+
+
+def test_persistence_purges_abandoned_flows_on_write():
+    async def scenario(fake: FakeRedis) -> None:
+        backend = RedisStateBackend(fake.url)
+        await backend.write({9: ({"consent": "true", "pending_profile": "{}"}, set())}, time.time() - 7200)
+        persistence = StatePersistence(backend, expiring_keys=FLOW_KEYS, expire_after=3600)
+        await persistence.update_user_data(10, {"consent": True})
+        assert set(fake.hash("elaidji:user:9")) == {"consent"}
+        await persistence.flush()
+
+    _run(scenario)
@@ -0,0 +1,38 @@
+import asyncio
+import json
+import time
+
+from profiler import UpdateProfiler
+
+
+def _spin(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_samples_stop_once_the_update_is_finished(tmp_path):
+    async def scenario() -> None:
+        profiler = UpdateProfiler(1.0, str(tmp_path), interval=0.0005)
+        profiler.start()
+
+        async def update(index: int) -> int:
+            profile = profiler.begin("message", index)
+            with profiler.phase("work"):
+                _spin(0.01)
+            await profiler.finish(profile)
+            frozen = sum(profile.samples.values())
+            # Other updates keep the sampler busy while this one's profile is already written.
+            await asyncio.sleep(0.02)
+            assert sum(profile.samples.values()) == frozen
+            return frozen
+
+        try:
+            counts = await asyncio.gather(*(update(index) for index in range(20)))
+        finally:
+            await profiler.stop()
+        assert profiler.written == 20 and profiler.write_errors == 0
+        lines = (tmp_path / next(p.name for p in tmp_path.iterdir() if p.name.startswith("updates-"))).read_text()
+        assert sorted(json.loads(line)["samples"] for line in lines.splitlines()) == sorted(counts)
+
+    asyncio.run(scenario())
@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+from bench.fake_redis import FakeRedis
+from persistence import RedisStateBackend
+from ratelimit import LocalBuckets, RateLimiter, RedisBuckets
+
+
+def test_global_rejection_refunds_the_user_token():
+    async def scenario() -> None:
+        limiter = RateLimiter(LocalBuckets(0.001, 2), LocalBuckets(0.001, 1), 0)
+        assert await limiter.admit_reading(1) == (None, 0.0)
+        for _ in range(3):
+            assert (await limiter.admit_reading(2))[0] == "global"
+        limiter.shared = None
+        assert (await limiter.admit_reading(2))[0] is None
+        assert (await limiter.admit_reading(2))[0] is None
+        assert (await limiter.admit_reading(2))[0] == "user"
+
+    asyncio.run(scenario())
+
+
+def test_redis_buckets_refund_and_share_state():
+    async def scenario() -> None:
+        fake = FakeRedis()
+        await fake.start()
+        redis = RedisStateBackend(fake.url)
+        try:
+            limiter = RateLimiter(RedisBuckets(redis, 0.001, 1, "user"), RedisBuckets(redis, 0.001, 1, "global"), 0)
+            assert (await limiter.admit_reading(1))[0] is None
+            assert (await limiter.admit_reading(2))[0] == "global"
+            assert float(fake.hash("elaidji:ratelimit:user:2")["tokens"]) == 1.0
+            assert (await limiter.admit_reading(1))[0] == "user"
+        finally:
+            await redis.close()
+            await fake.stop()
+
+    asyncio.run(scenario())
+
+
+def test_stalled_redis_admits_after_the_timeout():
+    async def scenario() -> None:
+        async def stall(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            await reader.read()
+            writer.close()
+
+        server = await asyncio.start_server(stall, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        redis = RedisStateBackend(f"redis://127.0.0.1:{port}/0")
+        limiter = RateLimiter(RedisBuckets(redis, 0.001, 1, "user", timeout=0.1), None, 0)
+        try:
+            started = time.perf_counter()
+            assert await limiter.admit_reading(1) == (None, 0.0)
+            assert time.perf_counter() - started < 1.0
+            assert limiter.backend_errors == 1
+            assert redis._writer is None
+        finally:
+            await redis.close()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(scenario())
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from resilience import CircuitBreaker, ResilientCaller
+
+
+def _caller() -> ResilientCaller:
+    breaker = CircuitBreaker(threshold=0.5, min_calls=2, window=10, cooldown=60.0)
+    return ResilientCaller(breaker, deadline=1.0, retries=0, backoff=0.0, hedge=False, hedge_min_delay=0.1,
+                           retry_on=(TimeoutError, ConnectionError))
+
+
+def _fail(error: BaseException):
+    async def call():
+        raise error
+
+    return call
+
+
+def test_client_errors_do_not_open_the_circuit():
+    caller = _caller()
+
+    async def scenario() -> None:
+        for _ in range(5):
+            with pytest.raises(ValueError):
+                await caller.call(_fail(ValueError("400 bad request")))
+
+    asyncio.run(scenario())
+    assert caller.breaker.state == CircuitBreaker.CLOSED
+    assert caller.failures == 5
+
+
+def test_transport_errors_open_the_circuit():
+    caller = _caller()
+
+    async def scenario() -> None:
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                await caller.call(_fail(ConnectionError("refused")))
+
+    asyncio.run(scenario())
+    assert caller.breaker.state == CircuitBreaker.OPEN
+
+
+def test_cancellation_releases_the_probe_without_an_outcome():
+    caller = _caller()
+    caller.breaker.cooldown = 0.0
+    caller.breaker.record(False)
+    caller.breaker.record(False)
+
+    async def scenario() -> None:
+        task = asyncio.create_task(caller.call(lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert caller.breaker.state == CircuitBreaker.HALF_OPEN
+    assert list(caller.breaker._outcomes).count(False) == 2
+    assert caller.breaker.allow()
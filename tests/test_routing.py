@@ -0,0 +1,35 @@
+import asyncio
+
+import main
+from bench.fake_openai import FakeOpenAI
+from llm_cache import ReadingCache
+from router import ModelRoute, ModelRouter
+
+
+def _readings(monkeypatch, max_waiting: int) -> tuple[str, str | None]:
+    async def scenario() -> tuple[str, str | None]:
+        fake = FakeOpenAI(words=20)
+        await fake.start()
+        monkeypatch.setattr(main, "_openai_client", main.AsyncOpenAI(api_key="test", base_url=fake.base_url))
+        try:
+            prompt = main._build_prompt(main._extract_birth_data("12.07.1991 14:25 Москва"))
+            content = await main._call_openai(prompt)
+            return content, await main._reading_cache.get(main._prompt_key(prompt))
+        finally:
+            await main._openai_client.close()
+            await fake.stop()
+
+    router = ModelRouter({}, ModelRoute("primary"), ModelRoute("cheap"), max_waiting=max_waiting, max_p95=60.0)
+    monkeypatch.setattr(main, "_router", router)
+    monkeypatch.setattr(main, "_reading_cache", ReadingCache())
+    return asyncio.run(scenario())
+
+
+def test_fallback_model_readings_are_not_cached(monkeypatch):
+    content, cached = _readings(monkeypatch, max_waiting=0)
+    assert content and cached is None
+
+
+def test_primary_model_readings_are_cached(monkeypatch):
+    content, cached = _readings(monkeypatch, max_waiting=100)
+    assert cached == content
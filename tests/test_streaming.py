@@ -0,0 +1,80 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import main
+from bench.fake_openai import FakeOpenAI
+from llm_cache import ReadingCache
+from resilience import CircuitBreaker
+
+
+class _Message:
+    def __init__(self) -> None:
+        self.texts: list[str] = []
+
+    async def reply_text(self, text: str, **kwargs) -> "_Message":
+        self.texts.append(text)
+        return self
+
+    async def edit_text(self, text: str, **kwargs) -> "_Message":
+        self.texts.append(text)
+        return self
+
+
+@pytest.fixture
+def breaker(monkeypatch) -> CircuitBreaker:
+    breaker = CircuitBreaker(0.5, 1, 10, cooldown=0.0)
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    monkeypatch.setattr(main._llm, "breaker", breaker)
+    monkeypatch.setattr(main, "_reading_cache", ReadingCache(max_entries=0))
+    return breaker
+
+
+def _stream(fake: FakeOpenAI, message: _Message, monkeypatch) -> asyncio.Task:
+    monkeypatch.setattr(main, "_openai_client", main.AsyncOpenAI(api_key="test", base_url=fake.base_url))
+    prompt = main._build_prompt(main._extract_birth_data("12.07.1991 14:25 Москва"))
+
+    async def fallback() -> str:
+        return "офлайн"
+
+    return asyncio.create_task(main._stream_reading(SimpleNamespace(message=message), prompt, fallback))
+
+
+def test_cancelled_probe_releases_the_breaker(breaker, monkeypatch):
+    async def scenario() -> None:
+        fake = FakeOpenAI(latency=1.0)
+        await fake.start()
+        try:
+            task = _stream(fake, _Message(), monkeypatch)
+            await asyncio.sleep(0.2)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            assert breaker.state == CircuitBreaker.HALF_OPEN
+            assert breaker.allow()
+        finally:
+            await main._openai_client.close()
+            await fake.stop()
+
+    asyncio.run(scenario())
+
+
+def test_rejected_reading_leaves_the_probe_unclaimed(breaker, monkeypatch):
+    async def scenario() -> None:
+        fake = FakeOpenAI(words=20)
+        await fake.start()
+        breaker.cooldown = 60.0
+        message = _Message()
+        try:
+            await _stream(fake, message, monkeypatch)
+            assert message.texts == ["офлайн"]
+            assert breaker.rejected == 1
+            breaker.cooldown = 0.0
+            await _stream(fake, _Message(), monkeypatch)
+            assert breaker.state == CircuitBreaker.CLOSED
+        finally:
+            await main._openai_client.close()
+            await fake.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,135 @@
+import datetime
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+
+from ephemeris import ASPECTS, BODIES, BODY_NAMES, Chart, day_number, longitudes
+
+TRANSIT_BODIES = ("jupiter", "saturn", "uranus", "neptune", "pluto")
+TRANSIT_ORBS = np.array([2.0, 1.5, 1.0, 1.0, 1.0], dtype=np.float32)
+BODY_WEIGHTS = np.array([1.0, 1.3, 1.2, 1.1, 1.4])
+NATAL_TARGETS = ("sun", "moon", "mercury", "venus", "mars", "jupiter", "saturn")
+TARGET_NAMES = {**BODY_NAMES, "asc": "Асцендент", "mc": "MC"}
+TARGET_WEIGHTS = {
+    "sun": 1.5, "moon": 1.3, "mercury": 0.8, "venus": 1.1, "mars": 1.0,
+    "jupiter": 0.7, "saturn": 0.8, "asc": 1.4, "mc": 1.4,
+}
+# Each aspect is hit from both sides, so the 8 target offsets map back onto the 5 aspects.
+OFFSETS = np.array([0.0, 60.0, -60.0, 90.0, -90.0, 120.0, -120.0, 180.0], dtype=np.float32)
+OFFSET_ASPECTS = np.array([0, 1, 1, 2, 2, 3, 3, 4])
+ASPECT_WEIGHTS = np.array([1.3, 0.7, 1.1, 1.0, 1.1])
+SUPPORTIVE_ASPECTS = {1, 3}
+HORIZON_DAYS = 365
+HORIZONS = ((92, "ближайшие 3 месяца"), (183, "3–6 месяцев"), (HORIZON_DAYS + 1, "6–12 месяцев"))
+MAX_WINDOWS = 6
+
+
+class TransitTable:
+    def __init__(self, start: datetime.date, days: int = HORIZON_DAYS) -> None:
+        self.start = start
+        self.days = days
+        first = day_number(datetime.datetime(start.year, start.month, start.day))
+        values = longitudes(first + np.arange(days + 1, dtype=float))
+        self.positions = values[[BODIES.index(body) for body in TRANSIT_BODIES]].astype(np.float32)
+
+    def date_at(self, index: int) -> datetime.date:
+        return self.start + datetime.timedelta(days=int(index))
+
+
+_table: TransitTable | None = None
+_table_lock = threading.Lock()
+
+
+def table_for(day: datetime.date) -> TransitTable:
+    global _table
+    table = _table
+    if table is not None and table.start == day:
+        return table
+    with _table_lock:
+        if _table is None or _table.start != day:
+            _table = TransitTable(day)
+        return _table
+
+
+@dataclass(slots=True)
+class TransitWindow:
+    body: str
+    target: str
+    aspect: int
+    start: datetime.date
+    end: datetime.date
+    exact: datetime.date | None
+    weight: float
+
+    @property
+    def supportive(self) -> bool:
+        return self.aspect in SUPPORTIVE_ASPECTS or (self.aspect == 0 and self.body == "jupiter")
+
+    def describe(self) -> str:
+        period = f"{self.start:%d.%m.%Y}–{self.end:%d.%m.%Y}"
+        exact = f", пик {self.exact:%d.%m}" if self.exact else ""
+        tone = "поддержка" if self.supportive else "напряжение и перестройка"
+        return (
+            f"{period}: {BODY_NAMES[self.body]} {ASPECTS[self.aspect][0]} "
+            f"{TARGET_NAMES[self.target]}{exact} — {tone}"
+        )
+
+
+def natal_points(chart: Chart) -> dict[str, float]:
+    points = {
+        target: chart.position(target)
+        for target in NATAL_TARGETS
+        if target != "moon" or chart.cusps is not None
+    }
+    if chart.cusps is not None:
+        points["asc"] = float(chart.cusps[0])
+        points["mc"] = float(chart.cusps[9])
+    return points
+
+
+def find_windows(table: TransitTable, points: dict[str, float], limit: int = MAX_WINDOWS) -> list[TransitWindow]:
+    targets = list(points)
+    natal = np.array([points[target] for target in targets], dtype=np.float32)
+    aims = natal[:, None] + OFFSETS
+    diff = table.positions[:, None, None, :] - aims[None, :, :, None]
+    diff -= 360.0 * np.rint(diff / 360.0)
+    inside = np.abs(diff) <= TRANSIT_ORBS[:, None, None, None]
+    edges = np.diff(np.pad(inside, ((0, 0), (0, 0), (0, 0), (1, 1))).astype(np.int8), axis=-1)
+    starts = np.unravel_index(np.flatnonzero(edges == 1), edges.shape)
+    ends = np.unravel_index(np.flatnonzero(edges == -1), edges.shape)[-1]
+    crossing = np.signbit(diff[..., :-1]) != np.signbit(diff[..., 1:])
+    windows = []
+    for body, target, offset, start, end in zip(*starts, ends):
+        aspect = int(OFFSET_ASPECTS[offset])
+        hits = np.flatnonzero(crossing[body, target, offset, start:max(start, end - 1)])
+        exact = table.date_at(start + hits[0] + 1) if hits.size else None
+        weight = BODY_WEIGHTS[body] * TARGET_WEIGHTS[targets[target]] * ASPECT_WEIGHTS[aspect]
+        windows.append(TransitWindow(
+            body=TRANSIT_BODIES[body],
+            target=targets[target],
+            aspect=aspect,
+            start=table.date_at(start),
+            end=table.date_at(end - 1),
+            exact=exact,
+            weight=float(weight) * (1.0 if hits.size else 0.6),
+        ))
+    windows.sort(key=lambda window: -window.weight)
+    return sorted(windows[:limit], key=lambda window: window.start)
+
+
+def transit_windows(chart: Chart, today: datetime.date, limit: int = MAX_WINDOWS) -> list[TransitWindow]:
+    return find_windows(table_for(today), natal_points(chart), limit)
+
+
+def format_windows(windows: list[TransitWindow], today: datetime.date, bullet: str = "•") -> str:
+    lines = []
+    remaining = list(windows)
+    for days, label in HORIZONS:
+        limit = today + datetime.timedelta(days=days)
+        group = [window for window in remaining if window.start < limit]
+        remaining = [window for window in remaining if window.start >= limit]
+        if group:
+            lines.append(f"{label.capitalize()}:")
+            lines.extend(f"{bullet} {window.describe()}" for window in group)
+    return "\n".join(lines)